@@ -1,20 +1,31 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+from charts import chart, render_charts, print_timings
 from db_manager import DBManager
+from rollups import rollup_frame, load_rollup, means
 from config import OUTPUT
 
 
-def main():
-    db = DBManager()
-    df = db.load_clean_data()
-    
-    if df.empty:
-        print("Нет данных!")
-        return
+COLUMNS = ["city", "date", "pm25", "pm10", "no2", "so2", "o3"]
+# При готовой сводной таблице дневные данные не нужны
+STATS_COLUMNS = []
+
+
+def load_stats(db):
+    """Сводная таблица по (город, месяц) из MongoDB; None — она отсутствует или устарела"""
+    rollup = load_rollup(db)
+    return None if rollup is None else {"rollup": rollup}
+
+
+def run(df, rollup=None):
+    """
+    Рейтинг городов и интегральный индекс загрязнения.
+    rollup — сводная таблица по (город, месяц), иначе строится по df
+    """
+    if rollup is None:
+        rollup = rollup_frame(df)
     
     city_stats = (
-        df.groupby("city")[["pm25", "pm10", "no2", "so2", "o3"]]
-        .mean()
+        means(rollup, "city")[["pm25", "pm10", "no2", "so2", "o3"]]
         .sort_values("pm25", ascending=False)
     )
     
@@ -39,29 +50,35 @@ def main():
     print(norm_sorted["pollution_index"])
     
     # Визуализации
-    def save_bar(data, title, filename):
-        plt.figure(figsize=(12, 6))
-        data.plot(kind="bar")
-        plt.title(title)
-        plt.ylabel("Уровень загрязнения (мкг/м³)")
-        plt.tight_layout()
-        plt.savefig(OUTPUT / filename)
-        plt.close()
+    def bar(data, title, filename, ylabel="Уровень загрязнения (мкг/м³)"):
+        return chart("bar", filename, data, title=title, ylabel=ylabel, figsize=(12, 6))
     
-    save_bar(city_stats["pm25"], "Средний PM2.5 по городам (2023–2025)", "pm25_by_city.png")
-    save_bar(city_stats["pm10"], "Средний PM10 по городам (2023–2025)", "pm10_by_city.png")
-    save_bar(city_stats["no2"], "NO₂ по городам", "no2_by_city.png")
-    
-    # Интегральный индекс
-    plt.figure(figsize=(12, 6))
-    norm_sorted["pollution_index"].plot(kind="bar")
-    plt.title("Интегральный индекс загрязнения по городам (0–1)")
-    plt.ylabel("Индекс загрязнения")
-    plt.tight_layout()
-    plt.savefig(OUTPUT / "pollution_index.png")
-    plt.close()
+    timings = render_charts([
+        bar(city_stats["pm25"], "Средний PM2.5 по городам (2023–2025)", "pm25_by_city.png"),
+        bar(city_stats["pm10"], "Средний PM10 по городам (2023–2025)", "pm10_by_city.png"),
+        bar(city_stats["no2"], "NO₂ по городам", "no2_by_city.png"),
+        bar(norm_sorted["pollution_index"], "Интегральный индекс загрязнения по городам (0–1)",
+            "pollution_index.png", ylabel="Индекс загрязнения"),
+    ])
+    print_timings(timings)
     
     print(f"\n✔ Графики сохранены в {OUTPUT}")
+
+
+def main():
+    db = DBManager()
+    
+    # Средние из сводной таблицы MongoDB; дневные данные нужны, только если её нет
+    df = None
+    stats = load_stats(db)
+    if stats is None:
+        print("Сводная таблица отсутствует или устарела — расчёт по всем данным")
+        df = db.load_clean_data(columns=COLUMNS)
+        if df.empty:
+            print("Нет данных!")
+            return
+    
+    run(df, **(stats or {}))
     
     db.close()
 
@@ -1,52 +1,62 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from charts import chart, scatter_chart, render_charts, print_timings
+from correlation_stats import load_correlation
 from db_manager import DBManager
-from config import OUTPUT
+from config import OUTPUT, CORRELATION_PARAMS
 
 
-def main():
-    db = DBManager()
-    df = db.load_clean_data()
-    
-    if df.empty:
-        print("Нет данных!")
-        return
-    
-    params = ["pm25", "pm10", "no2", "so2", "o3", "uv", "nh3", "dust", "co"]
-    params = [p for p in params if p in df.columns]
+COLUMNS = CORRELATION_PARAMS
+# При готовой матрице дневные данные нужны только диаграммам рассеяния
+STATS_COLUMNS = ["pm25", "pm10", "o3"]
+
+
+def load_stats(db):
+    """Матрица из сумм по (город, месяц) в MongoDB; None — статистики отсутствуют или устарели"""
+    corr = load_correlation(db)
+    return None if corr is None else {"corr": corr}
+
+
+def run(df, corr=None):
+    """
+    Корреляции между загрязнителями. corr — готовая матрица
+    (из накопленных статистик), иначе считается по df
+    """
+    if corr is None:
+        params = [p for p in COLUMNS if p in df.columns]
+        corr = df[params].corr()
     
-    corr = df[params].corr()
     print("\n=== Корреляционная матрица ===")
     print(corr)
     
-    # Тепловая карта
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(corr, annot=True, cmap="coolwarm", fmt=".2f")
-    plt.title("Корреляционная матрица загрязнений")
-    plt.tight_layout()
-    plt.savefig(OUTPUT / "correlation_heatmap.png")
-    plt.close()
+    # Тепловая карта и диаграммы рассеяния; при большом числе строк
+    # точки прореживаются или заменяются плотностью (SCATTER_LARGE_MODE)
+    timings = render_charts([
+        chart("heatmap", "correlation_heatmap.png", corr, title="Корреляционная матрица загрязнений",
+              figsize=(10, 8), annot=True, cmap="coolwarm", fmt=".2f"),
+        scatter_chart("pm25_vs_pm10.png", df, "pm25", "pm10", title="PM2.5 vs PM10",
+                      figsize=(7, 5), grid=True, alpha=0.2),
+        scatter_chart("pm25_vs_o3.png", df, "pm25", "o3", title="PM2.5 vs O₃",
+                      figsize=(7, 5), grid=True, alpha=0.2),
+    ])
+    print_timings(timings)
     
-    # PM2.5 vs PM10
-    plt.figure(figsize=(7, 5))
-    sns.scatterplot(data=df, x="pm25", y="pm10", alpha=0.2)
-    plt.title("PM2.5 vs PM10")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(OUTPUT / "pm25_vs_pm10.png")
-    plt.close()
+    print(f"\n✔ Графики сохранены в {OUTPUT}")
+
+
+def main():
+    db = DBManager()
     
-    # PM2.5 vs O₃
-    plt.figure(figsize=(7, 5))
-    sns.scatterplot(data=df, x="pm25", y="o3", alpha=0.2)
-    plt.title("PM2.5 vs O₃")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(OUTPUT / "pm25_vs_o3.png")
-    plt.close()
+    # Матрица из сумм по (город, месяц) в MongoDB, без пересчёта по всей истории
+    stats = load_stats(db)
+    if stats is None:
+        print("Статистики корреляций отсутствуют или устарели — расчёт по всем данным")
     
-    print(f"\n✔ Графики сохранены в {OUTPUT}")
+    df = db.load_clean_data(columns=STATS_COLUMNS if stats else COLUMNS)
+    if df.empty:
+        print("Нет данных!")
+        return
+    
+    run(df, **(stats or {}))
     
     db.close()
 
@@ -1,17 +1,26 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+from charts import chart, render_charts, print_timings
 from db_manager import DBManager
+from rollups import rollup_frame, load_rollup, means
 from config import OUTPUT
 
 
-def main():
-    db = DBManager()
-    df = db.load_clean_data()
-    
-    if df.empty:
-        print("Нет данных! Сначала запустите fetch_data.py")
-        return
-    
+COLUMNS = ["city", "date", "pm25", "pm10", "no2", "so2", "o3"]
+# При готовой сводной таблице дата не нужна: она только для расчёта средних по df
+STATS_COLUMNS = ["city", "pm25", "pm10", "no2", "so2", "o3"]
+
+
+def load_stats(db):
+    """Сводная таблица по (город, месяц) из MongoDB; None — она отсутствует или устарела"""
+    rollup = load_rollup(db)
+    return None if rollup is None else {"rollup": rollup}
+
+
+def run(df, rollup=None):
+    """
+    Обзор очищенных данных и графики.
+    rollup — сводная таблица по (город, месяц) для средних по городам, иначе строится по df
+    """
     print(f"Всего строк: {len(df)}")
     print(f"Городов: {df['city'].nunique()}")
     print(f"Города: {df['city'].unique()}\n")
@@ -21,9 +30,10 @@ def main():
     print(df[["pm25", "pm10", "no2", "so2", "o3"]].describe())
     
     # Средний уровень по городам
+    if rollup is None:
+        rollup = rollup_frame(df)
     city_avg = (
-        df.groupby("city")[["pm25", "pm10", "no2", "so2", "o3"]]
-        .mean()
+        means(rollup, "city")[["pm25", "pm10", "no2", "so2", "o3"]]
         .sort_values("pm25", ascending=False)
     )
     
@@ -31,28 +41,29 @@ def main():
     print(city_avg)
     
     # === Визуализации ===
-    
-    # 1. Распределение PM2.5
-    plt.figure(figsize=(8, 5))
-    df["pm25"].hist(bins=40)
-    plt.title("Распределение PM2.5")
-    plt.xlabel("PM2.5 (мкг/м³)")
-    plt.ylabel("Частота")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(OUTPUT / "pm25_distribution.png")
-    plt.close()
-    
-    # 2. Средний PM2.5 по городам
-    plt.figure(figsize=(12, 6))
-    city_avg["pm25"].plot(kind="bar")
-    plt.title("Средний уровень PM2.5 по городам (2023–2025)")
-    plt.ylabel("PM2.5 (мкг/м³)")
-    plt.tight_layout()
-    plt.savefig(OUTPUT / "pm25_city_average.png")
-    plt.close()
+    timings = render_charts([
+        # 1. Распределение PM2.5
+        chart("hist", "pm25_distribution.png", df["pm25"], title="Распределение PM2.5",
+              xlabel="PM2.5 (мкг/м³)", ylabel="Частота", grid=True, bins=40),
+        # 2. Средний PM2.5 по городам
+        chart("bar", "pm25_city_average.png", city_avg["pm25"], title="Средний уровень PM2.5 по городам (2023–2025)",
+              ylabel="PM2.5 (мкг/м³)", figsize=(12, 6)),
+    ])
+    print_timings(timings)
     
     print(f"\n✔ Графики сохранены в {OUTPUT}")
+
+
+def main():
+    db = DBManager()
+    stats = load_stats(db)
+    df = db.load_clean_data(columns=STATS_COLUMNS if stats else COLUMNS)
+    
+    if df.empty:
+        print("Нет данных! Сначала запустите fetch_data.py")
+        return
+    
+    run(df, **(stats or {}))
     
     db.close()
 
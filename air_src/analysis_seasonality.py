@@ -1,62 +1,73 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from charts import chart, render_charts, print_timings
 from db_manager import DBManager
+from rollups import rollup_frame, load_rollup, means
 from config import OUTPUT
 
 
-def main():
-    db = DBManager()
-    df = db.load_clean_data()
-    
-    if df.empty:
-        print("Нет данных!")
-        return
-    
-    df["month"] = pd.to_datetime(df["date"]).dt.month
-    df["year"] = pd.to_datetime(df["date"]).dt.year
+COLUMNS = ["city", "date", "pm25", "pm10", "no2", "so2", "o3"]
+# При готовой сводной таблице дневные данные не нужны
+STATS_COLUMNS = []
+
+
+def load_stats(db):
+    """Сводная таблица по (город, месяц) из MongoDB; None — она отсутствует или устарела"""
+    rollup = load_rollup(db)
+    return None if rollup is None else {"rollup": rollup}
+
+
+def run(df, rollup=None):
+    """
+    Сезонность загрязнения по месяцам.
+    rollup — сводная таблица по (город, месяц), иначе строится по df
+    """
+    if rollup is None:
+        rollup = rollup_frame(df)
     
     # Средние показатели по месяцам
-    monthly = df.groupby("month")[["pm25", "pm10", "no2", "so2", "o3"]].mean()
+    monthly = means(rollup, "month")[["pm25", "pm10", "no2", "so2", "o3"]]
     
     print("\n=== Средние показатели по месяцам ===")
     print(monthly)
     
     # Графики сезонности
     def plot_monthly(param, title, filename):
-        plt.figure(figsize=(8, 5))
-        monthly[param].plot(marker="o")
-        plt.title(title)
-        plt.xlabel("Месяц")
-        plt.ylabel(param.upper())
-        plt.grid(True)
-        plt.xticks(range(1, 13))
-        plt.tight_layout()
-        plt.savefig(OUTPUT / filename)
-        plt.close()
-    
-    plot_monthly("pm25", "Сезонность PM2.5 (2023–2025)", "seasonality_pm25.png")
-    plot_monthly("pm10", "Сезонность PM10 (2023–2025)", "seasonality_pm10.png")
-    plot_monthly("no2", "Сезонность NO₂ (2023–2025)", "seasonality_no2.png")
-    plot_monthly("o3", "Сезонность O₃ (2023–2025)", "seasonality_o3.png")
+        return chart("line", filename, monthly[param], title=title, xlabel="Месяц", ylabel=param.upper(),
+                     grid=True, xticks=range(1, 13), marker="o")
     
     # Тепловая карта по городам
     heat = (
-        df.groupby(["city", "month"])["pm25"]
-        .mean()
+        means(rollup, ["city", "month"])["pm25"]
         .unstack(level=1)
     )
     
-    plt.figure(figsize=(14, 7))
-    sns.heatmap(heat, cmap="coolwarm", annot=False)
-    plt.title("PM2.5 — сезонность по городам (heatmap)")
-    plt.xlabel("Месяц")
-    plt.ylabel("Город")
-    plt.tight_layout()
-    plt.savefig(OUTPUT / "seasonality_heatmap_pm25.png")
-    plt.close()
+    timings = render_charts([
+        plot_monthly("pm25", "Сезонность PM2.5 (2023–2025)", "seasonality_pm25.png"),
+        plot_monthly("pm10", "Сезонность PM10 (2023–2025)", "seasonality_pm10.png"),
+        plot_monthly("no2", "Сезонность NO₂ (2023–2025)", "seasonality_no2.png"),
+        plot_monthly("o3", "Сезонность O₃ (2023–2025)", "seasonality_o3.png"),
+        chart("heatmap", "seasonality_heatmap_pm25.png", heat, title="PM2.5 — сезонность по городам (heatmap)",
+              xlabel="Месяц", ylabel="Город", figsize=(14, 7), cmap="coolwarm", annot=False),
+    ])
+    print_timings(timings)
     
     print(f"\n✔ Графики сохранены в {OUTPUT}")
+
+
+def main():
+    db = DBManager()
+    
+    # Средние из сводной таблицы MongoDB; дневные данные нужны, только если её нет
+    df = None
+    stats = load_stats(db)
+    if stats is None:
+        print("Сводная таблица отсутствует или устарела — расчёт по всем данным")
+        df = db.load_clean_data(columns=COLUMNS)
+        if df.empty:
+            print("Нет данных!")
+            return
+    
+    run(df, **(stats or {}))
     
     db.close()
 
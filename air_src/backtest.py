@@ -0,0 +1,169 @@
+"""
+Оценка точности прогноза: сравнение движков на отложенной выборке
+или скользящая кросс-валидация (rolling origin) с фолдами в пуле процессов
+
+    python air_src/backtest.py [--horizon N] [--engines sarima fourier]
+    python air_src/backtest.py --rolling [--horizon N] [--step N] [--workers N]
+"""
+import warnings
+warnings.filterwarnings("ignore")
+
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+import pandas as pd
+from db_manager import DBManager
+from sarima_forecast import ENGINES, COLUMNS, series_from_frame
+from task_pool import run_tasks
+from config import (
+    OUTPUT, BACKTEST_HOLDOUT_DAYS, BACKTEST_HORIZON, BACKTEST_STEP,
+    BACKTEST_INITIAL_DAYS, BACKTEST_WORKERS
+)
+
+
+def forecast_errors(forecast_res, actual: pd.Series) -> dict:
+    """MAE, RMSE и доля фактических значений внутри 95% интервала"""
+    mean = forecast_res.predicted_mean.values
+    conf = forecast_res.conf_int(alpha=0.05)
+    lower, upper = conf.iloc[:, 0].values, conf.iloc[:, 1].values
+    values = actual.values
+    
+    return {
+        "mae": float(np.mean(np.abs(values - mean))),
+        "rmse": float(np.sqrt(np.mean((values - mean) ** 2))),
+        "coverage": float(np.mean((values >= lower) & (values <= upper))),
+    }
+
+
+def evaluate_engine(engine: str, train: pd.Series, test: pd.Series) -> dict:
+    """Обучить движок на train и оценить прогноз на test"""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        res = ENGINES[engine](train)
+    fit_seconds = time.perf_counter() - started
+    
+    return {"engine": engine, **forecast_errors(res.get_forecast(steps=len(test)), test),
+            "fit_seconds": fit_seconds}
+
+
+def compare_engines(series: pd.Series, engines=tuple(ENGINES), horizon: int = BACKTEST_HOLDOUT_DAYS) -> pd.DataFrame:
+    """Сравнение движков: последние horizon дней ряда — отложенная выборка"""
+    if len(series) <= horizon:
+        raise ValueError("ряд короче отложенной выборки")
+    
+    train, test = series.iloc[:-horizon], series.iloc[-horizon:]
+    rows = []
+    for engine in engines:
+        print(f"Движок {engine}...")
+        rows.append(evaluate_engine(engine, train, test))
+    return pd.DataFrame(rows)
+
+
+def rolling_origins(length: int, horizon: int, step: int, initial: int):
+    """Точки отсечения: длины обучающих выборок, после каждой есть horizon дней для проверки"""
+    return list(range(initial, length - horizon + 1, step))
+
+
+def fold_task(engine: str, series: pd.Series, origin: int, horizon: int) -> dict:
+    """Один фолд в рабочем процессе; ошибка фолда возвращается в результате"""
+    result = {"engine": engine, "origin": series.index[origin - 1], "train_days": origin, "error": None}
+    try:
+        result.update(evaluate_engine(engine, series.iloc[:origin], series.iloc[origin:origin + horizon]))
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    return result
+
+
+def rolling_backtest(series: pd.Series, engines=tuple(ENGINES), horizon: int = BACKTEST_HORIZON,
+                     step: int = BACKTEST_STEP, initial: int = BACKTEST_INITIAL_DAYS,
+                     workers=BACKTEST_WORKERS) -> pd.DataFrame:
+    """
+    Скользящая кросс-валидация: для каждой точки отсечения и движка — обучение
+    на истории до неё и прогноз на horizon дней. Возвращает таблицу фолдов
+    """
+    origins = rolling_origins(len(series), horizon, step, initial)
+    if not origins:
+        raise ValueError("ряд короче начальной выборки и горизонта")
+    
+    calls = {
+        (engine, origin): (fold_task, (engine, series, origin, horizon))
+        for engine in engines for origin in origins
+    }
+    
+    rows = []
+    for done, ((engine, origin), row, error) in enumerate(run_tasks(calls, workers), 1):
+        if error:
+            # Аварийное завершение рабочего процесса (task_pool)
+            row = {"engine": engine, "origin": series.index[origin - 1], "train_days": origin, "error": error}
+        status = row["error"] or f"MAE {row['mae']:.3f}, {row['fit_seconds']:.1f} с"
+        print(f"[{done}/{len(calls)}] {row['engine']} до {row['origin']:%Y-%m-%d}: {status}")
+        rows.append(row)
+    
+    folds = pd.DataFrame(rows)
+    return folds.sort_values(["engine", "origin"], ignore_index=True)
+
+
+METRICS = ["mae", "rmse", "coverage", "fit_seconds"]
+
+
+def summarize_folds(folds: pd.DataFrame) -> pd.DataFrame:
+    """
+    Средние метрики и суммарное время обучения по движкам.
+    Движки, у которых не удался ни один фолд, остаются в таблице с NaN и числом ошибок
+    """
+    folds = folds.reindex(columns=list(folds.columns) + [col for col in METRICS if col not in folds.columns])
+    failed = folds["error"].notna()
+    summary = folds[~failed].groupby("engine").agg(
+        folds=("mae", "size"),
+        mae=("mae", "mean"),
+        rmse=("rmse", "mean"),
+        coverage=("coverage", "mean"),
+        fit_seconds=("fit_seconds", "mean"),
+        fit_seconds_total=("fit_seconds", "sum"),
+    )
+    summary = summary.reindex(sorted(folds["engine"].unique())).rename_axis("engine")
+    summary["failed"] = failed.groupby(folds["engine"]).sum()
+    return summary.fillna({"folds": 0, "failed": 0}).astype({"folds": int, "failed": int}).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение движков прогноза")
+    parser.add_argument("--rolling", action="store_true", help="скользящая кросс-валидация")
+    parser.add_argument("--horizon", type=int, help="дней прогноза (отложенной выборки)")
+    parser.add_argument("--step", type=int, default=BACKTEST_STEP)
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    args = parser.parse_args()
+    
+    db = DBManager()
+    series = series_from_frame(db.load_clean_data(columns=COLUMNS))
+    db.close()
+    
+    if args.rolling:
+        horizon = args.horizon or BACKTEST_HORIZON
+        print(f"Длина ряда: {len(series)}, горизонт: {horizon} дней, шаг: {args.step} дней\n")
+        folds = rolling_backtest(series, args.engines, horizon, args.step, workers=args.workers)
+        
+        # Фолды сохраняются до сводки — вместе с ошибками, даже если сводка не удастся
+        folds.to_csv(OUTPUT / "backtest_folds.csv", index=False)
+        
+        print("\n=== Скользящий бэктест ===")
+        print(summarize_folds(folds).to_string(index=False, float_format="%.3f"))
+        print(f"\n✔ Результаты по фолдам сохранены в {OUTPUT / 'backtest_folds.csv'}")
+        return
+    
+    args.horizon = args.horizon or BACKTEST_HOLDOUT_DAYS
+    print(f"Длина ряда: {len(series)}, отложенная выборка: {args.horizon} дней\n")
+    report = compare_engines(series, args.engines, args.horizon)
+    
+    print("\n=== Сравнение движков ===")
+    print(report.to_string(index=False, float_format="%.3f"))
+    
+    report.to_csv(OUTPUT / "backtest_engines.csv", index=False)
+    print(f"\n✔ Результаты сохранены в {OUTPUT / 'backtest_engines.csv'}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
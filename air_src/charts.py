@@ -0,0 +1,302 @@
+"""
+Рендеринг графиков по декларативным описаниям: данные и оформление
+задаются словарём, графики сохраняются в PNG в пуле процессов (backend Agg).
+
+Хэш данных и параметров каждого графика хранится в манифесте рядом с PNG
+(по файлу на график): если он не изменился с прошлого запуска, график
+не перестраивается.
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.colors import LogNorm
+import pandas as pd
+import seaborn as sns
+from config import (
+    OUTPUT, CHART_WORKERS, CHART_MAX_LABELS, CHART_MANIFEST,
+    SCATTER_MAX_POINTS, SCATTER_LARGE_MODE, SCATTER_BINS
+)
+
+
+# Предел процессов рендеринга в текущем процессе (limit_workers): этапы
+# конвейера сами выполняются в пуле процессов, вложенный пул им не нужен
+worker_limit = None
+
+
+def limit_workers(limit):
+    """Ограничить число процессов render_charts в текущем процессе (None — без ограничения)"""
+    global worker_limit
+    worker_limit = limit
+
+
+def chart(kind: str, filename: str, data, title: str = None, xlabel: str = None, ylabel: str = None,
+          figsize=(8, 5), grid: bool = False, xticks=None, dpi=None, **options) -> dict:
+    """
+    Описание графика. kind — вид из RENDERERS, data — Series/DataFrame,
+    options передаются функции построения (pandas/seaborn)
+    """
+    return {
+        "kind": kind,
+        "filename": filename,
+        "data": data,
+        "style": {
+            "title": title,
+            "xlabel": xlabel,
+            "ylabel": ylabel,
+            "figsize": figsize,
+            "grid": grid,
+            "xticks": xticks,
+            "dpi": dpi,
+        },
+        "options": options,
+    }
+
+
+def _bar(ax, data, **options):
+    """
+    Столбчатая диаграмма. Series строится напрямую через ax.bar (как pandas,
+    но без его накладных расходов на сотни городов); подписей категорий
+    не больше CHART_MAX_LABELS — остальные всё равно накладываются друг на друга
+    """
+    if not isinstance(data, pd.Series):
+        data.plot(kind="bar", ax=ax, **options)
+        return
+    
+    positions = np.arange(len(data))
+    ax.bar(positions, data.to_numpy(), width=0.5, **options)
+    ax.set_xlim(-0.5, len(data) - 0.5)
+    
+    step = max(1, -(-len(data) // CHART_MAX_LABELS))
+    ax.set_xticks(positions[::step])
+    ax.set_xticklabels([str(label) for label in data.index[::step]], rotation=90)
+    if data.index.name is not None:
+        ax.set_xlabel(data.index.name)
+
+
+def _line(ax, data, **options):
+    data.plot(ax=ax, **options)
+
+
+def _hist(ax, data, **options):
+    data.hist(ax=ax, **options)
+
+
+def _heatmap(ax, data, **options):
+    sns.heatmap(data, ax=ax, **options)
+
+
+def _scatter(ax, data, **options):
+    sns.scatterplot(data=data, ax=ax, **options)
+
+
+def _density(ax, data, cmap="Blues", **options):
+    """
+    Плотность точек по заранее посчитанной 2-D гистограмме (bin_density):
+    строки — центры интервалов по y, колонки — по x, пустые ячейки не закрашиваются
+    """
+    def edges(centers):
+        centers = np.asarray(centers, dtype=float)
+        step = centers[1] - centers[0] if len(centers) > 1 else 1.0
+        return np.append(centers - step / 2, centers[-1] + step / 2)
+    
+    counts = np.ma.masked_equal(data.to_numpy(), 0)
+    mesh = ax.pcolormesh(edges(data.columns), edges(data.index), counts,
+                         cmap=cmap, norm=LogNorm(), **options)
+    ax.figure.colorbar(mesh, ax=ax, label="Число точек")
+    ax.set_xlabel(data.columns.name)
+    ax.set_ylabel(data.index.name)
+
+
+RENDERERS = {
+    "bar": _bar,
+    "line": _line,
+    "hist": _hist,
+    "heatmap": _heatmap,
+    "scatter": _scatter,
+    "density": _density,
+}
+
+
+def sample_rows(df: pd.DataFrame, limit: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Равномерная случайная выборка не более limit строк без возвращения,
+    в исходном порядке. Зерно фиксировано: при тех же данных выборка та же
+    и график не перестраивается повторно
+    """
+    if len(df) <= limit:
+        return df
+    rows = np.random.default_rng(seed).choice(len(df), size=limit, replace=False)
+    return df.iloc[np.sort(rows)]
+
+
+def bin_density(df: pd.DataFrame, x: str, y: str, bins: int = SCATTER_BINS) -> pd.DataFrame:
+    """Число точек в ячейках 2-D гистограммы (строки — y, колонки — x), без пропусков"""
+    values = df[[x, y]].to_numpy(dtype=float)
+    values = values[~np.isnan(values).any(axis=1)]
+    counts, x_edges, y_edges = np.histogram2d(values[:, 0], values[:, 1], bins=bins)
+    return pd.DataFrame(
+        counts.T,
+        index=pd.Index((y_edges[:-1] + y_edges[1:]) / 2, name=y),
+        columns=pd.Index((x_edges[:-1] + x_edges[1:]) / 2, name=x),
+    )
+
+
+def scatter_chart(filename: str, df: pd.DataFrame, x: str, y: str, limit: int = SCATTER_MAX_POINTS,
+                  mode: str = SCATTER_LARGE_MODE, **style) -> dict:
+    """
+    Диаграмма рассеяния x/y. До limit строк — обычный scatter по всем точкам,
+    больше — по случайной выборке из limit точек (mode="sample") или плотность
+    по 2-D гистограмме (mode="density"). В обоих случаях в процесс рендеринга
+    передаётся не больше limit строк или bins² ячеек, а не весь датафрейм
+    """
+    data = df[[x, y]]
+    
+    if len(data) <= limit or mode == "sample":
+        return chart("scatter", filename, sample_rows(data, limit), x=x, y=y, **style)
+    if mode == "density":
+        # Оформление точек к плотности не относится
+        style = {key: value for key, value in style.items() if key not in ("alpha", "s", "color")}
+        return chart("density", filename, bin_density(data, x, y), **style)
+    raise ValueError(f"Неизвестный режим диаграммы рассеяния: {mode}")
+
+
+def render_chart(spec: dict, directory: Path = OUTPUT) -> dict:
+    """Построить и сохранить один график; ошибка возвращается в результате"""
+    matplotlib.use("Agg")
+    style = spec["style"]
+    result = {"filename": spec["filename"], "error": None}
+    started = time.perf_counter()
+    
+    fig, ax = plt.subplots(figsize=style["figsize"])
+    try:
+        RENDERERS[spec["kind"]](ax, spec["data"], **spec["options"])
+        
+        if style["title"] is not None:
+            ax.set_title(style["title"])
+        if style["xlabel"] is not None:
+            ax.set_xlabel(style["xlabel"])
+        if style["ylabel"] is not None:
+            ax.set_ylabel(style["ylabel"])
+        if style["grid"]:
+            ax.grid(True)
+        if style["xticks"] is not None:
+            ax.set_xticks(style["xticks"])
+        
+        fig.tight_layout()
+        fig.savefig(Path(directory) / spec["filename"], dpi=style["dpi"])
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    finally:
+        plt.close(fig)
+    
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def spec_hash(spec: dict) -> str:
+    """Хэш графика: данные (с индексом), вид, оформление, опции и код рендеринга"""
+    data = spec["data"]
+    digest = hashlib.sha256(Path(__file__).read_bytes())
+    digest.update(json.dumps(
+        [spec["kind"], spec["style"], spec["options"], list(getattr(data, "columns", [])),
+         [data.index.name, getattr(data, "name", None)]],
+        ensure_ascii=False, default=repr, sort_keys=True
+    ).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def load_manifest(directory: Path = OUTPUT) -> dict:
+    """Манифест построенных графиков: {файл: {hash, seconds, rendered}}, собранный из записей по графикам"""
+    root = Path(directory) / CHART_MANIFEST
+    manifest = {}
+    for path in sorted(root.rglob("*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest[path.relative_to(root).as_posix()[:-len(".json")]] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return manifest
+
+
+def update_manifest(entries: dict, directory: Path = OUTPUT):
+    """
+    Записать записи манифеста. У каждого графика свой файл, который пишет
+    только построивший его процесс, — этапы, параллельно строящие свои
+    графики, не затирают записи друг друга
+    """
+    root = Path(directory) / CHART_MANIFEST
+    for filename, entry in entries.items():
+        path = root / f"{filename}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+
+def render_charts(specs, workers=CHART_WORKERS, directory: Path = OUTPUT, force: bool = False) -> dict:
+    """
+    Построить графики параллельно (не больше worker_limit процессов).
+    Графики, у которых хэш совпал с манифестом и файл на месте,
+    пропускаются (force=True — построить все).
+    Возвращает {файл: секунды} для построенных,
+    ошибки печатаются и не мешают остальным графикам
+    """
+    manifest = {} if force else load_manifest(directory)
+    pending = []
+    skipped = 0
+    for spec in specs:
+        digest = spec_hash(spec)
+        entry = manifest.get(spec["filename"], {})
+        if entry.get("hash") == digest and (Path(directory) / spec["filename"]).exists():
+            skipped += 1
+        else:
+            pending.append((spec, digest))
+    
+    if skipped:
+        print(f"Графиков без изменений: {skipped}, не перестраиваются")
+    if not pending:
+        return {}
+    
+    workers = min(workers or os.cpu_count(), worker_limit or len(pending), len(pending))
+    if workers <= 1:
+        results = [render_chart(spec, directory) for spec, _ in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(render_chart, spec, directory) for spec, _ in pending]
+            results = [future.result() for future in as_completed(futures)]
+    
+    digests = {spec["filename"]: digest for spec, digest in pending}
+    rendered = datetime.now().isoformat(timespec="seconds")
+    timings = {}
+    entries = {}
+    for result in results:
+        if result["error"]:
+            print(f"✗ График {result['filename']} не построен: {result['error']}")
+            continue
+        timings[result["filename"]] = result["seconds"]
+        entries[result["filename"]] = {
+            "hash": digests[result["filename"]],
+            "seconds": round(result["seconds"], 3),
+            "rendered": rendered,
+        }
+    
+    update_manifest(entries, directory)
+    return timings
+
+
+def print_timings(timings: dict):
+    """Время построения графиков, самые долгие первыми"""
+    if not timings:
+        return
+    print("\nВремя построения графиков:")
+    for filename, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        print(f"  {filename}: {seconds:.2f} с")
\ No newline at end of file
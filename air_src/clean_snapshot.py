@@ -0,0 +1,84 @@
+"""
+Локальный снимок clean_data в формате Feather.
+Имя файла содержит версию данных: при смене версии старый снимок
+становится недействительным и удаляется при записи нового
+"""
+import os
+import re
+import time
+import pandas as pd
+from pathlib import Path
+from config import SNAPSHOT_DIR, SNAPSHOT_TMP_MAX_AGE
+
+
+SNAPSHOT_PREFIX = "clean_data_"
+
+
+def snapshot_path(version: str, directory: Path = SNAPSHOT_DIR) -> Path:
+    """Путь к снимку для версии данных"""
+    safe = re.sub(r"[^0-9A-Za-z_-]", "_", version)
+    return Path(directory) / f"{SNAPSHOT_PREFIX}{safe}.feather"
+
+
+def read_snapshot(version: str, columns=None, directory: Path = SNAPSHOT_DIR):
+    """
+    Прочитать снимок с отображением файла в память.
+    Возвращает None, если снимка этой версии нет или pyarrow недоступен
+    """
+    path = snapshot_path(version, directory)
+    if not path.exists():
+        return None
+    
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    
+    # Чтение из отображённого в память файла без копирования; в pandas
+    # переносятся только запрошенные колонки
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select([col for col in columns if col in table.schema.names])
+        return table.to_pandas()
+
+
+def write_snapshot(version: str, df: pd.DataFrame, directory: Path = SNAPSHOT_DIR) -> bool:
+    """Записать снимок (без сжатия, чтобы его можно было отображать в память)"""
+    try:
+        from pyarrow import feather
+    except ImportError:
+        return False
+    
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = snapshot_path(version, directory)
+    
+    # У каждого процесса свой временный файл: параллельные записи не мешают друг другу
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    feather.write_feather(df.reset_index(drop=True), tmp, compression="uncompressed")
+    os.replace(tmp, path)
+    
+    # Снимки прежних версий больше не нужны
+    for old in directory.glob(f"{SNAPSHOT_PREFIX}*.feather"):
+        if old != path:
+            old.unlink(missing_ok=True)
+    remove_stale_tmp(directory)
+    return True
+
+
+def remove_stale_tmp(directory: Path = SNAPSHOT_DIR, max_age: float = SNAPSHOT_TMP_MAX_AGE) -> int:
+    """
+    Удалить временные файлы прерванных записей. Файлы моложе max_age
+    не трогаются: их может дописывать другой процесс
+    """
+    removed = 0
+    now = time.time()
+    for tmp in Path(directory).glob(f"{SNAPSHOT_PREFIX}*.tmp"):
+        try:
+            if now - tmp.stat().st_mtime > max_age:
+                tmp.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
\ No newline at end of file
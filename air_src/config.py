@@ -7,9 +7,17 @@ OUTPUT.mkdir(exist_ok=True)
 
 # MongoDB
 MONGO_URI = "mongodb://mongodb:27017/"
+MONGO_MAX_POOL_SIZE = 10  # соединений в пуле одного клиента
 DB_NAME = "air_quality_db"
 COLLECTION_RAW = "raw_data"
 COLLECTION_CLEAN = "clean_data"
+COLLECTION_META = "meta"
+COLLECTION_CORRELATION = "correlation_stats"  # суммы для корреляций по (город, месяц)
+COLLECTION_ROLLUP = "monthly_rollup"  # суммы и число дней по (город, месяц)
+RAW_TIMESERIES = False  # создавать raw_data как time-series коллекцию (metaField = city)
+LOAD_BATCH_SIZE = 10000  # документов в пачке при чтении из MongoDB
+WRITE_CHUNK_SIZE = 10000  # документов в пачке при записи в MongoDB
+WRITE_WORKERS = 1  # параллельных потоков записи
 
 # Города для анализа
 CITIES = [
@@ -35,4 +43,90 @@ CITIES = [
 
 # Период данных
 START_DATE = "2024-01-01"
-END_DATE = "2025-12-01"
\ No newline at end of file
+END_DATE = "2025-12-01"
+
+# API Open-Meteo
+GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+AIR_QUALITY_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+REQUEST_TIMEOUT = 60  # секунд
+
+# Параллельная загрузка
+FETCH_WORKERS = 6  # одновременно загружаемых городов
+
+# Ограничение частоты запросов: запросов в секунду на каждый хост API
+RATE_LIMITS = {
+    "geocoding-api.open-meteo.com": 5,
+    "air-quality-api.open-meteo.com": 2,
+}
+DEFAULT_RATE_LIMIT = 2
+
+# Кэш (в output, чтобы переживать перезапуск контейнера)
+CACHE_DIR = OUTPUT / "cache"
+CACHE_DIR.mkdir(exist_ok=True)
+
+# Локальный снимок clean_data (Feather), обновляется при смене версии данных
+CLEAN_SNAPSHOT = True
+SNAPSHOT_DIR = CACHE_DIR / "snapshots"
+SNAPSHOT_TMP_MAX_AGE = 3600  # с; более старые временные файлы снимков — остатки прерванных записей
+
+# Геокодинг
+GEOCODE_LANGUAGE = "ru"
+GEOCODE_CACHE = CACHE_DIR / "geocode.json"
+
+# Закреплённые координаты: используются вместо кэша и API
+CITY_COORDS = {
+    # "Москва": (55.75222, 37.61556),
+}
+
+# Режим загрузки:
+#   "full"        — весь период START_DATE–END_DATE
+#   "incremental" — только часы новее уже сохранённых в raw_data
+FETCH_MODE = "full"
+INCREMENTAL_END_DATE = None  # конец периода для "incremental", None — сегодня
+
+# Движок дневной агрегации в process_and_clean_data:
+#   "pandas" — в Python после загрузки всех сырых данных
+#   "mongo"  — агрегационным конвейером на сервере с $merge в clean_data
+CLEAN_ENGINE = "pandas"
+CHECK_CLEAN_PARITY = False  # сверять результат "mongo" с "pandas" после очистки
+
+# Конвейер pipeline.py
+PIPELINE_WORKERS = 4  # процессов для параллельных этапов анализа
+PIPELINE_STATE = CACHE_DIR / "pipeline_state.json"
+
+# Пакетный прогноз SARIMA по городам и загрязнителям (sarima_forecast.py --batch)
+FORECAST_POLLUTANTS = ["pm25", "pm10", "no2", "so2", "o3"]
+FORECAST_WORKERS = None  # процессов; None — по числу ядер
+FORECAST_TASK_TIMEOUT = 900  # секунд на одну модель (город, загрязнитель)
+
+# Реестр моделей SARIMA: выбранные порядки и параметры между запусками
+MODELS_DIR = CACHE_DIR / "models"
+ORDER_RESELECT_DAYS = 30  # повторный подбор порядка не реже, чем раз в N дней
+FIT_DEGRADATION_TOL = 0.25  # подбор заново, если MSE остатков выросла больше чем на 25%
+FORECAST_MODE = "full"  # "full" — обучение модели, "update" — дополнение сохранённой модели новыми днями
+
+# Движок прогноза: "sarima" — SARIMA с m=30 (auto_arima), "fourier" — ARIMA
+# низкого порядка с сезонностью в виде гармоник Фурье (быстрее на порядки)
+FORECAST_ENGINE = "sarima"
+FOURIER_TERMS = {30: 2, 365.25: 4}  # период в днях: число гармоник
+BACKTEST_HOLDOUT_DAYS = 90  # дней в отложенной выборке для сравнения движков
+# Скользящий бэктест (backtest.py --rolling): обучение на истории до точки
+# отсечения, прогноз на BACKTEST_HORIZON дней, точка сдвигается на BACKTEST_STEP
+BACKTEST_HORIZON = 30
+BACKTEST_STEP = 30
+BACKTEST_INITIAL_DAYS = 365  # минимальная длина обучающей выборки
+BACKTEST_WORKERS = None  # процессов; None — по числу ядер
+
+# Рендеринг графиков (charts.py)
+CHART_WORKERS = None  # процессов; None — по числу ядер, 1 — в текущем процессе
+CHART_MAX_LABELS = 60  # максимум подписей городов по оси X столбчатой диаграммы
+CHART_MANIFEST = "charts_manifest"  # папка с хэшами и временем построения графиков (по файлу на график), в папке с графиками
+SCATTER_MAX_POINTS = 50_000  # точек на диаграмме рассеяния, при большем числе строк — режим SCATTER_LARGE_MODE
+SCATTER_LARGE_MODE = "sample"  # "sample" — случайная выборка точек, "density" — 2-D гистограмма плотности
+SCATTER_BINS = 200  # ячеек по каждой оси в режиме "density"
+
+# Корреляции между загрязнителями (analysis_correlations.py, correlation_stats.py)
+CORRELATION_PARAMS = ["pm25", "pm10", "no2", "so2", "o3", "uv", "nh3", "dust", "co"]
+
+# Сводные таблицы по (город, месяц) для сезонности, рейтингов и обзора (rollups.py)
+ROLLUP_PARAMS = ["pm25", "pm10", "no2", "so2", "o3", "co", "dust", "uv", "nh3"]
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Достаточные статистики для корреляций между загрязнителями.
+
+По каждой паре (город, месяц) в MongoDB хранятся попарные суммы по дням,
+где измерены оба загрязнителя a и b:
+    n — число дней, s — сумма a, q — сумма a², c — сумма a·b
+(stats.a.b.n и т.д.). Суммы аддитивны: при изменении clean_data вычитается
+вклад заменяемых дней и прибавляется вклад новых, а матрица корреляций
+за любой период и по любому набору городов собирается из месячных
+документов за O(params²) на документ, без чтения дневных данных.
+"""
+import numpy as np
+import pandas as pd
+from config import COLLECTION_CORRELATION, CORRELATION_PARAMS
+
+
+COLLECTION = COLLECTION_CORRELATION
+FIELDS = ("n", "s", "q", "c")
+
+
+def comoments(values: np.ndarray) -> dict:
+    """
+    Попарные суммы по матрице значений (строки — дни, колонки — загрязнители).
+    Элемент [i, j] считается по строкам, где измерены оба загрязнителя:
+    s[i, j] — сумма i, q[i, j] — сумма i², c[i, j] — сумма i·j
+    """
+    present = ~np.isnan(values)
+    x = np.where(present, values, 0.0)
+    m = present.astype(float)
+    return {"n": m.T @ m, "s": x.T @ m, "q": (x * x).T @ m, "c": x.T @ x}
+
+
+def month_start(dates) -> pd.Series:
+    """Начало месяца для каждой даты"""
+    return pd.to_datetime(dates).dt.to_period("M").dt.to_timestamp()
+
+
+def bucket_comoments(df: pd.DataFrame, params=CORRELATION_PARAMS) -> dict:
+    """Попарные суммы по каждой паре (город, начало месяца)"""
+    values = df.reindex(columns=params).to_numpy(dtype=float)
+    groups = pd.DataFrame({"city": df["city"].to_numpy(), "month": month_start(df["date"]).to_numpy()})
+    return {
+        (city, month): comoments(values[rows])
+        for (city, month), rows in groups.groupby(["city", "month"]).indices.items()
+    }
+
+
+def increments(df: pd.DataFrame, params=CORRELATION_PARAMS, sign: int = 1) -> dict:
+    """Приращения $inc для документов (город, месяц); пары без общих дней пропускаются"""
+    result = {}
+    for key, stats in bucket_comoments(df, params).items():
+        inc = {}
+        for i, a in enumerate(params):
+            for j, b in enumerate(params):
+                if stats["n"][i, j]:
+                    inc.update({f"stats.{a}.{b}.{field}": sign * float(stats[field][i, j]) for field in FIELDS})
+        result[key] = inc
+    return result
+
+
+def reset(db):
+    """Удалить статистики перед полным пересчётом"""
+    db.clear_stats(COLLECTION)
+
+
+def apply_delta(db, df: pd.DataFrame, sign: int = 1):
+    """Прибавить (sign=1) или вычесть (sign=-1) вклад дневных записей df"""
+    if df.empty:
+        return 0
+    return db.inc_stats(COLLECTION, increments(df, CORRELATION_PARAMS, sign))
+
+
+def sum_documents(docs, params=CORRELATION_PARAMS) -> dict:
+    """Сложить суммы месячных документов в матрицы params × params"""
+    index = {param: i for i, param in enumerate(params)}
+    total = {field: np.zeros((len(params), len(params))) for field in FIELDS}
+    for doc in docs:
+        for a, row in doc.get("stats", {}).items():
+            for b, sums in row.items():
+                if a in index and b in index:
+                    for field in FIELDS:
+                        total[field][index[a], index[b]] += sums.get(field, 0.0)
+    return total
+
+
+def correlation(stats: dict, params=CORRELATION_PARAMS) -> pd.DataFrame:
+    """
+    Матрица корреляций Пирсона по попарно полным наблюдениям (как DataFrame.corr).
+    Загрязнители без измерений не включаются
+    """
+    n, s, q, c = (stats[field] for field in FIELDS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = c - s * s.T / n
+        var = q - s * s / n
+        corr = cov / np.sqrt(var * var.T)
+    
+    corr[(n < 2) | ~np.isfinite(corr)] = np.nan
+    diagonal = np.diag(corr).copy()
+    np.fill_diagonal(corr, np.where(np.isnan(diagonal), np.nan, 1.0))
+    corr = np.clip(corr, -1.0, 1.0)
+    
+    keep = np.diag(n) > 0
+    names = [param for param, measured in zip(params, keep) if measured]
+    return pd.DataFrame(corr[np.ix_(keep, keep)], index=names, columns=names)
+
+
+def load_correlation(db, cities=None, start=None, end=None, params=CORRELATION_PARAMS):
+    """
+    Матрица корреляций из статистик MongoDB по городам cities за месяцы
+    с началом в [start, end]. None — статистики отсутствуют или устарели
+    """
+    if not db.clean_stats_current(COLLECTION):
+        return None
+    docs = db.load_stats(COLLECTION, cities, start, end)
+    if not docs:
+        return None
+    return correlation(sum_documents(docs, params), params)
+
+
+def city_correlations(db, start=None, end=None, params=CORRELATION_PARAMS) -> dict:
+    """Матрицы корреляций по каждому городу: {город: DataFrame}"""
+    if not db.clean_stats_current(COLLECTION):
+        return {}
+    by_city = {}
+    for doc in db.load_stats(COLLECTION, start=start, end=end):
+        by_city.setdefault(doc["city"], []).append(doc)
+    return {city: correlation(sum_documents(docs, params), params) for city, docs in sorted(by_city.items())}
\ No newline at end of file
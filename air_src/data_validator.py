@@ -1,9 +1,25 @@
 """
 Модуль для валидации качества данных
 """
+import argparse
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Tuple
+from quantile_sketch import QuantileSketch
+from db_manager import DBManager
+
+
+# Поля сырых почасовых данных в терминах валидатора
+RAW_FIELDS = {
+    "time": "date",
+    "pm2_5": "pm25",
+    "carbon_monoxide": "co",
+    "nitrogen_dioxide": "no2",
+    "sulphur_dioxide": "so2",
+    "ozone": "o3",
+    "uv_index": "uv",
+    "ammonia": "nh3"
+}
 
 
 class DataValidator:
@@ -24,26 +40,33 @@ class DataValidator:
         }
         
         self.required_columns = ['city', 'date', 'pm25', 'pm10', 'no2', 'so2', 'o3']
+        self.numeric_columns = ['pm25', 'pm10', 'no2', 'so2', 'o3']
         self.results = {}
     
-    def validate_dataframe(self, df: pd.DataFrame) -> Dict:
-        """Полная валидация датафрейма"""
-        self.results = {
-            'total_rows': len(df),
+    def _new_results(self, total_rows: int) -> Dict:
+        return {
+            'total_rows': total_rows,
             'passed': True,
             'errors': [],
             'warnings': [],
             'statistics': {}
         }
+    
+    def validate_dataframe(self, df: pd.DataFrame) -> Dict:
+        """Полная валидация датафрейма"""
+        self.results = self._new_results(len(df))
         
         # Проверка структуры
         self._check_structure(df)
         
+        # Пропуски, диапазоны и квартили числовых колонок — за один проход
+        stats = self._column_stats(df)
+        
         # Проверка диапазонов значений
-        self._check_value_ranges(df)
+        self._report_value_ranges(stats['violations'], len(df))
         
         # Проверка пропусков
-        self._check_missing_values(df)
+        self._report_missing_values(stats['missing'], len(df))
         
         # Проверка дубликатов
         self._check_duplicates(df)
@@ -52,13 +75,16 @@ class DataValidator:
         self._check_date_continuity(df)
         
         # Статистические аномалии
-        self._check_statistical_anomalies(df)
+        self._report_outliers(stats['anomalies'])
         
         return self.results
     
     def _check_structure(self, df: pd.DataFrame):
         """Проверка структуры данных"""
-        missing_cols = [col for col in self.required_columns if col not in df.columns]
+        self._report_structure(df.columns, df.empty)
+    
+    def _report_structure(self, columns, empty: bool):
+        missing_cols = [col for col in self.required_columns if col not in columns]
         
         if missing_cols:
             self.results['passed'] = False
@@ -66,43 +92,90 @@ class DataValidator:
                 f"Отсутствуют обязательные колонки: {missing_cols}"
             )
         
-        if df.empty:
+        if empty:
             self.results['passed'] = False
             self.results['errors'].append("Датафрейм пустой")
     
-    def _check_value_ranges(self, df: pd.DataFrame):
-        """Проверка диапазонов значений"""
-        for param, (min_val, max_val) in self.valid_ranges.items():
-            if param not in df.columns:
+    def _column_stats(self, df: pd.DataFrame) -> Dict:
+        """
+        Пропуски, значения вне диапазона и выбросы по IQR для колонок
+        valid_ranges: один двумерный массив и векторные проверки по всем
+        колонкам сразу вместо отдельных проходов по каждой
+        """
+        columns = [col for col in self.valid_ranges if col in df.columns]
+        values = df[columns].to_numpy(dtype=float, na_value=np.nan)
+        
+        ranges = np.array([self.valid_ranges[col] for col in columns], dtype=float).reshape(-1, 2)
+        violations = np.count_nonzero((values < ranges[:, 0]) | (values > ranges[:, 1]), axis=0)
+        
+        valid = ~np.isnan(values)
+        valid_counts = np.count_nonzero(valid, axis=0)
+        
+        anomalies = {}
+        for j, col in enumerate(columns):
+            if col not in self.numeric_columns or valid_counts[j] < 10:
+                continue
+            
+            data = values[:, j]
+            if valid_counts[j] < len(data):
+                data = data[valid[:, j]]
+            
+            # Метод IQR: оба квартиля за одну частичную сортировку колонки
+            Q1, Q3 = np.quantile(data, [0.25, 0.75])
+            IQR = Q3 - Q1
+            
+            lower_bound = Q1 - 3 * IQR
+            upper_bound = Q3 + 3 * IQR
+            
+            outliers = np.count_nonzero((data < lower_bound) | (data > upper_bound))
+            if outliers > 0:
+                anomalies[col] = {
+                    'count': outliers,
+                    'percentage': (outliers / len(data)) * 100,
+                    'bounds': (lower_bound, upper_bound)
+                }
+        
+        kernel_missing = dict(zip(columns, (len(df) - valid_counts).tolist()))
+        missing = {
+            col: kernel_missing[col] if col in kernel_missing else int(df[col].isna().sum())
+            for col in df.columns
+        }
+        
+        return {
+            'violations': dict(zip(columns, violations.tolist())),
+            'missing': missing,
+            'anomalies': {col: anomalies[col] for col in self.numeric_columns if col in anomalies},
+        }
+    
+    def _report_value_ranges(self, counts: Dict[str, int], total: int):
+        """Ошибки и предупреждения по числу значений вне диапазона"""
+        for param, count in counts.items():
+            if count == 0:
                 continue
             
-            out_of_range = df[
-                (df[param] < min_val) | (df[param] > max_val)
-            ][param].dropna()
+            min_val, max_val = self.valid_ranges[param]
+            pct = (count / total) * 100
             
-            if len(out_of_range) > 0:
-                pct = (len(out_of_range) / len(df)) * 100
-                
-                if pct > 5:  # Более 5% - ошибка
-                    self.results['passed'] = False
-                    self.results['errors'].append(
-                        f"{param}: {len(out_of_range)} значений ({pct:.2f}%) "
-                        f"вне диапазона [{min_val}, {max_val}]"
-                    )
-                else:  # Менее 5% - предупреждение
-                    self.results['warnings'].append(
-                        f"{param}: {len(out_of_range)} значений ({pct:.2f}%) "
-                        f"вне диапазона [{min_val}, {max_val}]"
-                    )
-    
-    def _check_missing_values(self, df: pd.DataFrame):
-        """Проверка пропущенных значений"""
+            if pct > 5:  # Более 5% - ошибка
+                self.results['passed'] = False
+                self.results['errors'].append(
+                    f"{param}: {count} значений ({pct:.2f}%) "
+                    f"вне диапазона [{min_val}, {max_val}]"
+                )
+            else:  # Менее 5% - предупреждение
+                self.results['warnings'].append(
+                    f"{param}: {count} значений ({pct:.2f}%) "
+                    f"вне диапазона [{min_val}, {max_val}]"
+                )
+    
+    def _report_missing_values(self, missing: Dict[str, int], total: int):
+        """Ошибки и предупреждения по числу пропусков в обязательных колонках"""
         for col in self.required_columns:
-            if col not in df.columns:
+            if col not in missing or total == 0:
                 continue
             
-            missing_count = df[col].isna().sum()
-            missing_pct = (missing_count / len(df)) * 100
+            missing_count = missing[col]
+            missing_pct = (missing_count / total) * 100
             
             if missing_pct > 20:  # Более 20% пропусков - ошибка
                 self.results['passed'] = False
@@ -114,84 +187,74 @@ class DataValidator:
                     f"{col}: {missing_count} пропусков ({missing_pct:.2f}%)"
                 )
         
-        self.results['statistics']['missing_values'] = df.isna().sum().to_dict()
+        self.results['statistics']['missing_values'] = missing
     
     def _check_duplicates(self, df: pd.DataFrame):
         """Проверка дубликатов"""
         if 'city' in df.columns and 'date' in df.columns:
-            duplicates = df.duplicated(subset=['city', 'date'], keep=False).sum()
-            
-            if duplicates > 0:
-                pct = (duplicates / len(df)) * 100
-                self.results['warnings'].append(
-                    f"Найдено {duplicates} дубликатов ({pct:.2f}%)"
-                )
-                self.results['statistics']['duplicates'] = duplicates
+            self._report_duplicates(df.duplicated(subset=['city', 'date'], keep=False).sum(), len(df))
+    
+    def _report_duplicates(self, duplicates: int, total: int):
+        """Предупреждение о строках с повторяющимся ключом (city, date)"""
+        if duplicates > 0:
+            pct = (duplicates / total) * 100
+            self.results['warnings'].append(
+                f"Найдено {duplicates} дубликатов ({pct:.2f}%)"
+            )
+            self.results['statistics']['duplicates'] = duplicates
     
     def _check_date_continuity(self, df: pd.DataFrame):
         """Проверка непрерывности временного ряда"""
         if 'date' not in df.columns or 'city' not in df.columns:
             return
         
-        df_sorted = df.copy()
-        df_sorted['date'] = pd.to_datetime(df_sorted['date'])
+        # Одна сортировка по (город, дата) и разности соседних строк одного города
+        keys = pd.DataFrame({'city': df['city'].to_numpy(), 'date': pd.to_datetime(df['date']).to_numpy()})
+        keys = keys.sort_values(['city', 'date'], kind='mergesort', ignore_index=True)
         
-        gaps_by_city = {}
+        date_diff = keys['date'].diff()
+        large = keys['city'].eq(keys['city'].shift()) & (date_diff > pd.Timedelta(days=7))
         
-        for city in df_sorted['city'].unique():
-            city_data = df_sorted[df_sorted['city'] == city].sort_values('date')
-            
-            if len(city_data) < 2:
-                continue
-            
-            date_diff = city_data['date'].diff()
-            large_gaps = date_diff[date_diff > pd.Timedelta(days=7)]
-            
-            if len(large_gaps) > 0:
-                gaps_by_city[city] = len(large_gaps)
+        gaps = pd.DataFrame({
+            'city': keys['city'][large],
+            'start': keys['date'].shift()[large],
+            'end': keys['date'][large],
+        })
+        
+        gap_ranges = {}
+        grouped = dict(list(gaps.groupby('city', sort=False)))
+        # Порядок городов — как в исходных данных
+        for city in pd.unique(df['city']):
+            if city in grouped:
+                gap_ranges[city] = self._gap_list(grouped[city]['start'], grouped[city]['end'])
         
-        if gaps_by_city:
+        self._report_date_gaps(gap_ranges)
+    
+    @staticmethod
+    def _gap_list(starts, ends) -> List[Dict]:
+        """Промежутки: последнее время до и первое после, длина в днях"""
+        return [
+            {'start': start, 'end': end, 'days': (end - start) / pd.Timedelta(days=1)}
+            for start, end in zip(starts, ends)
+        ]
+    
+    def _report_date_gaps(self, gap_ranges: Dict[str, List[Dict]]):
+        """Предупреждение о промежутках больше 7 дней по городам"""
+        if gap_ranges:
+            gaps_by_city = {city: len(gaps) for city, gaps in gap_ranges.items()}
             self.results['warnings'].append(
                 f"Обнаружены временные промежутки >7 дней: {gaps_by_city}"
             )
             self.results['statistics']['temporal_gaps'] = gaps_by_city
+            self.results['statistics']['temporal_gap_ranges'] = gap_ranges
     
-    def _check_statistical_anomalies(self, df: pd.DataFrame):
-        """Проверка статистических аномалий"""
-        numeric_cols = ['pm25', 'pm10', 'no2', 'so2', 'o3']
-        anomalies = {}
-        
-        for col in numeric_cols:
-            if col not in df.columns:
-                continue
-            
-            data = df[col].dropna()
-            
-            if len(data) < 10:
-                continue
-            
-            # Метод IQR для поиска выбросов
-            Q1 = data.quantile(0.25)
-            Q3 = data.quantile(0.75)
-            IQR = Q3 - Q1
-            
-            lower_bound = Q1 - 3 * IQR
-            upper_bound = Q3 + 3 * IQR
-            
-            outliers = data[(data < lower_bound) | (data > upper_bound)]
-            
-            if len(outliers) > 0:
-                outlier_pct = (len(outliers) / len(data)) * 100
-                anomalies[col] = {
-                    'count': len(outliers),
-                    'percentage': outlier_pct,
-                    'bounds': (lower_bound, upper_bound)
-                }
-                
-                if outlier_pct > 10:
-                    self.results['warnings'].append(
-                        f"{col}: {len(outliers)} статистических выбросов ({outlier_pct:.2f}%)"
-                    )
+    def _report_outliers(self, anomalies: Dict[str, Dict]):
+        """Предупреждения о доле выбросов больше 10%"""
+        for col, info in anomalies.items():
+            if info['percentage'] > 10:
+                self.results['warnings'].append(
+                    f"{col}: {info['count']} статистических выбросов ({info['percentage']:.2f}%)"
+                )
         
         if anomalies:
             self.results['statistics']['outliers'] = anomalies
@@ -225,6 +288,153 @@ class DataValidator:
         return "\n".join(report)
 
 
+class StreamingValidator(DataValidator):
+    """
+    Потоковая валидация: данные подаются частями (пачками курсора MongoDB),
+    в памяти остаются только счётчики, 8-байтовые хэши ключей (city, date), границы
+    времени по дням и квантильные скетчи вместо точного IQR
+    """
+    
+    def __init__(self, relative_accuracy: float = 0.01):
+        super().__init__()
+        self.relative_accuracy = relative_accuracy
+        self._reset()
+    
+    def _reset(self):
+        self.total_rows = 0
+        self.column_rows = {}  # строк в частях, где колонка есть
+        self.missing = {}
+        self.range_violations = {}
+        self.seen_keys = np.empty(0, dtype=np.uint64)  # отсортированные хэши ключей
+        self.duplicate_keys = {}  # хэш ключа -> число строк с ним (от 2)
+        self.day_bounds = {}  # город -> {день: (первое, последнее время)}
+        self.sketches = {col: QuantileSketch(self.relative_accuracy) for col in self.numeric_columns}
+    
+    def update(self, df: pd.DataFrame):
+        """Учесть очередную часть данных"""
+        self.total_rows += len(df)
+        
+        for col in df.columns:
+            self.column_rows[col] = self.column_rows.get(col, 0) + len(df)
+            self.missing[col] = self.missing.get(col, 0) + int(df[col].isna().sum())
+        
+        for param, (min_val, max_val) in self.valid_ranges.items():
+            if param in df.columns:
+                violations = int(((df[param] < min_val) | (df[param] > max_val)).sum())
+                self.range_violations[param] = self.range_violations.get(param, 0) + violations
+        
+        for col, sketch in self.sketches.items():
+            if col in df.columns:
+                sketch.add(pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float))
+        
+        if 'city' in df.columns and 'date' in df.columns:
+            dates = pd.to_datetime(df['date'], cache=False)
+            keys = pd.DataFrame({'city': df['city'].to_numpy(), 'date': dates.to_numpy()})
+            self._update_duplicates(keys)
+            self._update_day_bounds(keys.dropna(subset=['date']))
+    
+    def _update_duplicates(self, keys: pd.DataFrame):
+        hashes, counts = np.unique(pd.util.hash_pandas_object(keys, index=False).to_numpy(), return_counts=True)
+        
+        positions = np.searchsorted(self.seen_keys, hashes)
+        seen = positions < len(self.seen_keys)
+        seen[seen] = self.seen_keys[positions[seen]] == hashes[seen]
+        
+        # Повторы внутри части или с уже встреченными ключами (обычно их мало)
+        repeated = seen | (counts > 1)
+        for key, count, was_seen in zip(hashes[repeated].tolist(), counts[repeated].tolist(),
+                                        seen[repeated].tolist()):
+            self.duplicate_keys[key] = self.duplicate_keys.get(key, 1 if was_seen else 0) + count
+        
+        self.seen_keys = np.union1d(self.seen_keys, hashes[~seen])
+    
+    def _update_day_bounds(self, keys: pd.DataFrame):
+        # Промежуток больше суток может быть только между последним временем
+        # одного дня и первым временем следующего непустого дня
+        for city in pd.unique(keys['city']):
+            self.day_bounds.setdefault(city, {})
+        
+        bounds = keys.groupby(['city', keys['date'].dt.floor('D')])['date'].agg(['min', 'max'])
+        for (city, day), first, last in zip(bounds.index, bounds['min'], bounds['max']):
+            days = self.day_bounds.setdefault(city, {})
+            if day in days:
+                first, last = min(first, days[day][0]), max(last, days[day][1])
+            days[day] = (first, last)
+    
+    def _date_gaps(self) -> Dict[str, List[Dict]]:
+        gap_ranges = {}
+        for city, days in self.day_bounds.items():
+            ordered = [days[day] for day in sorted(days)]
+            gaps = [
+                (last, first) for (_, last), (first, _) in zip(ordered, ordered[1:])
+                if first - last > pd.Timedelta(days=7)
+            ]
+            if gaps:
+                gap_ranges[city] = self._gap_list(*zip(*gaps))
+        return gap_ranges
+    
+    def _anomalies(self) -> Dict[str, Dict]:
+        anomalies = {}
+        for col, sketch in self.sketches.items():
+            if sketch.count < 10:
+                continue
+            
+            # Квартили по скетчу вместо точного IQR
+            Q1 = sketch.quantile(0.25)
+            Q3 = sketch.quantile(0.75)
+            IQR = Q3 - Q1
+            
+            lower_bound = Q1 - 3 * IQR
+            upper_bound = Q3 + 3 * IQR
+            
+            count = sketch.count_outside(lower_bound, upper_bound)
+            if count > 0:
+                anomalies[col] = {
+                    'count': count,
+                    'percentage': (count / sketch.count) * 100,
+                    'bounds': (lower_bound, upper_bound)
+                }
+        return anomalies
+    
+    def finalize(self) -> Dict:
+        """Итоговые результаты в формате validate_dataframe"""
+        self.results = self._new_results(self.total_rows)
+        total = self.total_rows
+        
+        # Колонка, отсутствующая в части данных, там считается пропущенной
+        missing = {col: count + total - self.column_rows[col] for col, count in self.missing.items()}
+        
+        self._report_structure(self.column_rows, total == 0)
+        self._report_value_ranges(self.range_violations, total)
+        self._report_missing_values(missing, total)
+        self._report_duplicates(sum(self.duplicate_keys.values()), total)
+        self._report_date_gaps(self._date_gaps())
+        self._report_outliers(self._anomalies())
+        return self.results
+    
+    def validate_chunks(self, chunks: Iterable[pd.DataFrame]) -> Dict:
+        """Валидация данных, поданных частями"""
+        self._reset()
+        for chunk in chunks:
+            self.update(chunk)
+        return self.finalize()
+
+
+def validate_raw_pipeline(db_manager) -> bool:
+    """
+    Потоковая валидация сырых почасовых данных прямо из курсора MongoDB
+    Возвращает True если валидация прошла успешно
+    """
+    validator = StreamingValidator()
+    
+    chunks = (chunk.rename(columns=RAW_FIELDS) for chunk in db_manager.iter_raw_data())
+    results = validator.validate_chunks(chunks)
+    
+    print(validator.generate_report())
+    
+    return results['passed']
+
+
 def validate_data_pipeline(db_manager) -> bool:
     """
     Валидация данных в конвейере обработки
@@ -243,4 +453,21 @@ def validate_data_pipeline(db_manager) -> bool:
     
     print(validator.generate_report())
     
-    return results['passed']
\ No newline at end of file
+    return results['passed']
+
+
+def main():
+    """Валидация clean_data или (с --raw) потоковая валидация сырых данных"""
+    parser = argparse.ArgumentParser(description="Валидация качества данных")
+    parser.add_argument("--raw", action="store_true", help="сырые почасовые данные, потоково")
+    args = parser.parse_args()
+    
+    db = DBManager()
+    passed = validate_raw_pipeline(db) if args.raw else validate_data_pipeline(db)
+    db.close()
+    
+    raise SystemExit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
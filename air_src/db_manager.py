@@ -1,59 +1,637 @@
 import pandas as pd
-from pymongo import MongoClient
-from datetime import datetime
-from config import MONGO_URI, DB_NAME, COLLECTION_RAW, COLLECTION_CLEAN
+import numpy as np
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from pymongo import MongoClient, UpdateOne, ReplaceOne, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from datetime import datetime, timezone
+from config import (
+    MONGO_URI, MONGO_MAX_POOL_SIZE, DB_NAME, COLLECTION_RAW, COLLECTION_CLEAN, COLLECTION_META,
+    LOAD_BATCH_SIZE, WRITE_CHUNK_SIZE, WRITE_WORKERS, RAW_TIMESERIES,
+    CLEAN_SNAPSHOT, SNAPSHOT_DIR
+)
+from clean_snapshot import read_snapshot, write_snapshot
+
+
+# Индексы коллекций: (имя, ключи, уникальный)
+RAW_INDEXES = [
+    ("city_time", [("city", ASCENDING), ("time", ASCENDING)], True),
+    ("time", [("time", ASCENDING)], False),
+    ("ingested_at", [("ingested_at", ASCENDING)], False),
+]
+CLEAN_INDEXES = [
+    ("city_date", [("city", ASCENDING), ("date", ASCENDING)], True),
+    ("date", [("date", ASCENDING)], False),
+]
+
+# Месячные статистики по clean_data: документ на (город, месяц)
+STATS_INDEX = ("city_month", [("city", ASCENDING), ("month", ASCENDING)], True)
+
+# Ключи метаданных: версия clean_data и версии статистик по ней
+CLEAN_VERSION = "clean_version"
+CLEAN_STATS_VERSION = "clean_stats_version"
+
+
+def _concat_chunks(chunks):
+    """
+    Склеить пачки одной колонки. Целое число в chunks — длина пачки,
+    где поле отсутствовало или было пустым: тип колонки определяют
+    остальные пачки, а пропуски заполняются NaN/NaT
+    """
+    arrays = [chunk for chunk in chunks if not isinstance(chunk, int)]
+    total = sum(chunk if isinstance(chunk, int) else len(chunk) for chunk in chunks)
+    if not arrays:
+        return np.full(total, np.nan)
+    
+    dtypes = {array.dtype for array in arrays}
+    has_gaps = len(arrays) < len(chunks)
+    
+    if len(dtypes) == 1:
+        dtype = arrays[0].dtype
+        if has_gaps and dtype.kind in "iub":
+            dtype = np.dtype(np.float64) if dtype.kind != "b" else np.dtype(object)
+    elif all(d.kind in "iuf" for d in dtypes):
+        dtype = np.dtype(np.float64)
+    else:
+        dtype = np.dtype(object)
+    
+    fill = np.datetime64("NaT") if dtype.kind == "M" else np.nan
+    return np.concatenate([
+        np.full(chunk, fill, dtype=dtype) if isinstance(chunk, int) else chunk.astype(dtype, copy=False)
+        for chunk in chunks
+    ])
+
+
+def chunked_records(df, datetime_columns=(), constants=None, chunk_size=WRITE_CHUNK_SIZE):
+    """
+    Записи датафрейма пачками по chunk_size.
+    Колонки дат приводятся один раз целиком, словари создаются только
+    для текущей пачки, constants добавляются в каждую запись
+    """
+    df = df.copy(deep=False)
+    for col in datetime_columns:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        if constants:
+            chunk = chunk.assign(**constants)
+        yield chunk.to_dict(orient="records")
+
+
+def iter_frames(cursor, batch_size=LOAD_BATCH_SIZE):
+    """Датафреймы по пачкам курсора MongoDB (без сборки в один)"""
+    cursor = iter(cursor)
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            return
+        
+        frame = pd.DataFrame(batch)
+        del batch
+        yield frame
+
+
+def frame_from_cursor(cursor, batch_size=LOAD_BATCH_SIZE):
+    """
+    Собрать датафрейм из курсора MongoDB по пачкам.
+    Каждая пачка сразу раскладывается в типизированные массивы колонок,
+    поэтому словари документов живут только в пределах одной пачки
+    """
+    chunks = {}
+    rows = 0
+    
+    for frame in iter_frames(cursor, batch_size):
+        for col in frame.columns:
+            values = frame[col]
+            column = chunks.setdefault(col, [rows] if rows else [])
+            column.append(len(values) if values.isna().all() else values.to_numpy())
+        
+        for col, column in chunks.items():
+            if col not in frame.columns:
+                column.append(len(frame))
+        
+        rows += len(frame)
+    
+    return pd.DataFrame({col: _concat_chunks(column) for col, column in chunks.items()})
 
 
 class DBManager:
     def __init__(self):
-        self.client = MongoClient(MONGO_URI)
+        self.client = MongoClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE)
         self.db = self.client[DB_NAME]
         self.raw_collection = self.db[COLLECTION_RAW]
         self.clean_collection = self.db[COLLECTION_CLEAN]
+        self.meta_collection = self.db[COLLECTION_META]
+        self.write_workers = WRITE_WORKERS
+        self.write_chunk_size = WRITE_CHUNK_SIZE
+        self.raw_timeseries = RAW_TIMESERIES
+        self.snapshot_dir = SNAPSHOT_DIR if CLEAN_SNAPSHOT else None
+        self._schema_ready = False
+        self._stats_ready = set()
+    
+    def _is_timeseries(self, name):
+        """Является ли коллекция time-series"""
+        info = next(iter(self.db.list_collections(filter={"name": name})), None)
+        return info is not None and info.get("type") == "timeseries"
+    
+    def _expected_indexes(self):
+        """Ожидаемые индексы по коллекциям"""
+        raw = RAW_INDEXES
+        if self.raw_timeseries:
+            # Time-series коллекции не поддерживают уникальные индексы
+            raw = [(name, keys, False) for name, keys, _ in RAW_INDEXES]
+        return {self.raw_collection: raw, self.clean_collection: CLEAN_INDEXES}
+    
+    def bootstrap(self):
+        """
+        Подготовить схему: при RAW_TIMESERIES создать raw_data как
+        time-series коллекцию, создать индексы и проверить их наличие
+        """
+        names = self.db.list_collection_names()
+        
+        if self.raw_timeseries:
+            if COLLECTION_RAW not in names:
+                self.db.create_collection(COLLECTION_RAW, timeseries={
+                    "timeField": "time",
+                    "metaField": "city",
+                    "granularity": "hours"
+                })
+            elif not self._is_timeseries(COLLECTION_RAW):
+                raise RuntimeError(
+                    "raw_data уже существует как обычная коллекция — очистите данные "
+                    "или отключите RAW_TIMESERIES"
+                )
+        
+        for collection, indexes in self._expected_indexes().items():
+            models = [IndexModel(keys, name=name, unique=unique) for name, keys, unique in indexes]
+            try:
+                collection.create_indexes(models)
+            except OperationFailure as e:
+                raise RuntimeError(
+                    f"Не удалось создать индексы {collection.name}: {e}. Если в коллекции "
+                    f"есть дубликаты — выполните полную загрузку с очисткой данных"
+                ) from e
+        
+        missing = self.verify_indexes()
+        if missing:
+            raise RuntimeError(f"Отсутствуют индексы: {missing}")
+        
+        self._schema_ready = True
+    
+    def verify_indexes(self):
+        """Список недостающих индексов в формате 'коллекция.индекс'"""
+        missing = []
+        for collection, indexes in self._expected_indexes().items():
+            existing = {
+                tuple(info["key"]): info.get("unique", False)
+                for info in collection.index_information().values()
+            }
+            for name, keys, unique in indexes:
+                key = tuple(keys)
+                if key not in existing or (unique and not existing[key]):
+                    missing.append(f"{collection.name}.{name}")
+        return missing
+    
+    def ensure_schema(self):
+        """Выполнить bootstrap один раз за время жизни менеджера"""
+        if not self._schema_ready:
+            self.bootstrap()
+    
+    def _write_chunks(self, chunks, write):
+        """
+        Записать пачки функцией write (возвращает число записанных документов).
+        При WRITE_WORKERS > 1 пачки пишутся параллельно, в очереди не больше
+        двух пачек на поток, чтобы не держать в памяти всю выгрузку
+        """
+        started = time.perf_counter()
+        written = 0
+        
+        if self.write_workers <= 1:
+            for records in chunks:
+                written += write(records)
+        else:
+            with ThreadPoolExecutor(max_workers=self.write_workers) as pool:
+                pending = set()
+                for records in chunks:
+                    if len(pending) >= self.write_workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        written += sum(future.result() for future in done)
+                    pending.add(pool.submit(write, records))
+                written += sum(future.result() for future in pending)
+        
+        seconds = time.perf_counter() - started
+        return {
+            "documents": written,
+            "seconds": seconds,
+            "docs_per_sec": written / seconds if seconds > 0 else 0.0
+        }
+    
+    @staticmethod
+    def _inserter(collection):
+        """Неупорядоченная вставка пачки"""
+        def write(records):
+            return len(collection.insert_many(records, ordered=False).inserted_ids)
+        return write
+    
+    @staticmethod
+    def _upserter(collection, key, replace=False):
+        """
+        Upsert пачки по ключевым полям key.
+        replace — заменять документ целиком, чтобы не оставались поля,
+        которых больше нет в новой записи
+        """
+        def write(records):
+            ops = [
+                ReplaceOne({field: rec[field] for field in key}, rec, upsert=True) if replace
+                else UpdateOne({field: rec[field] for field in key}, {"$set": rec}, upsert=True)
+                for rec in records
+            ]
+            result = collection.bulk_write(ops, ordered=False)
+            return result.upserted_count + result.modified_count
+        return write
     
     def save_raw_data(self, city, df):
         """Сохранить сырые данные в MongoDB"""
-        records = df.to_dict(orient="records")
-        for rec in records:
-            rec["city"] = city
-            rec["time"] = pd.to_datetime(rec["time"])
+        chunks = chunked_records(df, ["time"], {"city": city, "ingested_at": datetime.now(timezone.utc)},
+                                 self.write_chunk_size)
+        return self._write_chunks(chunks, self._inserter(self.raw_collection))
+    
+    def upsert_raw_data(self, city, df):
+        """Сохранить сырые данные с заменой по ключу (city, time)"""
+        self.ensure_schema()
         
-        if records:
-            self.raw_collection.insert_many(records)
+        if self.raw_timeseries:
+            # Time-series коллекция не поддерживает upsert: дописываются
+            # только часы новее последнего сохранённого
+            latest = self.get_latest_times().get(city)
+            if latest is not None:
+                df = df[pd.to_datetime(df["time"]) > latest]
+            return self.save_raw_data(city, df)
+        
+        chunks = chunked_records(df, ["time"], {"city": city, "ingested_at": datetime.now(timezone.utc)},
+                                 self.write_chunk_size)
+        return self._write_chunks(chunks, self._upserter(self.raw_collection, ["city", "time"]))
+    
+    def get_latest_times(self):
+        """Последняя сохранённая метка времени по каждому городу"""
+        # Сортировка по индексу (city, time) в обратном порядке + $first
+        # позволяют серверу взять по одному ключу индекса на город
+        pipeline = [
+            {"$sort": {"city": -1, "time": -1}},
+            {"$group": {"_id": "$city", "max_time": {"$first": "$time"}}}
+        ]
+        return {r["_id"]: r["max_time"] for r in self.raw_collection.aggregate(pipeline)}
+    
+    def get_touched_cities(self, since):
+        """Города с сырыми данными, записанными после since, и самое раннее их время"""
+        pipeline = [
+            {"$match": {"ingested_at": {"$gt": since}}},
+            {"$group": {"_id": "$city", "min_time": {"$min": "$time"}}}
+        ]
+        return {r["_id"]: r["min_time"] for r in self.raw_collection.aggregate(pipeline)}
+    
+    def get_valid_cities(self, min_hours):
+        """Города, у которых больше min_hours часов с измеренным PM2.5"""
+        pipeline = [
+            {"$match": {"pm2_5": {"$nin": [None, float("nan")]}}},
+            {"$group": {"_id": "$city", "hours": {"$sum": 1}}},
+            {"$match": {"hours": {"$gt": min_hours}}}
+        ]
+        return [r["_id"] for r in self.raw_collection.aggregate(pipeline)]
+    
+    def get_meta(self, key, default=None):
+        """Прочитать служебное значение (отметки запусков и т.п.)"""
+        doc = self.meta_collection.find_one({"_id": key})
+        return doc["value"] if doc else default
+    
+    def set_meta(self, key, value):
+        """Записать служебное значение"""
+        self.meta_collection.replace_one({"_id": key}, {"_id": key, "value": value}, upsert=True)
     
     def clear_collection(self, collection_name):
         """Очистить коллекцию"""
         if collection_name == "raw":
-            self.raw_collection.delete_many({})
+            if self.raw_timeseries:
+                # Удаление по произвольному фильтру в time-series ограничено,
+                # проще пересоздать коллекцию
+                self.raw_collection.drop()
+                self._schema_ready = False
+                self.bootstrap()
+            else:
+                self.raw_collection.delete_many({})
         elif collection_name == "clean":
             self.clean_collection.delete_many({})
+            self.bump_clean_version()
+    
+    @staticmethod
+    def _build_query(time_field, cities=None, start=None, end=None):
+        """Фильтр MongoDB по списку городов и диапазону дат (границы включительно)"""
+        query = {}
+        if cities is not None:
+            query["city"] = {"$in": list(cities)}
+        
+        time_range = {}
+        if start is not None:
+            time_range["$gte"] = pd.Timestamp(start).to_pydatetime()
+        if end is not None:
+            time_range["$lte"] = pd.Timestamp(end).to_pydatetime()
+        if time_range:
+            query[time_field] = time_range
+        
+        return query
+    
+    @staticmethod
+    def _build_projection(columns=None):
+        """Проекция MongoDB: только нужные колонки, без _id"""
+        projection = {"_id": 0}
+        if columns is not None:
+            projection.update({col: 1 for col in columns})
+        return projection
     
-    def load_raw_data(self):
-        """Загрузить все сырые данные"""
-        cursor = self.raw_collection.find({})
-        df = pd.DataFrame(list(cursor))
+    def load_raw_data(self, columns=None, cities=None, start=None, end=None):
+        """
+        Загрузить сырые данные.
+        columns — список полей (по умолчанию все), cities — список городов,
+        start/end — границы по времени включительно
+        """
+        query = self._build_query("time", cities, start, end)
+        cursor = self.raw_collection.find(query, self._build_projection(columns),
+                                          batch_size=LOAD_BATCH_SIZE)
+        df = frame_from_cursor(cursor)
         if not df.empty and '_id' in df.columns:
             df = df.drop('_id', axis=1)
         return df
     
+    def iter_raw_data(self, columns=None, cities=None, start=None, end=None, batch_size=LOAD_BATCH_SIZE):
+        """Сырые данные пачками датафреймов — для обработки без загрузки целиком"""
+        query = self._build_query("time", cities, start, end)
+        cursor = self.raw_collection.find(query, self._build_projection(columns), batch_size=batch_size)
+        return iter_frames(cursor, batch_size)
+    
     def save_clean_data(self, df):
         """Сохранить очищенные данные"""
         self.clean_collection.delete_many({})  # Очистить перед сохранением
-        records = df.to_dict(orient="records")
-        for rec in records:
-            rec["date"] = pd.to_datetime(rec["date"])
+        chunks = chunked_records(df, ["date"], chunk_size=self.write_chunk_size)
+        stats = self._write_chunks(chunks, self._inserter(self.clean_collection))
+        self.bump_clean_version()
+        return stats
+    
+    def upsert_clean_data(self, df):
+        """Сохранить очищенные данные с заменой по ключу (city, date)"""
+        self.ensure_schema()
+        
+        chunks = chunked_records(df, ["date"], chunk_size=self.write_chunk_size)
+        stats = self._write_chunks(chunks, self._upserter(self.clean_collection, ["city", "date"], replace=True))
+        self.bump_clean_version()
+        return stats
+    
+    def iter_clean_data(self, columns=None, batch_size=LOAD_BATCH_SIZE):
+        """Очищенные данные пачками датафреймов из MongoDB"""
+        cursor = self.clean_collection.find({}, self._build_projection(columns), batch_size=batch_size)
+        for frame in iter_frames(cursor, batch_size):
+            if 'date' in frame.columns:
+                frame['date'] = pd.to_datetime(frame['date'])
+            yield frame
+    
+    def load_clean_partitions(self, partitions, columns=None):
+        """Очищенные записи городов из partitions ({город: день или None}) начиная с этого дня"""
+        if not partitions:
+            return pd.DataFrame()
         
-        if records:
-            self.clean_collection.insert_many(records)
+        query = {"$or": [
+            {"city": city} if day is None else {"city": city, "date": {"$gte": pd.Timestamp(day).to_pydatetime()}}
+            for city, day in partitions.items()
+        ]}
+        cursor = self.clean_collection.find(query, self._build_projection(columns), batch_size=LOAD_BATCH_SIZE)
+        df = frame_from_cursor(cursor)
+        if not df.empty and 'date' in df.columns:
+            df['date'] = pd.to_datetime(df['date'])
+        return df
     
-    def load_clean_data(self):
-        """Загрузить очищенные данные"""
-        cursor = self.clean_collection.find({})
-        df = pd.DataFrame(list(cursor))
+    def stats_collection(self, name):
+        """Коллекция месячных статистик; уникальный индекс (city, month) создаётся при первом обращении"""
+        collection = self.db[name]
+        if name not in self._stats_ready:
+            index_name, keys, unique = STATS_INDEX
+            collection.create_index(keys, name=index_name, unique=unique)
+            self._stats_ready.add(name)
+        return collection
+    
+    def inc_stats(self, name, increments):
+        """
+        Прибавить приращения к месячным статистикам:
+        increments — {(город, начало месяца): {поле: приращение}}
+        """
+        ops = [
+            UpdateOne({"city": city, "month": pd.Timestamp(month).to_pydatetime()}, {"$inc": inc}, upsert=True)
+            for (city, month), inc in increments.items() if inc
+        ]
+        if ops:
+            self.stats_collection(name).bulk_write(ops, ordered=False)
+        return len(ops)
+    
+    def load_stats(self, name, cities=None, start=None, end=None):
+        """Документы месячных статистик (start/end — по началу месяца, включительно)"""
+        query = self._build_query("month", cities, start, end)
+        return list(self.stats_collection(name).find(query, {"_id": 0}))
+    
+    def clear_stats(self, name):
+        """Удалить месячные статистики"""
+        self.stats_collection(name).delete_many({})
+    
+    def has_values(self, field):
+        """Есть ли в сырых данных хотя бы одно измеренное значение поля"""
+        query = {field: {"$nin": [None, float("nan")]}}
+        return self.raw_collection.find_one(query, {"_id": 1}) is not None
+    
+    @staticmethod
+    def _clean_pipeline(columns, cities, partitions=None, outlier_columns=()):
+        """
+        Агрегационный конвейер сырых данных в дневные средние.
+        columns — {поле raw_data: имя в clean_data}, partitions — {город: день
+        или None}; для городов из partitions берутся часы начиная с этого дня
+        """
+        if partitions:
+            match = {"$or": [
+                {"city": city} if day is None else {"city": city, "time": {"$gte": day}}
+                for city, day in partitions.items() if city in cities
+            ]}
+        else:
+            match = {"city": {"$in": list(cities)}}
+        
+        # NaN не игнорируется $avg, поэтому заменяется на null
+        def measured(field):
+            return {"$cond": [{"$eq": [f"${field}", float("nan")]}, None, f"${field}"]}
+        
+        project = {"city": 1, "date": {"$dateTrunc": {"date": "$time", "unit": "day"}}}
+        project.update({name: measured(field) for field, name in columns.items()})
+        
+        group = {"_id": {"city": "$city", "date": "$date"}}
+        group.update({name: {"$avg": f"${name}"} for name in columns.values()})
+        
+        outliers = {
+            col: {"$gte": 0, "$lt": 5000}
+            for col in outlier_columns if col in columns.values()
+        }
+        
+        output = {"_id": 0, "city": "$_id.city", "date": "$_id.date"}
+        output.update({name: 1 for name in columns.values()})
+        
+        return [
+            {"$match": match},
+            {"$project": project},
+            {"$group": group},
+            {"$match": outliers},
+            {"$project": output},
+        ]
+    
+    def aggregate_clean_data(self, columns, cities, partitions=None, outlier_columns=(), merge=True):
+        """
+        Дневная агрегация на стороне MongoDB.
+        При merge=True результат записывается в clean_data через $merge
+        (без partitions коллекция перестраивается целиком, иначе заменяются
+        только дни начиная с указанных), при merge=False возвращается датафрейм
+        """
+        pipeline = self._clean_pipeline(columns, cities, partitions, outlier_columns)
+        
+        if not merge:
+            df = frame_from_cursor(self.raw_collection.aggregate(
+                pipeline, allowDiskUse=True, batchSize=LOAD_BATCH_SIZE
+            ))
+            if not df.empty:
+                df['date'] = pd.to_datetime(df['date'])
+            return df
+        
+        self.ensure_schema()
+        
+        if partitions:
+            for city, day in partitions.items():
+                query = {"city": city}
+                if day is not None:
+                    query["date"] = {"$gte": day}
+                self.clean_collection.delete_many(query)
+        else:
+            self.clean_collection.delete_many({})
+        
+        pipeline.append({"$merge": {
+            "into": self.clean_collection.name,
+            "on": ["city", "date"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }})
+        self.raw_collection.aggregate(pipeline, allowDiskUse=True)
+        self.bump_clean_version()
+        return self.clean_collection.count_documents({})
+    
+    def delete_clean_data(self, keys):
+        """Удалить очищенные записи по парам (city, date) из датафрейма keys"""
+        removed = 0
+        for city, dates in keys.groupby("city")["date"]:
+            result = self.clean_collection.delete_many({
+                "city": city,
+                "date": {"$in": [d.to_pydatetime() for d in pd.to_datetime(dates)]}
+            })
+            removed += result.deleted_count
+        if removed:
+            self.bump_clean_version()
+        return removed
+    
+    def bump_clean_version(self):
+        """Отметить изменение clean_data: локальные снимки становятся недействительными"""
+        version = uuid.uuid4().hex
+        self.set_meta(CLEAN_VERSION, version)
+        return version
+    
+    def get_clean_version(self):
+        """Текущая версия clean_data (None, если ещё не задана)"""
+        version = self.get_meta(CLEAN_VERSION)
+        return version if isinstance(version, str) else None
+    
+    def clean_stats_current(self, name):
+        """Соответствуют ли месячные статистики коллекции name текущей версии clean_data"""
+        version = self.get_clean_version()
+        return version is not None and self.get_meta(f"{CLEAN_STATS_VERSION}:{name}") == version
+    
+    def mark_clean_stats(self, name):
+        """Отметить, что статистики коллекции name пересчитаны по текущей версии clean_data"""
+        self.set_meta(f"{CLEAN_STATS_VERSION}:{name}", self.get_clean_version())
+    
+    def load_clean_data(self, columns=None, cities=None, start=None, end=None):
+        """
+        Загрузить очищенные данные.
+        columns — список полей (по умолчанию все), cities — список городов,
+        start/end — границы по дате включительно.
+        Если версия clean_data не менялась, данные читаются из локального снимка
+        """
+        if self.snapshot_dir is not None:
+            # Из снимка читаются и поля, по которым фильтруем
+            needed = None
+            if columns is not None:
+                needed = list(columns)
+                needed += [col for col, used in (("city", cities is not None),
+                                                 ("date", start is not None or end is not None))
+                           if used and col not in needed]
+            
+            df = self._load_clean_snapshot(needed)
+            if df is not None:
+                df = self._filter_frame(df, "date", cities, start, end)
+                if columns is not None:
+                    df = df[[col for col in columns if col in df.columns]]
+                return df
+        
+        return self._load_clean_from_db(columns, cities, start, end)
+    
+    def _load_clean_snapshot(self, columns=None):
+        """
+        Данные из снимка текущей версии; при его отсутствии снимок создаётся.
+        Повреждённый снимок (ArrowInvalid — подкласс ValueError) заменяется
+        новым из MongoDB
+        """
+        version = self.get_clean_version()
+        if version is None:
+            return None
+        
+        try:
+            df = read_snapshot(version, columns, self.snapshot_dir)
+        except (OSError, ValueError):
+            df = None
+        if df is not None:
+            return df
+        
+        df = self._load_clean_from_db()
+        if df.empty or not write_snapshot(version, df, self.snapshot_dir):
+            return None
+        if columns is not None:
+            df = df[[col for col in columns if col in df.columns]]
+        return df
+    
+    @staticmethod
+    def _filter_frame(df, time_field, cities=None, start=None, end=None):
+        """Те же фильтры, что и _build_query, но для датафрейма"""
+        mask = pd.Series(True, index=df.index)
+        if cities is not None and "city" in df.columns:
+            mask &= df["city"].isin(list(cities))
+        if start is not None:
+            mask &= df[time_field] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= df[time_field] <= pd.Timestamp(end)
+        return df if mask.all() else df[mask].reset_index(drop=True)
+    
+    def _load_clean_from_db(self, columns=None, cities=None, start=None, end=None):
+        """Загрузить очищенные данные из MongoDB"""
+        query = self._build_query("date", cities, start, end)
+        cursor = self.clean_collection.find(query, self._build_projection(columns),
+                                            batch_size=LOAD_BATCH_SIZE)
+        df = frame_from_cursor(cursor)
         if not df.empty:
             if '_id' in df.columns:
                 df = df.drop('_id', axis=1)
-            df['date'] = pd.to_datetime(df['date'])
+            if 'date' in df.columns:
+                df['date'] = pd.to_datetime(df['date'])
         return df
     
     def get_cities_count(self):
@@ -61,17 +639,11 @@ class DBManager:
         return len(self.raw_collection.distinct("city"))
     
     def get_date_range(self):
-        """Получить диапазон дат"""
-        pipeline = [
-            {"$group": {
-                "_id": None,
-                "min_date": {"$min": "$time"},
-                "max_date": {"$max": "$time"}
-            }}
-        ]
-        result = list(self.raw_collection.aggregate(pipeline))
-        if result:
-            return result[0]["min_date"], result[0]["max_date"]
+        """Получить диапазон дат (по индексу time)"""
+        first = self.raw_collection.find_one({}, {"time": 1}, sort=[("time", ASCENDING)])
+        last = self.raw_collection.find_one({}, {"time": 1}, sort=[("time", DESCENDING)])
+        if first and last:
+            return first["time"], last["time"]
         return None, None
     
     def close(self):
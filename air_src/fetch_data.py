@@ -2,27 +2,50 @@ import requests
 import pandas as pd
 from tqdm import tqdm
 import time
+from datetime import date, datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import correlation_stats
+import rollups
 from db_manager import DBManager
-from config import CITIES, START_DATE, END_DATE
+from rate_limiter import HostRateLimiter
+from geocache import GeocodeCache
+from config import (
+    CITIES, START_DATE, END_DATE, GEOCODE_LANGUAGE,
+    FETCH_MODE, INCREMENTAL_END_DATE, CLEAN_ENGINE, CHECK_CLEAN_PARITY,
+    GEOCODING_URL, AIR_QUALITY_URL, REQUEST_TIMEOUT,
+    FETCH_WORKERS, RATE_LIMITS, DEFAULT_RATE_LIMIT
+)
 
 
-def geocode_city(city: str):
-    """Получить координаты города"""
-    url = "https://geocoding-api.open-meteo.com/v1/search"
-    params = {"name": city, "count": 1, "language": "ru", "format": "json"}
-    r = requests.get(url, params=params)
+limiter = HostRateLimiter(RATE_LIMITS, DEFAULT_RATE_LIMIT)
+geocache = GeocodeCache()
+
+
+def http_get(url, params):
+    """GET-запрос с ограничением частоты по хосту"""
+    limiter.acquire(url)
+    return requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
+
+
+def geocode_city(city: str, language: str = GEOCODE_LANGUAGE):
+    """Получить координаты города (сначала из кэша)"""
+    cached = geocache.get(city, language)
+    if cached is not None:
+        return cached
+    
+    params = {"name": city, "count": 1, "language": language, "format": "json"}
+    r = http_get(GEOCODING_URL, params)
     
     if r.status_code != 200 or "results" not in r.json():
         return None, None
     
     result = r.json()["results"][0]
+    geocache.set(city, language, result["latitude"], result["longitude"])
     return result["latitude"], result["longitude"]
 
 
-def fetch_air_quality(lat, lon):
+def fetch_air_quality(lat, lon, start_date=START_DATE, end_date=END_DATE):
     """Получить данные о качестве воздуха"""
-    url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-    
     params = {
         "latitude": lat,
         "longitude": lon,
@@ -31,12 +54,12 @@ def fetch_air_quality(lat, lon):
             "nitrogen_dioxide", "sulphur_dioxide",
             "ozone", "dust", "uv_index", "ammonia"
         ]),
-        "start_date": START_DATE,
-        "end_date": END_DATE,
+        "start_date": start_date,
+        "end_date": end_date,
         "timezone": "auto"
     }
     
-    r = requests.get(url, params=params)
+    r = http_get(AIR_QUALITY_URL, params)
     data = r.json()
     
     if "hourly" not in data:
@@ -47,30 +70,111 @@ def fetch_air_quality(lat, lon):
     return df
 
 
-def process_and_clean_data(db: DBManager):
-    """Обработать и очистить данные"""
-    print("\n=== Обработка и очистка данных ===")
+def fetch_city(city: str, start_date=START_DATE, end_date=END_DATE):
+    """Загрузить данные одного города, замерив время"""
+    started = time.perf_counter()
+    result = {"city": city, "lat": None, "lon": None, "df": None, "error": None}
     
-    df = db.load_raw_data()
+    try:
+        lat, lon = geocode_city(city)
+        if lat is None:
+            result["error"] = "Не найден город"
+        else:
+            result["lat"], result["lon"] = lat, lon
+            result["df"] = fetch_air_quality(lat, lon, start_date, end_date)
+            if result["df"] is None:
+                result["error"] = "Нет данных по воздуху"
+    except requests.RequestException as e:
+        result["error"] = f"Ошибка запроса: {e}"
     
-    if df.empty:
-        print("Нет данных для обработки!")
-        return
+    result["latency"] = time.perf_counter() - started
+    return result
+
+
+def fetch_cities(cities, workers=FETCH_WORKERS, windows=None):
+    """
+    Параллельная загрузка городов, результаты по мере готовности.
+    windows — {город: (start_date, end_date)}, по умолчанию весь период
+    """
+    windows = windows or {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [
+            pool.submit(fetch_city, city, *windows.get(city, (START_DATE, END_DATE)))
+            for city in cities
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def incremental_windows(latest: dict, cities, end_date: str):
+    """
+    Периоды дозагрузки: с дня последнего сохранённого часа до end_date.
+    Последний день загружается заново: при прошлом запуске он мог быть
+    не закончен, и его часы — ещё не измерения, а прогноз (upsert по
+    (city, time) заменит их)
+    """
+    windows = {}
+    for city in cities:
+        last = latest.get(city)
+        if last is None:
+            start = START_DATE
+        else:
+            start = pd.Timestamp(last).strftime("%Y-%m-%d")
+        
+        if start <= end_date:
+            windows[city] = (start, end_date)
+    return windows
+
+
+# Переименование колонок API в короткие имена
+RAW_COLUMNS = {
+    "time": "datetime",
+    "pm2_5": "pm25",
+    "carbon_monoxide": "co",
+    "nitrogen_dioxide": "no2",
+    "sulphur_dioxide": "so2",
+    "ozone": "o3",
+    "dust": "dust",
+    "uv_index": "uv",
+    "ammonia": "nh3"
+}
+
+POLLUTANTS = ["pm25", "pm10", "no2", "so2", "o3", "co", "dust", "uv", "nh3"]
+OUTLIER_COLUMNS = ["pm25", "pm10", "no2", "so2", "o3"]
+
+# Минимум часов с измеренным PM2.5, чтобы город попал в очищенные данные
+MIN_VALID_HOURS = 10000
+
+CLEAN_WATERMARK = "clean_watermark"
+
+# Статистики, производные от clean_data: модули с reset(db) и apply_delta(db, df, sign).
+# Обновляются по разнице заменённых дней, без пересчёта по всей истории
+CLEAN_STATS = [correlation_stats, rollups]
+
+
+def aggregate_daily(df):
+    """Агрегация часовых данных по дням с удалением выбросов"""
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["datetime"]).dt.date
+    
+    agg = df.groupby(["city", "date"]).agg(
+        {col: "mean" for col in POLLUTANTS if col in df.columns}
+    ).reset_index()
+    
+    # Удаление выбросов
+    for col in OUTLIER_COLUMNS:
+        if col in agg.columns:
+            agg = agg[(agg[col] >= 0) & (agg[col] < 5000)]
     
+    return agg
+
+
+def build_clean_frame(df):
+    """Очистка сырых данных в pandas: переименование, фильтр городов, дневные средние"""
     print(f"Загружено строк: {len(df)}")
     
     # Переименование колонок
-    df = df.rename(columns={
-        "time": "datetime",
-        "pm2_5": "pm25",
-        "carbon_monoxide": "co",
-        "nitrogen_dioxide": "no2",
-        "sulphur_dioxide": "so2",
-        "ozone": "o3",
-        "dust": "dust",
-        "uv_index": "uv",
-        "ammonia": "nh3"
-    })
+    df = df.rename(columns=RAW_COLUMNS)
     
     # Удаление полностью пустых колонок
     df = df.dropna(axis=1, how='all')
@@ -80,7 +184,7 @@ def process_and_clean_data(db: DBManager):
     
     valid_cities = (
         df.groupby("city")["pm25"]
-        .apply(lambda x: x.notna().sum() > 10000)
+        .apply(lambda x: x.notna().sum() > MIN_VALID_HOURS)
     )
     
     valid_city_list = valid_cities[valid_cities].index.tolist()
@@ -91,70 +195,272 @@ def process_and_clean_data(db: DBManager):
     df = df[df["city"].isin(valid_city_list)]
     
     # Агрегация по дням
-    df["date"] = pd.to_datetime(df["datetime"]).dt.date
+    return aggregate_daily(df)
+
+
+def mongo_clean_columns(db: DBManager):
+    """Поля raw_data для агрегации на стороне MongoDB (без полностью пустых)"""
+    return {
+        field: name for field, name in RAW_COLUMNS.items()
+        if field != "time" and db.has_values(field)
+    }
+
+
+def collection_columns(db: DBManager, df):
+    """
+    Колонки df, непустые во всей коллекции raw_data, а не только в df.
+    Недостающие в df колонки добавляются пустыми — набор полей пересчитанных
+    дней совпадает с полной очисткой
+    """
+    fields = {name: field for field, name in RAW_COLUMNS.items()}
+    names = dict.fromkeys([*df.columns, *mongo_clean_columns(db).values()])
+    keep = [
+        name for name in names
+        if (name in df.columns and df[name].notna().any()) or db.has_values(fields.get(name, name))
+    ]
+    return df.reindex(columns=keep)
+
+
+def process_and_clean_data(db: DBManager, incremental=False, engine=CLEAN_ENGINE):
+    """Обработать и очистить данные"""
+    print("\n=== Обработка и очистка данных ===")
     
-    agg = df.groupby(["city", "date"]).agg({
-        "pm25": "mean",
-        "pm10": "mean",
-        "no2": "mean",
-        "so2": "mean",
-        "o3": "mean",
-        "co": "mean",
-        "dust": "mean",
-        "uv": "mean",
-        "nh3": "mean"
-    }).reset_index()
+    # Отметка берётся до чтения: данные, записанные во время очистки,
+    # попадут в следующий инкрементальный запуск
+    started = datetime.now(timezone.utc)
     
-    # Удаление выбросов
-    for col in ["pm25", "pm10", "no2", "so2", "o3"]:
-        if col in agg.columns:
-            agg = agg[(agg[col] >= 0) & (agg[col] < 5000)]
+    if incremental and db.get_meta(CLEAN_WATERMARK) is not None:
+        process_clean_increment(db, db.get_meta(CLEAN_WATERMARK), engine)
+        db.set_meta(CLEAN_WATERMARK, started)
+        return
+    
+    if engine == "mongo":
+        # Агрегация на сервере, в Python попадает только итоговое число строк
+        cities = db.get_valid_cities(MIN_VALID_HOURS)
+        print(f"Города с полноценными данными: {len(cities)}")
+        count = db.aggregate_clean_data(mongo_clean_columns(db), cities,
+                                        outlier_columns=OUTLIER_COLUMNS)
+        print(f"Получено строк после очистки: {count}")
+        rebuild_clean_stats(db)
+        db.set_meta(CLEAN_WATERMARK, started)
+        print("✔ Очищенные данные сохранены в MongoDB")
+        return
+    
+    df = db.load_raw_data()
+    
+    if df.empty:
+        print("Нет данных для обработки!")
+        return
+    
+    agg = build_clean_frame(df)
     
     print(f"Получено строк после очистки: {len(agg)}")
     
     # Сохранение в MongoDB
-    db.save_clean_data(agg)
-    print("✔ Очищенные данные сохранены в MongoDB")
+    stats = db.save_clean_data(agg)
+    rebuild_clean_stats(db, agg)
+    db.set_meta(CLEAN_WATERMARK, started)
+    print(f"✔ Очищенные данные сохранены в MongoDB ({stats['docs_per_sec']:.0f} док/с)")
+
+
+def rebuild_clean_stats(db: DBManager, df=None, modules=None):
+    """
+    Пересчитать статистики modules (по умолчанию все CLEAN_STATS) по всей
+    clean_data (df — уже готовые очищенные данные)
+    """
+    modules = CLEAN_STATS if modules is None else modules
+    if not modules:
+        return
+    for module in modules:
+        module.reset(db)
+    
+    frames = [df] if df is not None else db.iter_clean_data()
+    for frame in frames:
+        frame = frame.assign(date=pd.to_datetime(frame["date"]))
+        for module in modules:
+            module.apply_delta(db, frame, 1)
+    
+    for module in modules:
+        db.mark_clean_stats(module.COLLECTION)
+
+
+def update_clean_stats(db: DBManager, before, after, modules=None):
+    """Вычесть из статистик вклад заменённых дней (before) и прибавить новые (after)"""
+    modules = CLEAN_STATS if modules is None else modules
+    for module in modules:
+        module.apply_delta(db, before, -1)
+        module.apply_delta(db, after, 1)
+        db.mark_clean_stats(module.COLLECTION)
+
+
+def check_clean_parity(db: DBManager, rtol=1e-9):
+    """Сверить результат агрегации в MongoDB с агрегацией в pandas"""
+    print("\n=== Сверка движков очистки (pandas / mongo) ===")
+    
+    expected = build_clean_frame(db.load_raw_data())
+    cities = db.get_valid_cities(MIN_VALID_HOURS)
+    actual = db.aggregate_clean_data(mongo_clean_columns(db), cities,
+                                     outlier_columns=OUTLIER_COLUMNS, merge=False)
+    
+    def normalize(df):
+        df = df.assign(date=pd.to_datetime(df["date"]))
+        df = df[sorted(df.columns)]
+        return df.sort_values(["city", "date"]).reset_index(drop=True)
+    
+    try:
+        pd.testing.assert_frame_equal(normalize(expected), normalize(actual),
+                                      check_dtype=False, rtol=rtol)
+    except AssertionError as e:
+        print(f"✗ Результаты различаются:\n{e}")
+        return False
+    
+    print(f"✔ Результаты совпадают ({len(expected)} строк)")
+    return True
+
+
+def clean_partitions(db: DBManager, since):
+    """
+    С какого дня пересчитать каждый город: для городов с новыми сырыми
+    данными — с их самого раннего нового часа, для городов, впервые
+    набравших MIN_VALID_HOURS, — вся история (None)
+    """
+    valid = set(db.get_valid_cities(MIN_VALID_HOURS))
+    cleaned = set(db.clean_collection.distinct("city"))
+    touched = db.get_touched_cities(since)
+    
+    partitions = {}
+    for city in valid:
+        if city not in cleaned:
+            partitions[city] = None
+        elif city in touched:
+            partitions[city] = pd.Timestamp(touched[city]).normalize()
+    return partitions
 
 
-def main():
-    """Основная функция загрузки данных"""
+def process_clean_increment(db: DBManager, since, engine=CLEAN_ENGINE):
+    """Пересчитать дневные агрегаты только для затронутых (город, день)"""
+    partitions = clean_partitions(db, since)
+    
+    if not partitions:
+        print("Новых данных нет, очищенные данные актуальны")
+        return
+    
+    # Дни, которые будут заменены, — для вычитания их вклада из статистик.
+    # Статистики, отставшие от clean_data или ещё не построенные,
+    # пересчитываются целиком, а не дополняются разницей
+    current = [module for module in CLEAN_STATS if db.clean_stats_current(module.COLLECTION)]
+    stale = [module for module in CLEAN_STATS if module not in current]
+    before = db.load_clean_partitions(partitions) if current else None
+    
+    def refresh_stats():
+        if current:
+            update_clean_stats(db, before, db.load_clean_partitions(partitions), current)
+        rebuild_clean_stats(db, modules=stale)
+    
+    if engine == "mongo":
+        partitions = {
+            city: None if day is None else day.to_pydatetime()
+            for city, day in partitions.items()
+        }
+        db.aggregate_clean_data(mongo_clean_columns(db), list(partitions), partitions,
+                                outlier_columns=OUTLIER_COLUMNS)
+        refresh_stats()
+        print(f"✔ Пересчитаны дневные записи городов: {len(partitions)}")
+        return
+    
+    frames = [
+        db.load_raw_data(cities=[city], start=day)
+        for city, day in partitions.items()
+    ]
+    
+    df = pd.concat(frames, ignore_index=True).rename(columns=RAW_COLUMNS)
+    df = collection_columns(db, df)
+    print(f"Загружено новых строк: {len(df)} (городов: {len(partitions)})")
+    
+    if df.empty:
+        return
+    
+    agg = aggregate_daily(df)
+    written = db.upsert_clean_data(agg)["documents"]
+    
+    # Дни, которые после пересчёта отсеяны как выбросы, удаляются
+    days = df.assign(date=pd.to_datetime(df["datetime"]).dt.normalize())[["city", "date"]]
+    kept = agg.assign(date=pd.to_datetime(agg["date"]))[["city", "date"]]
+    dropped = days.drop_duplicates().merge(kept, how="left", indicator=True)
+    dropped = dropped[dropped["_merge"] == "left_only"]
+    removed = db.delete_clean_data(dropped[["city", "date"]]) if not dropped.empty else 0
+    refresh_stats()
+    
+    print(f"✔ Обновлено дневных записей: {written}, удалено: {removed}")
+
+
+def main(clear=None):
+    """
+    Основная функция загрузки данных.
+    clear — очищать ли данные в режиме "full"; None — спросить у пользователя
+    """
     db = DBManager()
+    incremental = FETCH_MODE == "incremental"
     
     print("=== Загрузка данных о качестве воздуха ===")
-    print(f"Период: {START_DATE} — {END_DATE}")
-    print(f"Городов: {len(CITIES)}\n")
-    
-    # Очистка старых данных
-    response = input("Очистить существующие данные? (y/n): ")
-    if response.lower() == 'y':
-        db.clear_collection("raw")
-        db.clear_collection("clean")
-        print("Данные очищены\n")
-    
-    # Загрузка данных по городам
-    for city in tqdm(CITIES, desc="Загрузка данных"):
-        print(f"\nГород: {city}")
+    
+    if incremental:
+        db.bootstrap()
         
-        lat, lon = geocode_city(city)
-        if lat is None:
-            print(f"Не найден город: {city}")
-            continue
+        # Дозагрузка недостающих часов и последнего сохранённого дня
+        end_date = INCREMENTAL_END_DATE or date.today().isoformat()
+        windows = incremental_windows(db.get_latest_times(), CITIES, end_date)
+        cities = [city for city in CITIES if city in windows]
+        print(f"Инкрементальный режим, до {end_date}")
+        print(f"Городов к дозагрузке: {len(cities)} / {len(CITIES)}\n")
+    else:
+        windows = None
+        cities = CITIES
+        print(f"Период: {START_DATE} — {END_DATE}")
+        print(f"Городов: {len(CITIES)}\n")
         
-        print(f"Координаты: {lat}, {lon}")
+        # Очистка старых данных
+        if clear is None:
+            clear = input("Очистить существующие данные? (y/n): ").lower() == 'y'
+        if clear:
+            db.clear_collection("raw")
+            db.clear_collection("clean")
+            print("Данные очищены\n")
         
-        df = fetch_air_quality(lat, lon)
-        if df is None:
-            print(f"Нет данных по воздуху: {city}")
-            continue
+        # Уникальные индексы создаются после очистки: дубликаты
+        # прежних загрузок без очистки не дают их построить
+        db.bootstrap()
+    
+    # Параллельная загрузка данных по городам
+    latencies = {}
+    results = fetch_cities(cities, FETCH_WORKERS, windows)
+    for res in tqdm(results, total=len(cities), desc="Загрузка данных"):
+        city = res["city"]
+        latencies[city] = res["latency"]
         
-        db.save_raw_data(city, df)
-        print(f"Сохранено в MongoDB: {len(df)} записей")
+        if res["error"]:
+            print(f"\n{res['error']}: {city}")
+            continue
         
-        time.sleep(0.5)
+        df = res["df"]
+        if not incremental and clear:
+            # Коллекция очищена — быстрая вставка без проверки ключей
+            stats = db.save_raw_data(city, df)
+        else:
+            # Уже сохранённые часы заменяются по (city, time)
+            stats = db.upsert_raw_data(city, df)
+        print(f"\n{city} ({res['lat']}, {res['lon']}): "
+              f"сохранено {len(df)} записей за {res['latency']:.1f} с "
+              f"(запись {stats['docs_per_sec']:.0f} док/с)")
+    
+    print("\n=== Время загрузки по городам ===")
+    for city, latency in sorted(latencies.items(), key=lambda x: -x[1]):
+        print(f"  {city}: {latency:.2f} с")
     
     # Обработка и очистка данных
-    process_and_clean_data(db)
+    process_and_clean_data(db, incremental=incremental)
+    if CHECK_CLEAN_PARITY:
+        check_clean_parity(db)
     
     # Статистика
     print("\n=== Итоговая статистика ===")
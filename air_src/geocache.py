@@ -0,0 +1,92 @@
+"""
+Постоянный кэш координат городов
+
+Запуск как скрипта очищает кэш (целиком или для перечисленных городов):
+    python air_src/geocache.py [город ...]
+"""
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from config import GEOCODE_CACHE, CITY_COORDS
+
+
+class GeocodeCache:
+    """JSON-кэш координат с ключом (город, язык)"""
+
+    def __init__(self, path: Path = GEOCODE_CACHE, pinned: dict = None):
+        self.path = Path(path)
+        self.pinned = CITY_COORDS if pinned is None else pinned
+        self.lock = threading.Lock()
+        self.entries = self._read()
+
+    @staticmethod
+    def _key(name: str, language: str) -> str:
+        return f"{language}:{name}"
+
+    def _read(self) -> dict:
+        """Прочитать кэш с диска"""
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Повреждённый кэш не должен ломать загрузку
+            return {}
+
+    def _write(self):
+        """Атомарно записать кэш на диск"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def get(self, name: str, language: str):
+        """Координаты из закреплённых или кэша, иначе None"""
+        if name in self.pinned:
+            lat, lon = self.pinned[name]
+            return lat, lon
+
+        with self.lock:
+            entry = self.entries.get(self._key(name, language))
+        if entry is None:
+            return None
+        return entry["latitude"], entry["longitude"]
+
+    def set(self, name: str, language: str, lat: float, lon: float):
+        """Сохранить координаты в кэш"""
+        with self.lock:
+            self.entries[self._key(name, language)] = {"latitude": lat, "longitude": lon}
+            self._write()
+
+    def invalidate(self, name: str = None, language: str = None) -> int:
+        """Удалить записи кэша (все, по городу и/или языку), вернуть их число"""
+        with self.lock:
+            keys = [
+                key for key in self.entries
+                if (language is None or key.split(":", 1)[0] == language)
+                and (name is None or key.split(":", 1)[1] == name)
+            ]
+            for key in keys:
+                del self.entries[key]
+            self._write()
+        return len(keys)
+
+
+def main():
+    cache = GeocodeCache()
+    cities = sys.argv[1:]
+
+    if cities:
+        removed = sum(cache.invalidate(city) for city in cities)
+    else:
+        removed = cache.invalidate()
+
+    print(f"Удалено записей из кэша координат: {removed}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Реестр моделей SARIMA: для каждого ряда хранятся выбранные порядки,
+оценённые параметры, отпечаток данных и дата подбора порядка,
+а также сам обученный результат SARIMAX для дообновления новыми днями
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+from datetime import date
+import pandas as pd
+from pathlib import Path
+from config import MODELS_DIR, ORDER_RESELECT_DAYS, FIT_DEGRADATION_TOL
+
+
+def series_key(param: str, city: str = None) -> str:
+    """Ключ ряда: загрязнитель и город (None — среднее по городам)"""
+    return f"{param}_{city or 'all'}"
+
+
+def series_fingerprint(series: pd.Series) -> str:
+    """Отпечаток ряда: даты и значения"""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(series, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """JSON-файл на каждый ряд в каталоге реестра"""
+
+    def __init__(self, directory: Path = MODELS_DIR):
+        self.directory = Path(directory)
+
+    def path(self, key: str) -> Path:
+        safe = re.sub(r"[^\w-]", "_", key)
+        return self.directory / f"{safe}.json"
+
+    def get(self, key: str):
+        """Запись реестра или None"""
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, entry: dict):
+        """Атомарно сохранить запись"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def results_path(self, key: str) -> Path:
+        return self.path(key).with_suffix(".pickle")
+
+    def save_results(self, key: str, res):
+        """Сохранить обученный результат SARIMAX вместе с данными"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.results_path(key)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load_results(self, key: str):
+        """Сохранённый результат SARIMAX или None"""
+        try:
+            with open(self.results_path(key), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+
+def order_is_stale(entry: dict, today: date = None, reselect_days: int = ORDER_RESELECT_DAYS) -> bool:
+    """Пора ли заново подбирать порядок по расписанию"""
+    today = today or date.today()
+    return (today - date.fromisoformat(entry["selected_at"])).days >= reselect_days
+
+
+def fit_degraded(entry: dict, mse: float, converged: bool = True, tol: float = FIT_DEGRADATION_TOL) -> bool:
+    """Ухудшилась ли подгонка с сохранённым порядком"""
+    if not converged:
+        return True
+    return mse > entry["mse"] * (1 + tol)
\ No newline at end of file
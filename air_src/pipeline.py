@@ -0,0 +1,258 @@
+"""
+Конвейер обновления: загрузка данных, затем независимые этапы анализа
+параллельно в пуле процессов.
+
+Этапы описаны как DAG (этап -> зависимости). Этап анализа пропускается,
+если хэш его входных данных (нужных колонок clean_data) и кода не изменился
+с прошлого успешного запуска.
+
+    python air_src/pipeline.py [--skip-fetch] [--clear] [--force] [--workers N]
+"""
+import argparse
+import ast
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+import pandas as pd
+import fetch_data
+from db_manager import DBManager
+from run_all import STAGES, stage_stats
+from config import PIPELINE_WORKERS, PIPELINE_STATE
+
+
+FETCH_STAGE = "fetch"
+
+
+def build_dag(stages=STAGES):
+    """DAG этапов: загрузка данных, от которой зависят все этапы анализа"""
+    dag = {FETCH_STAGE: {"deps": [], "module": None}}
+    for name, module in stages:
+        dag[name] = {"deps": [FETCH_STAGE], "module": module.__name__, "columns": module.COLUMNS,
+                     "stats_columns": getattr(module, "STATS_COLUMNS", module.COLUMNS)}
+    return dag
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """Хэш содержимого датафрейма (значения и имена колонок)"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(list(df.columns)).encode())
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def local_sources(path: Path) -> list:
+    """Файлы модуля и всех локальных модулей, которые он импортирует (транзитивно)"""
+    root = path.parent
+    seen, queue = set(), [path]
+    while queue:
+        current = queue.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        tree = ast.parse(current.read_bytes(), filename=str(current))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                candidate = root / (name.split(".")[0] + ".py")
+                if candidate.is_file():
+                    queue.append(candidate)
+    return sorted(seen)
+
+
+def stage_hash(module_name: str, df: pd.DataFrame, stats=None) -> str:
+    """
+    Хэш входов этапа: данные, накопленные статистики (аргументы run)
+    и исходный код модуля вместе с локальными импортами
+    """
+    module = importlib.import_module(module_name)
+    digest = hashlib.sha256(frame_hash(df).encode())
+    for key, value in sorted((stats or {}).items()):
+        digest.update(key.encode())
+        digest.update(frame_hash(value).encode())
+    for source in local_sources(Path(module.__file__)):
+        digest.update(source.name.encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def load_state(path: Path = PIPELINE_STATE) -> dict:
+    """Хэши входов успешно выполненных этапов"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict, path: Path = PIPELINE_STATE):
+    """Атомарно сохранить состояние конвейера"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def run_stage(module_name: str, df: pd.DataFrame, stats=None):
+    """Выполнить этап анализа в рабочем процессе, вернуть время и вывод"""
+    import matplotlib
+    matplotlib.use("Agg")
+    
+    # Этапы уже выполняются параллельно: графики этапа строятся в его же процессе
+    import charts
+    charts.limit_workers(1)
+    
+    module = importlib.import_module(module_name)
+    log = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        module.run(df, **(stats or {}))
+    return time.perf_counter() - started, log.getvalue()
+
+
+def stage_input(df: pd.DataFrame, columns) -> pd.DataFrame:
+    """Колонки clean_data, нужные этапу"""
+    return df.reindex(columns=[col for col in columns if col in df.columns])
+
+
+def run_pipeline(dag, fetch, load, workers=PIPELINE_WORKERS, force=False, state_path=PIPELINE_STATE,
+                 stats=None):
+    """
+    Выполнить DAG. fetch() — этап загрузки (в основном процессе),
+    load(columns) — загрузка колонок clean_data после него; этапы анализа
+    выполняются в пуле процессов по мере готовности зависимостей.
+    stats(module_name) — накопленные статистики этапа ({} — их нет): с ними
+    этап получает только колонки STATS_COLUMNS.
+    Возвращает {этап: (статус, секунды)}
+    """
+    state = {} if force else load_state(state_path)
+    results = {}
+    running = {}
+    scheduled = set()
+    df = None
+    inputs = {}
+    
+    def finish(name, status, seconds=0.0):
+        results[name] = (status, seconds)
+    
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        while len(results) < len(dag):
+            progressed = False
+            
+            for name, stage in dag.items():
+                if name in results or name in scheduled:
+                    continue
+                
+                deps = [results[dep][0] if dep in results else None for dep in stage["deps"]]
+                if None in deps:
+                    continue
+                
+                progressed = True
+                if any(status not in ("ok", "пропущен") for status in deps):
+                    finish(name, "не выполнен")
+                    continue
+                
+                if stage["module"] is None:
+                    started = time.perf_counter()
+                    try:
+                        fetch()
+                        finish(name, "ok", time.perf_counter() - started)
+                    except Exception as e:
+                        print(f"✗ Этап {name} завершился ошибкой: {e}")
+                        finish(name, "ошибка", time.perf_counter() - started)
+                    continue
+                
+                if df is None:
+                    # Статистики читаются после загрузки: они обновляются вместе с clean_data
+                    analysis = {other: node for other, node in dag.items() if node["module"] is not None}
+                    inputs = {other: stats(node["module"]) if stats else {} for other, node in analysis.items()}
+                    columns = []
+                    for other, node in analysis.items():
+                        needed = node["stats_columns"] if inputs[other] else node["columns"]
+                        columns += [col for col in needed if col not in columns]
+                    df = load(columns)
+                if df.empty:
+                    finish(name, "нет данных")
+                    continue
+                
+                data = stage_input(df, stage["stats_columns"] if inputs[name] else stage["columns"])
+                digest = stage_hash(stage["module"], data, inputs[name])
+                if state.get(name) == digest:
+                    finish(name, "пропущен")
+                    continue
+                
+                future = pool.submit(run_stage, stage["module"], data, inputs[name])
+                running[future] = (name, digest)
+                scheduled.add(name)
+            
+            if not running:
+                if not progressed and len(results) < len(dag):
+                    raise ValueError(f"Неразрешимые зависимости этапов: {set(dag) - set(results)}")
+                continue
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, digest = running.pop(future)
+                try:
+                    seconds, log = future.result()
+                except Exception as e:
+                    print(f"✗ Этап {name} завершился ошибкой: {e}")
+                    finish(name, "ошибка")
+                    continue
+                
+                print(f"\n{'=' * 20} {name} {'=' * 20}\n{log}")
+                finish(name, "ok", seconds)
+                state[name] = digest
+                save_state(state, state_path)
+    
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвейер обновления данных и анализа")
+    parser.add_argument("--skip-fetch", action="store_true", help="не загружать новые данные")
+    parser.add_argument("--force", action="store_true", help="выполнить все этапы заново")
+    parser.add_argument("--clear", action="store_true",
+                        help="в полном режиме загрузки очистить данные без вопроса")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS)
+    args = parser.parse_args()
+    
+    db = DBManager()
+    
+    def fetch():
+        if not args.skip_fetch:
+            # Очистка в полном режиме — только по --clear, иначе fetch_data спрашивает
+            fetch_data.main(clear=True if args.clear else None)
+    
+    def load(columns):
+        return db.load_clean_data(columns=columns)
+    
+    def stats(module_name):
+        return stage_stats(importlib.import_module(module_name), db)
+    
+    started = time.perf_counter()
+    results = run_pipeline(build_dag(), fetch, load, args.workers, args.force, stats=stats)
+    total = time.perf_counter() - started
+    
+    print("\n=== Этапы конвейера ===")
+    for name, (status, seconds) in results.items():
+        print(f"  {name}: {status}, {seconds:.2f} с")
+    print(f"Всего: {total:.2f} с")
+    
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Квантильный скетч с относительной точностью (по схеме DDSketch)
+"""
+import math
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Значения раскладываются по логарифмическим корзинам: оценка любого
+    квантиля отличается от точной не более чем на relative_accuracy
+    (относительно), память растёт как логарифм диапазона значений
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy должна быть в (0, 1)")
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value  # значения по модулю меньше считаются нулём
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _add_to_store(self, store: dict, values: np.ndarray):
+        if not len(values):
+            return
+        indexes, counts = np.unique(np.ceil(np.log(values) / self.log_gamma).astype(np.int64),
+                                    return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            store[index] = store.get(index, 0) + count
+
+    def add(self, values):
+        """Добавить массив значений (NaN пропускаются)"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        
+        self.count += len(values)
+        self.zeros += int((np.abs(values) < self.min_value).sum())
+        self._add_to_store(self.positive, values[values >= self.min_value])
+        self._add_to_store(self.negative, -values[values <= -self.min_value])
+
+    def merge(self, other: "QuantileSketch"):
+        """Добавить содержимое другого скетча с той же точностью"""
+        if other.gamma != self.gamma:
+            raise ValueError("скетчи с разной точностью")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def _buckets(self):
+        """Корзины по возрастанию значений: (представитель, число значений)"""
+        for index in sorted(self.negative, reverse=True):
+            yield -self._value(index), self.negative[index]
+        if self.zeros:
+            yield 0.0, self.zeros
+        for index in sorted(self.positive):
+            yield self._value(index), self.positive[index]
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля q"""
+        if not self.count:
+            return float("nan")
+        
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self._buckets():
+            seen += count
+            if seen > rank:
+                return value
+        return value
+
+    def count_outside(self, lower: float, upper: float) -> int:
+        """Оценка числа значений вне [lower, upper]"""
+        return sum(count for value, count in self._buckets() if value < lower or value > upper)
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+Ограничение частоты запросов к API (token bucket на каждый хост)
+"""
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Дождаться свободного токена, вернуть время ожидания в секундах"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+
+                delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+class HostRateLimiter:
+    """Набор token bucket'ов, по одному на хост"""
+
+    def __init__(self, limits: dict, default_rate: float):
+        self.limits = dict(limits)
+        self.default_rate = default_rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        """Получить bucket для хоста из URL"""
+        host = urlparse(url).hostname or ""
+        with self.lock:
+            if host not in self.buckets:
+                rate = self.limits.get(host, self.default_rate)
+                self.buckets[host] = TokenBucket(rate)
+            return self.buckets[host]
+
+    def acquire(self, url: str) -> float:
+        """Дождаться разрешения на запрос к хосту"""
+        return self.bucket(url).acquire()
\ No newline at end of file
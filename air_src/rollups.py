@@ -0,0 +1,89 @@
+"""
+Сводные таблицы clean_data по (город, месяц): сумма и число измеренных
+дней по каждому загрязнителю (sum.pm25, count.pm25 ...) в MongoDB.
+
+Суммы аддитивны и обновляются по разнице заменённых дней вместе
+со статистиками корреляций. Средние по городам, месяцам года и
+(город, месяц) считаются из сводной таблицы, размер которой зависит
+от числа городов и месяцев, а не от числа дневных записей.
+"""
+import numpy as np
+import pandas as pd
+from correlation_stats import month_start
+from config import COLLECTION_ROLLUP, ROLLUP_PARAMS
+
+
+COLLECTION = COLLECTION_ROLLUP
+
+
+def rollup_frame(df: pd.DataFrame, params=ROLLUP_PARAMS) -> pd.DataFrame:
+    """
+    Сводная таблица по дневным данным: city, period (начало месяца), year, month
+    и колонки <param>_sum, <param>_count
+    """
+    values = df.reindex(columns=params)
+    keys = [df["city"].rename("city"), month_start(df["date"]).rename("period")]
+    grouped = values.groupby(keys)
+    frame = pd.concat([grouped.sum().add_suffix("_sum"), grouped.count().astype(float).add_suffix("_count")], axis=1)
+    return with_calendar(frame.reset_index())
+
+
+def with_calendar(frame: pd.DataFrame) -> pd.DataFrame:
+    """Добавить год и номер месяца"""
+    return frame.assign(year=frame["period"].dt.year, month=frame["period"].dt.month)
+
+
+def means(rollup: pd.DataFrame, by, params=ROLLUP_PARAMS) -> pd.DataFrame:
+    """Средние загрязнителей по группам by (как groupby(by).mean() по дневным данным)"""
+    grouped = rollup.groupby(by)
+    sums = grouped[[f"{param}_sum" for param in params]].sum()
+    counts = grouped[[f"{param}_count" for param in params]].sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = sums.to_numpy() / counts.where(counts > 0).to_numpy()
+    return pd.DataFrame(values, index=sums.index, columns=list(params))
+
+
+def increments(df: pd.DataFrame, sign: int = 1) -> dict:
+    """Приращения $inc для документов (город, месяц)"""
+    result = {}
+    for row in rollup_frame(df).itertuples(index=False):
+        row = row._asdict()
+        result[(row["city"], row["period"])] = {
+            field: sign * float(row[f"{param}_{name}"])
+            for param in ROLLUP_PARAMS if row[f"{param}_count"]
+            for name, field in (("sum", f"sum.{param}"), ("count", f"count.{param}"))
+        }
+    return result
+
+
+def reset(db):
+    """Удалить сводную таблицу перед полным пересчётом"""
+    db.clear_stats(COLLECTION)
+
+
+def apply_delta(db, df: pd.DataFrame, sign: int = 1):
+    """Прибавить (sign=1) или вычесть (sign=-1) вклад дневных записей df"""
+    if df.empty:
+        return 0
+    return db.inc_stats(COLLECTION, increments(df, sign))
+
+
+def load_rollup(db, cities=None, start=None, end=None):
+    """
+    Сводная таблица из MongoDB в формате rollup_frame.
+    None — таблица отсутствует или отстала от clean_data
+    """
+    if not db.clean_stats_current(COLLECTION):
+        return None
+    docs = db.load_stats(COLLECTION, cities, start, end)
+    if not docs:
+        return None
+    
+    rows = []
+    for doc in docs:
+        row = {"city": doc["city"], "period": pd.Timestamp(doc["month"])}
+        for param in ROLLUP_PARAMS:
+            row[f"{param}_sum"] = doc.get("sum", {}).get(param, 0.0)
+            row[f"{param}_count"] = doc.get("count", {}).get(param, 0.0)
+        rows.append(row)
+    return with_calendar(pd.DataFrame(rows))
\ No newline at end of file
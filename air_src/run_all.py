@@ -0,0 +1,101 @@
+"""
+Запуск всех аналитических этапов за один проход:
+одно подключение к MongoDB, одна загрузка clean_data.
+Этапы с накопленными статистиками (load_stats) получают их вместо
+расчёта по всей истории и читают только колонки STATS_COLUMNS
+"""
+import time
+import analysis_overview
+import analysis_city_rankings
+import analysis_correlations
+import analysis_seasonality
+import sarima_forecast
+from db_manager import DBManager
+
+
+# Этапы анализа в порядке запуска
+STAGES = [
+    ("overview", analysis_overview),
+    ("city_rankings", analysis_city_rankings),
+    ("correlations", analysis_correlations),
+    ("seasonality", analysis_seasonality),
+    ("sarima_forecast", sarima_forecast),
+]
+
+
+def stage_stats(module, db) -> dict:
+    """
+    Накопленные статистики этапа из MongoDB — именованные аргументы run
+    (load_stats модуля). {} — у этапа их нет, они отсутствуют или устарели
+    """
+    load = getattr(module, "load_stats", None)
+    return (load(db) if load else None) or {}
+
+
+def input_columns(module, stats=None):
+    """Колонки clean_data для этапа: при готовых статистиках — только STATS_COLUMNS"""
+    return getattr(module, "STATS_COLUMNS", module.COLUMNS) if stats else module.COLUMNS
+
+
+def stage_columns(stages=STAGES, stats=None):
+    """Объединение колонок, нужных всем этапам; stats — {этап: статистики}"""
+    stats = stats or {}
+    columns = []
+    for name, module in stages:
+        columns += [col for col in input_columns(module, stats.get(name)) if col not in columns]
+    return columns
+
+
+def run_stages(df, stages=STAGES, stats=None):
+    """
+    Выполнить этапы на общем датафрейме, вернуть время каждого этапа.
+    stats — {этап: статистики}, передаются в run вместо расчёта по df
+    """
+    stats = stats or {}
+    timings = {}
+    
+    for name, module in stages:
+        print(f"\n{'=' * 20} {name} {'=' * 20}")
+        started = time.perf_counter()
+        
+        try:
+            # Каждый этап получает свою копию нужных колонок
+            columns = input_columns(module, stats.get(name))
+            module.run(df.reindex(columns=[col for col in columns if col in df.columns]), **stats.get(name, {}))
+            status = "ok"
+        except Exception as e:
+            print(f"✗ Этап {name} завершился ошибкой: {e}")
+            status = "ошибка"
+        
+        timings[name] = (time.perf_counter() - started, status)
+    
+    return timings
+
+
+def main():
+    db = DBManager()
+    
+    started = time.perf_counter()
+    # Этапы с актуальными статистиками в MongoDB не читают дневные данные целиком
+    stats = {name: stage_stats(module, db) for name, module in STAGES}
+    df = db.load_clean_data(columns=stage_columns(STAGES, stats))
+    load_time = time.perf_counter() - started
+    
+    if df.empty:
+        print("Нет данных! Сначала запустите fetch_data.py")
+        return
+    
+    print(f"Загружено строк: {len(df)} за {load_time:.2f} с")
+    
+    timings = run_stages(df, STAGES, stats)
+    
+    print("\n=== Время этапов ===")
+    print(f"  загрузка clean_data и статистик: {load_time:.2f} с")
+    for name, (seconds, status) in timings.items():
+        print(f"  {name}: {seconds:.2f} с ({status})")
+    
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,27 +1,50 @@
 import warnings
 warnings.filterwarnings("ignore")
 
+import argparse
+import contextlib
+import io
+import signal
+import time
+from datetime import date
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from pmdarima import auto_arima
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from db_manager import DBManager
-from config import OUTPUT
+from task_pool import run_tasks
+from model_registry import (
+    ModelRegistry, series_key, series_fingerprint, order_is_stale, fit_degraded
+)
+from config import (
+    OUTPUT, CITIES, FORECAST_MODE, FORECAST_POLLUTANTS, FORECAST_WORKERS, FORECAST_TASK_TIMEOUT,
+    FORECAST_ENGINE, FOURIER_TERMS
+)
+
+
+COLUMNS = ["date", "pm25"]
 
 
 def load_series(db):
     """Загрузить временной ряд PM2.5"""
-    df = db.load_clean_data()
+    return series_from_frame(db.load_clean_data(columns=COLUMNS))
+
+
+def series_from_frame(df, param="pm25", city=None):
+    """Дневной ряд загрязнителя: по одному городу или усреднённый по городам"""
+    if city is not None:
+        df = df[df["city"] == city]
     
     # Среднее по всем городам (daily)
-    grp = df.groupby("date")["pm25"].mean().reset_index()
+    grp = df.groupby("date")[param].mean().reset_index()
     grp = grp.sort_values("date")
     grp["date"] = pd.to_datetime(grp["date"])
     grp = grp.set_index("date").asfreq("D")
     
     # Интерполяция пропусков
-    grp["pm25"] = grp["pm25"].interpolate(method="time").ffill().bfill()
-    return grp["pm25"]
+    grp[param] = grp[param].interpolate(method="time").ffill().bfill()
+    return grp[param]
 
 
 def plot_timeseries(series):
@@ -57,20 +80,184 @@ def fit_auto_arima(series):
     return model
 
 
-def fit_sarimax(series, order, seasonal_order):
-    """Обучение модели SARIMAX"""
-    print(f"\n=== Обучение SARIMAX ===")
-    print(f"Order: {order}, Seasonal: {seasonal_order}")
-    
-    mod = SARIMAX(
+def build_sarimax(series, order, seasonal_order):
+    """Модель SARIMAX без оценки параметров"""
+    return SARIMAX(
         series,
         order=order,
         seasonal_order=seasonal_order,
         enforce_stationarity=False,
         enforce_invertibility=False
     )
+
+
+def fit_sarimax(series, order, seasonal_order, start_params=None):
+    """Обучение модели SARIMAX (start_params — начальное приближение оптимизатора)"""
+    print(f"\n=== Обучение SARIMAX ===")
+    print(f"Order: {order}, Seasonal: {seasonal_order}")
+    
+    mod = build_sarimax(series, order, seasonal_order)
+    if start_params is not None and len(start_params) != mod.k_params:
+        start_params = None
+    res = mod.fit(start_params=start_params, disp=False, maxiter=200)
+    print(res.summary())
+    return res
+
+
+def fit_model(series, key, registry=None, reselect=False):
+    """
+    Обучение модели с учётом реестра: сохранённый порядок переиспользуется,
+    а сохранённые параметры служат начальным приближением. Порядок подбирается
+    заново при reselect, по расписанию или при ухудшении подгонки.
+    Возвращает (результат SARIMAX, order, seasonal_order)
+    """
+    registry = registry or ModelRegistry()
+    entry = None if reselect else registry.get(key)
+    fingerprint = series_fingerprint(series)
+    res = None
+    
+    if entry is not None and not order_is_stale(entry):
+        order, seasonal_order = tuple(entry["order"]), tuple(entry["seasonal_order"])
+        
+        if entry["fingerprint"] == fingerprint:
+            # Данные не изменились — параметры уже оценены
+            print(f"\nДанные ряда {key} не изменились, используются сохранённые параметры")
+            return build_sarimax(series, order, seasonal_order).smooth(entry["params"]), order, seasonal_order
+        
+        res = fit_sarimax(series, order, seasonal_order, start_params=entry["params"])
+        if fit_degraded(entry, res.mse, res.mle_retvals.get("converged", True)):
+            print(f"\nПодгонка ряда {key} ухудшилась, порядок подбирается заново")
+            res = None
+    
+    if res is None:
+        auto = fit_auto_arima(series)
+        order, seasonal_order = tuple(auto.order), tuple(auto.seasonal_order)
+        res = fit_sarimax(series, order, seasonal_order)
+        # Базовая MSE для контроля деградации фиксируется при подборе порядка
+        entry = {"selected_at": date.today().isoformat(), "mse": float(res.mse)}
+    
+    registry.put(key, {
+        "order": list(order),
+        "seasonal_order": list(seasonal_order),
+        "params": res.params.tolist(),
+        "param_names": list(res.model.param_names),
+        "fingerprint": fingerprint,
+        "selected_at": entry["selected_at"],
+        "mse": entry["mse"],
+        "last_mse": float(res.mse),
+        "fitted_at": date.today().isoformat(),
+    })
+    return res, order, seasonal_order
+
+
+def fit_sarima(series):
+    """Подбор порядка и обучение SARIMA без реестра моделей"""
+    auto = fit_auto_arima(series)
+    return fit_sarimax(series, auto.order, auto.seasonal_order)
+
+
+def fourier_terms(index, periods=FOURIER_TERMS):
+    """Гармоники Фурье для дат index (фаза отсчитывается от фиксированной даты)"""
+    t = ((index - pd.Timestamp("1970-01-01")) / pd.Timedelta(days=1)).values
+    columns = {}
+    for period, harmonics in periods.items():
+        for k in range(1, harmonics + 1):
+            columns[f"sin_{period}_{k}"] = np.sin(2 * np.pi * k * t / period)
+            columns[f"cos_{period}_{k}"] = np.cos(2 * np.pi * k * t / period)
+    return pd.DataFrame(columns, index=index)
+
+
+class FourierResults:
+    """
+    Результат ARIMA с гармониками Фурье. get_forecast сам строит регрессоры
+    для будущих дат, остальное (plot_diagnostics, summary, ...) — от SARIMAX
+    """
+
+    def __init__(self, res, periods):
+        self.res = res
+        self.periods = periods
+
+    def get_forecast(self, steps):
+        last = self.res.fittedvalues.index[-1]
+        index = pd.date_range(last + pd.Timedelta(days=1), periods=steps, freq="D")
+        return self.res.get_forecast(steps=steps, exog=fourier_terms(index, self.periods))
+
+    def __getattr__(self, name):
+        if name == "res":
+            raise AttributeError(name)
+        return getattr(self.res, name)
+
+
+def fit_fourier(series, periods=FOURIER_TERMS):
+    """
+    ARIMA низкого порядка с месячной и годовой сезонностью в виде гармоник Фурье:
+    вместо сезонной модели с m=30 — несколько экзогенных регрессоров
+    """
+    print("\n=== Подбор ARIMA с гармониками Фурье ===")
+    exog = fourier_terms(series.index, periods)
+    
+    # Порядок подбирается по остаткам после МНК-регрессии на гармоники:
+    # auto_arima с экзогенными регрессорами в десятки раз медленнее
+    design = np.column_stack([np.ones(len(series)), exog.values])
+    coef = np.linalg.lstsq(design, series.values, rcond=None)[0]
+    auto = auto_arima(
+        series.values - design @ coef,
+        start_p=0, start_q=0,
+        max_p=3, max_q=3,
+        seasonal=False,
+        d=None,
+        trace=False,
+        error_action='ignore',
+        suppress_warnings=True,
+        stepwise=True,
+        information_criterion='aic'
+    )
+    print(f"Order: {auto.order}, гармоники: {periods}")
+    
+    mod = SARIMAX(
+        series,
+        exog=exog,
+        order=auto.order,
+        trend="c" if auto.order[1] == 0 else "n"
+    )
     res = mod.fit(disp=False, maxiter=200)
     print(res.summary())
+    return FourierResults(res, periods)
+
+
+# Движки прогноза для run(), пакетного режима и сравнения в backtest.py
+ENGINES = {
+    "sarima": fit_sarima,
+    "fourier": fit_fourier,
+}
+
+
+def update_model(series, key, registry=None):
+    """
+    Дополнить сохранённую модель новыми наблюдениями без переоценки параметров.
+    Возвращает результат SARIMAX или None, если нужно полное обучение
+    """
+    registry = registry or ModelRegistry()
+    entry = registry.get(key)
+    res = registry.load_results(key)
+    if entry is None or res is None:
+        print(f"\nСохранённой модели для {key} нет, нужно полное обучение")
+        return None
+    
+    # Уже учтённая часть ряда должна совпадать с данными, на которых обучена модель
+    last = res.fittedvalues.index[-1]
+    if series_fingerprint(series[series.index <= last]) != entry["fingerprint"]:
+        print(f"\nИстория ряда {key} изменилась, нужно полное обучение")
+        return None
+    
+    new = series[series.index > last]
+    print(f"\n=== Обновление SARIMAX: новых дней {len(new)} ===")
+    if new.empty:
+        return res
+    
+    res = res.append(new, refit=False)
+    registry.save_results(key, res)
+    registry.put(key, {**entry, "fingerprint": series_fingerprint(series), "fitted_at": date.today().isoformat()})
     return res
 
 
@@ -115,28 +302,37 @@ def forecast_and_plot(res, series, steps=365):
     return df_fore
 
 
-def main():
-    db = DBManager()
-    
-    # Загрузка данных
-    series = load_series(db)
+def run(df, reselect=False, mode=FORECAST_MODE, engine=FORECAST_ENGINE):
+    """
+    Подбор модели, диагностика и прогноз по очищенным данным.
+    mode="update" — дополнить сохранённую модель новыми днями без переобучения;
+    engine="fourier" — ARIMA с гармониками Фурье вместо SARIMA
+    """
+    series = series_from_frame(df)
     print(f"Длина временного ряда: {len(series)}")
     
     # График исходного ряда
     plot_timeseries(series)
     
-    # Подбор параметров
-    auto = fit_auto_arima(series)
-    order = auto.order
-    seasonal_order = auto.seasonal_order
-    
-    print(f"\nВыбранные параметры: order={order}, seasonal={seasonal_order}")
+    registry = ModelRegistry()
+    key = series_key("pm25")
+    res = None
     
-    # Обучение модели
-    res = fit_sarimax(series, order=order, seasonal_order=seasonal_order)
+    if engine != "sarima":
+        res = ENGINES[engine](series)
+        diagnostics_plot(res)
+    elif mode == "update" and not reselect:
+        res = update_model(series, key, registry)
     
-    # Диагностика
-    diagnostics_plot(res)
+    if res is None:
+        # Подбор параметров и обучение модели (с учётом реестра моделей)
+        res, order, seasonal_order = fit_model(series, key, registry, reselect=reselect)
+        registry.save_results(key, res)
+        
+        print(f"\nВыбранные параметры: order={order}, seasonal={seasonal_order}")
+        
+        # Диагностика
+        diagnostics_plot(res)
     
     # Прогноз на 2026 год
     df_fore = forecast_and_plot(res, series, steps=365)
@@ -149,8 +345,133 @@ def main():
     print(f"Средний прогноз: {df_fore['pm25_forecast'].mean():.2f} µg/m³")
     print(f"Зима 2026: {df_fore.iloc[:90]['pm25_forecast'].mean():.2f} µg/m³")
     print(f"Лето 2026: {df_fore.iloc[180:270]['pm25_forecast'].mean():.2f} µg/m³")
+
+
+class TaskTimeout(Exception):
+    """Превышено время на одну модель"""
+
+
+def _raise_timeout(signum, frame):
+    raise TaskTimeout()
+
+
+def forecast_task(city, param, series, steps=365, timeout=FORECAST_TASK_TIMEOUT, reselect=False,
+                  engine=FORECAST_ENGINE):
+    """
+    Подбор и обучение модели для одной пары (город, загрязнитель) в рабочем процессе.
+    Ошибки и превышение времени возвращаются в результате, а не пробрасываются
+    """
+    result = {"city": city, "param": param, "forecast": None, "error": None}
+    started = time.perf_counter()
+    
+    # Таймаут через SIGALRM: прерывает зависший подбор внутри рабочего процесса
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(int(timeout))
+    
+    try:
+        if series.isna().all() or len(series) < 60:
+            raise ValueError("недостаточно данных")
+        
+        # Подробный вывод подбора нужен для одиночной модели, в пакете он лишний
+        with contextlib.redirect_stdout(io.StringIO()):
+            if engine == "sarima":
+                res, order, seasonal_order = fit_model(series, series_key(param, city), reselect=reselect)
+            else:
+                res = ENGINES[engine](series)
+                order = res.model.order
+                seasonal_order = getattr(res.model, "seasonal_order", None)
+        
+        forecast_res = res.get_forecast(steps=steps)
+        conf = forecast_res.conf_int(alpha=0.05)
+        result["forecast"] = pd.DataFrame({
+            "city": city,
+            "param": param,
+            "date": pd.date_range(series.index.max() + pd.Timedelta(days=1), periods=steps, freq="D"),
+            "forecast": forecast_res.predicted_mean.values,
+            "lower": conf.iloc[:, 0].values,
+            "upper": conf.iloc[:, 1].values,
+            "engine": engine,
+            "order": str(order),
+            "seasonal_order": None if seasonal_order is None else str(seasonal_order),
+        })
+    except TaskTimeout:
+        result["error"] = f"превышено время {timeout} с"
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    finally:
+        if timeout:
+            signal.alarm(0)
+    
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def run_batch(df, cities=CITIES, pollutants=FORECAST_POLLUTANTS, workers=FORECAST_WORKERS,
+              timeout=FORECAST_TASK_TIMEOUT, steps=365, reselect=False, engine=FORECAST_ENGINE,
+              task=forecast_task):
+    """
+    Прогнозы по всем парам (город, загрязнитель) в пуле процессов.
+    Возвращает сводную таблицу прогнозов и список ошибок
+    """
+    cities = [city for city in cities if city in set(df["city"])]
+    pollutants = [param for param in pollutants if param in df.columns]
+    forecasts, errors = [], []
+    
+    calls = {
+        (city, param): (task, (city, param, series_from_frame(df, param, city), steps, timeout, reselect, engine))
+        for city in cities for param in pollutants
+    }
+    
+    # Аварийное завершение рабочего процесса не ломает остальные задачи (task_pool)
+    for done, ((city, param), res, error) in enumerate(run_tasks(calls, workers), 1):
+        if error:
+            res = {"error": error, "seconds": 0.0, "forecast": None}
+        
+        if res["error"]:
+            errors.append((city, param, res["error"]))
+            print(f"[{done}/{len(calls)}] ✗ {city} / {param}: {res['error']}")
+        else:
+            forecasts.append(res["forecast"])
+            print(f"[{done}/{len(calls)}] ✔ {city} / {param}: {res['seconds']:.1f} с")
     
+    columns = ["city", "param", "date", "forecast", "lower", "upper", "engine", "order", "seasonal_order"]
+    table = pd.concat(forecasts, ignore_index=True) if forecasts else pd.DataFrame(columns=columns)
+    return table.sort_values(["city", "param", "date"], ignore_index=True), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогноз SARIMA")
+    parser.add_argument("--mode", choices=["full", "update"], default=FORECAST_MODE,
+                        help="full — обучение модели, update — дополнение сохранённой модели новыми днями")
+    parser.add_argument("--engine", choices=list(ENGINES), default=FORECAST_ENGINE,
+                        help="sarima — SARIMA с m=30, fourier — ARIMA с гармониками Фурье")
+    parser.add_argument("--batch", action="store_true",
+                        help="прогноз по каждому городу и загрязнителю в пуле процессов")
+    parser.add_argument("--workers", type=int, default=FORECAST_WORKERS)
+    parser.add_argument("--reselect", action="store_true",
+                        help="подобрать порядки моделей заново, не используя реестр")
+    args = parser.parse_args()
+    
+    db = DBManager()
+    
+    if not args.batch:
+        # Загрузка данных
+        df = db.load_clean_data(columns=COLUMNS)
+        run(df, reselect=args.reselect, mode=args.mode, engine=args.engine)
+        db.close()
+        return
+    
+    df = db.load_clean_data(columns=["city", "date"] + FORECAST_POLLUTANTS)
     db.close()
+    
+    started = time.perf_counter()
+    table, errors = run_batch(df, workers=args.workers, reselect=args.reselect, engine=args.engine)
+    table.to_csv(OUTPUT / "forecast_batch.csv", index=False)
+    
+    print(f"\n✔ Моделей: {table.groupby(['city', 'param']).ngroups}, ошибок: {len(errors)}, "
+          f"время: {time.perf_counter() - started:.1f} с")
+    print(f"✔ Сводный прогноз сохранён в {OUTPUT / 'forecast_batch.csv'}")
 
 
 if __name__ == "__main__":
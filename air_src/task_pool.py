@@ -0,0 +1,75 @@
+"""
+Выполнение независимых задач в пуле процессов с защитой от аварийного
+завершения рабочего процесса (OOM, segfault).
+
+Сломанный ProcessPoolExecutor завершает ошибкой BrokenProcessPool все
+незавершённые задачи, поэтому одновременно в пул передаётся не больше
+workers задач. После поломки задачи, выполнявшиеся в этот момент,
+перезапускаются каждая в отдельном процессе — так находится виновная,
+а остальные продолжают выполняться в новом пуле.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+CRASH_ERROR = "рабочий процесс аварийно завершился"
+
+
+def _error(e: Exception) -> str:
+    return CRASH_ERROR if isinstance(e, BrokenProcessPool) else str(e) or type(e).__name__
+
+
+def run_alone(fn, args):
+    """Выполнить задачу в отдельном процессе: (результат, ошибка)"""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return pool.submit(fn, *args).result(), None
+        except Exception as e:
+            return None, _error(e)
+
+
+def run_tasks(calls: dict, workers=None):
+    """
+    Выполнить задачи {ключ: (функция, аргументы)}, выдавая (ключ, результат, ошибка)
+    по мере готовности. Исключение задачи или аварийное завершение её процесса
+    попадает в ошибку и не мешает остальным задачам
+    """
+    workers = max(1, workers or os.cpu_count())
+    queue = list(calls)
+    suspects = []
+    
+    while queue or suspects:
+        for key in suspects:
+            yield (key, *run_alone(*calls[key]))
+        suspects = []
+        if not queue:
+            break
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = {}
+            broken = False
+            while (queue or running) and not broken:
+                while queue and len(running) < workers:
+                    fn, args = calls[queue[0]]
+                    try:
+                        running[pool.submit(fn, *args)] = queue.pop(0)
+                    except BrokenProcessPool:
+                        broken = True
+                        break
+                if not running:
+                    break
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        yield key, future.result(), None
+                    except BrokenProcessPool:
+                        suspects.append(key)
+                        broken = True
+                    except Exception as e:
+                        yield key, None, _error(e)
+            
+            # Задачи, выполнявшиеся в сломанном пуле, тоже под подозрением
+            suspects.extend(running.values())
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Бенчмарк проверок колонок DataValidator: прежние отдельные проходы
+(диапазоны, пропуски, квартили по каждой колонке) против общего ядра
+_column_stats. Не запускается pytest, запуск вручную:
+
+    python tests/benchmark_validator.py [--rows N]
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
+
+from data_validator import DataValidator
+
+
+def legacy_column_checks(validator: DataValidator, df: pd.DataFrame) -> dict:
+    """Прежняя реализация: отдельный проход на каждую проверку и колонку"""
+    violations = {}
+    for param, (min_val, max_val) in validator.valid_ranges.items():
+        if param not in df.columns:
+            continue
+        out_of_range = df[(df[param] < min_val) | (df[param] > max_val)][param].dropna()
+        violations[param] = len(out_of_range)
+    
+    missing = df.isna().sum().to_dict()
+    
+    anomalies = {}
+    for col in validator.numeric_columns:
+        if col not in df.columns:
+            continue
+        data = df[col].dropna()
+        if len(data) < 10:
+            continue
+        Q1 = data.quantile(0.25)
+        Q3 = data.quantile(0.75)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - 3 * IQR
+        upper_bound = Q3 + 3 * IQR
+        outliers = data[(data < lower_bound) | (data > upper_bound)]
+        if len(outliers) > 0:
+            anomalies[col] = {
+                'count': len(outliers),
+                'percentage': (len(outliers) / len(data)) * 100,
+                'bounds': (lower_bound, upper_bound)
+            }
+    
+    return {'violations': violations, 'missing': missing, 'anomalies': anomalies}
+
+
+def synthetic_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Значения загрязнителей с пропусками, выбросами и значениями вне диапазона"""
+    rng = np.random.default_rng(seed)
+    validator = DataValidator()
+    columns = {}
+    for col, (_, max_val) in validator.valid_ranges.items():
+        values = rng.lognormal(0, 1, size=rows) * max_val / 20
+        values[rng.random(rows) < 0.05] = np.nan
+        values[rng.random(rows) < 0.001] = -1
+        columns[col] = values
+    return pd.DataFrame(columns)
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк проверок колонок DataValidator")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    
+    df = synthetic_frame(args.rows)
+    validator = DataValidator()
+    print(f"Строк: {len(df)}, колонок: {len(df.columns)}")
+    
+    legacy_time, legacy = best_of(lambda: legacy_column_checks(validator, df), args.repeat)
+    kernel_time, kernel = best_of(lambda: validator._column_stats(df), args.repeat)
+    
+    assert kernel == legacy, "результаты ядра отличаются от прежней реализации"
+    
+    print(f"Отдельные проходы: {legacy_time:.2f} с")
+    print(f"Общее ядро:        {kernel_time:.2f} с")
+    print(f"Ускорение:         {legacy_time / kernel_time:.1f}x, результаты совпадают")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
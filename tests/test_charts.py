@@ -0,0 +1,181 @@
+"""
+Тесты параллельного рендеринга графиков
+"""
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
+
+import charts
+
+
+class TestCharts(unittest.TestCase):
+    """Тесты chart/render_charts"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.series = pd.Series([30.0, 20.0, 10.0], index=pd.Index(['Москва', 'Тула', 'Сочи'], name='city'))
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _specs(self):
+        return [
+            charts.chart("bar", "bar.png", self.series, title="PM2.5", ylabel="мкг/м³", figsize=(6, 4)),
+            charts.chart("line", "line.png", self.series.reset_index(drop=True), grid=True, marker="o"),
+            charts.chart("heatmap", "heat.png", pd.DataFrame([[1.0, 0.5], [0.5, 1.0]]), annot=True, fmt=".2f"),
+        ]
+    
+    def test_render_in_pool(self):
+        """Графики строятся в пуле процессов, время возвращается по каждому файлу"""
+        timings = charts.render_charts(self._specs(), workers=2, directory=self.directory)
+        
+        self.assertEqual(set(timings), {"bar.png", "line.png", "heat.png"})
+        for filename, seconds in timings.items():
+            self.assertTrue((self.directory / filename).stat().st_size > 0)
+            self.assertGreaterEqual(seconds, 0)
+    
+    def test_failed_chart_isolated(self):
+        """Ошибка одного графика не мешает остальным"""
+        specs = self._specs() + [charts.chart("unknown", "bad.png", self.series)]
+        
+        timings = charts.render_charts(specs, workers=2, directory=self.directory)
+        
+        self.assertNotIn("bad.png", timings)
+        self.assertFalse((self.directory / "bad.png").exists())
+        self.assertEqual(len(timings), 3)
+    
+    def test_serial_mode(self):
+        """workers=1 — построение в текущем процессе"""
+        timings = charts.render_charts(self._specs()[:1], workers=1, directory=self.directory)
+        
+        self.assertEqual(list(timings), ["bar.png"])
+    
+    def test_worker_limit(self):
+        """При ограничении в 1 процесс пул не создаётся, даже если workers больше"""
+        charts.limit_workers(1)
+        self.addCleanup(charts.limit_workers, None)
+        
+        with patch.object(charts, "ProcessPoolExecutor", side_effect=AssertionError("вложенный пул")):
+            timings = charts.render_charts(self._specs(), workers=4, directory=self.directory)
+        
+        self.assertEqual(set(timings), {"bar.png", "line.png", "heat.png"})
+    
+    def test_unchanged_charts_skipped(self):
+        """Второй запуск с теми же данными ничего не перестраивает"""
+        charts.render_charts(self._specs(), workers=1, directory=self.directory)
+        manifest = charts.load_manifest(self.directory)
+        
+        timings = charts.render_charts(self._specs(), workers=1, directory=self.directory)
+        
+        self.assertEqual(timings, {})
+        self.assertEqual(set(manifest), {"bar.png", "line.png", "heat.png"})
+        self.assertEqual(charts.load_manifest(self.directory), manifest)
+    
+    def test_interleaved_manifest_writers(self):
+        """Запись второго этапа посреди записи первого не теряет ничьих записей"""
+        replace = os.replace
+        interrupted = []
+        
+        def interleaved(src, dst):
+            # Пока первый этап не заменил свой файл, второй записывает свои целиком
+            if not interrupted:
+                interrupted.append(src)
+                charts.update_manifest({"b.png": {"hash": "2"}}, self.directory)
+            replace(src, dst)
+        
+        with patch.object(charts.os, "replace", side_effect=interleaved):
+            charts.update_manifest({"a.png": {"hash": "1"}}, self.directory)
+        
+        self.assertEqual(charts.load_manifest(self.directory), {"a.png": {"hash": "1"}, "b.png": {"hash": "2"}})
+    
+    def test_stale_tmp_ignored(self):
+        """Временный файл прерванной записи не попадает в манифест"""
+        charts.update_manifest({"a.png": {"hash": "1"}}, self.directory)
+        self.directory.joinpath(charts.CHART_MANIFEST, "b.png.json.12345.tmp").write_text("{обрыв", encoding="utf-8")
+        
+        self.assertEqual(charts.load_manifest(self.directory), {"a.png": {"hash": "1"}})
+    
+    def test_changed_chart_rerendered(self):
+        """Перестраиваются только графики с изменившимися данными или оформлением и удалённые файлы"""
+        charts.render_charts(self._specs(), workers=1, directory=self.directory)
+        (self.directory / "heat.png").unlink()
+        self.series["Сочи"] = 15.0  # bar и line строятся по этому ряду
+        
+        timings = charts.render_charts(self._specs(), workers=1, directory=self.directory)
+        
+        self.assertEqual(set(timings), {"bar.png", "line.png", "heat.png"})
+        
+        retitled = [charts.chart("bar", "bar.png", self.series, title="PM2.5 (мкг/м³)", ylabel="мкг/м³", figsize=(6, 4))]
+        self.assertEqual(set(charts.render_charts(retitled, workers=1, directory=self.directory)), {"bar.png"})
+        self.assertEqual(set(charts.render_charts(retitled, workers=1, directory=self.directory, force=True)), {"bar.png"})
+    
+    def test_bar_labels_limited(self):
+        """У столбчатой диаграммы по сотням городов подписей не больше CHART_MAX_LABELS"""
+        import matplotlib.pyplot as plt
+        
+        many = pd.Series(range(500), index=[f"Город {i}" for i in range(500)], dtype=float)
+        fig, ax = plt.subplots()
+        charts._bar(ax, many)
+        
+        self.assertEqual(len(ax.patches), 500)
+        self.assertLessEqual(len(ax.get_xticklabels()), charts.CHART_MAX_LABELS)
+        self.assertEqual(ax.get_xticklabels()[0].get_text(), "Город 0")
+        plt.close(fig)
+
+
+
+class TestLargeScatter(unittest.TestCase):
+    """Тесты диаграмм рассеяния по большому числу строк"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame({'pm25': rng.gamma(2, 10, 5000), 'o3': rng.normal(50, 10, 5000)})
+        self.df.loc[::10, 'o3'] = np.nan
+    
+    def test_small_frame_kept(self):
+        """До порога строятся все точки"""
+        spec = charts.scatter_chart("s.png", self.df, "pm25", "o3", limit=10000, alpha=0.2)
+        
+        self.assertEqual(spec["kind"], "scatter")
+        self.assertEqual(len(spec["data"]), 5000)
+        self.assertEqual(spec["options"], {"x": "pm25", "y": "o3", "alpha": 0.2})
+    
+    def test_sample_bounded_and_stable(self):
+        """Выборка не больше порога и одинакова при повторном построении"""
+        first = charts.scatter_chart("s.png", self.df, "pm25", "o3", limit=500, mode="sample")
+        second = charts.scatter_chart("s.png", self.df, "pm25", "o3", limit=500, mode="sample")
+        
+        self.assertEqual(len(first["data"]), 500)
+        self.assertTrue(first["data"].index.is_monotonic_increasing)
+        self.assertEqual(charts.spec_hash(first), charts.spec_hash(second))
+    
+    def test_density_counts(self):
+        """Плотность — 2-D гистограмма по строкам без пропусков"""
+        spec = charts.scatter_chart("d.png", self.df, "pm25", "o3", limit=500, mode="density", alpha=0.2, title="t")
+        counts = spec["data"]
+        
+        self.assertEqual(spec["kind"], "density")
+        self.assertNotIn("alpha", spec["options"])
+        self.assertEqual(counts.shape, (charts.SCATTER_BINS, charts.SCATTER_BINS))
+        self.assertEqual(counts.to_numpy().sum(), self.df["o3"].notna().sum())
+        self.assertEqual((counts.index.name, counts.columns.name), ("o3", "pm25"))
+        
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(charts.render_chart(spec, Path(directory))["error"])
+    
+    def test_unknown_mode(self):
+        """Неизвестный режим — ошибка"""
+        with self.assertRaises(ValueError):
+            charts.scatter_chart("d.png", self.df, "pm25", "o3", limit=500, mode="hexagons")
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
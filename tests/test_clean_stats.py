@@ -0,0 +1,253 @@
+"""
+Тесты накопленных статистик clean_data: суммы для корреляций и сводные таблицы
+"""
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
+
+import analysis_city_rankings
+import analysis_correlations
+import analysis_overview
+import analysis_seasonality
+import correlation_stats
+import fetch_data
+import rollups
+
+
+class FakeStatsDB:
+    """Месячные статистики по коллекциям в памяти с семантикой $inc и clean_data в датафрейме"""
+    
+    def __init__(self, clean=None):
+        self.docs = {}
+        self.current = set()
+        self.clean = clean
+    
+    def inc_stats(self, name, increments):
+        docs = self.docs.setdefault(name, {})
+        for (city, month), inc in increments.items():
+            doc = docs.setdefault((city, pd.Timestamp(month)), {"city": city, "month": pd.Timestamp(month)})
+            for path, value in inc.items():
+                *parents, field = path.split(".")
+                node = doc
+                for key in parents:
+                    node = node.setdefault(key, {})
+                node[field] = node.get(field, 0.0) + value
+        return len(increments)
+    
+    def load_stats(self, name, cities=None, start=None, end=None):
+        return [
+            doc for (city, month), doc in self.docs.get(name, {}).items()
+            if (cities is None or city in cities)
+            and (start is None or month >= pd.Timestamp(start))
+            and (end is None or month <= pd.Timestamp(end))
+        ]
+    
+    def clear_stats(self, name):
+        self.docs.pop(name, None)
+    
+    def clean_stats_current(self, name):
+        return name in self.current
+    
+    def mark_clean_stats(self, name):
+        self.current.add(name)
+    
+    def load_clean_partitions(self, partitions, columns=None):
+        mask = pd.Series(False, index=self.clean.index)
+        for city, day in partitions.items():
+            mask |= (self.clean["city"] == city) & (day is None or self.clean["date"] >= pd.Timestamp(day))
+        return self.clean[mask]
+    
+    def iter_clean_data(self, columns=None):
+        yield self.clean
+
+
+def make_frame(days=120, cities=("Москва", "Тула"), seed=0):
+    """Дневные данные с пропусками и связанными загрязнителями"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=days)
+    df = pd.DataFrame({
+        "city": np.repeat(cities, days),
+        "date": np.tile(dates, len(cities)),
+    })
+    df["pm25"] = rng.gamma(2, 10, len(df))
+    df["pm10"] = df["pm25"] * 1.5 + rng.normal(0, 5, len(df))
+    df["o3"] = rng.normal(50, 10, len(df))
+    df.loc[rng.random(len(df)) < 0.2, "o3"] = np.nan
+    return df
+
+
+class TestCorrelationStats(unittest.TestCase):
+    """Тесты correlation_stats"""
+    
+    def setUp(self):
+        self.df = make_frame()
+        self.db = FakeStatsDB()
+    
+    def test_matches_pandas_corr(self):
+        """Матрица из сумм совпадает с DataFrame.corr по попарно полным строкам"""
+        correlation_stats.apply_delta(self.db, self.df)
+        self.db.mark_clean_stats(correlation_stats.COLLECTION)
+        
+        corr = correlation_stats.load_correlation(self.db)
+        expected = self.df[["pm25", "pm10", "o3"]].corr()
+        
+        self.assertEqual(list(corr.columns), ["pm25", "pm10", "o3"])
+        np.testing.assert_allclose(corr.to_numpy(), expected.to_numpy(), atol=1e-10)
+    
+    def test_city_and_window(self):
+        """Матрицы по городу и за период собираются из месячных документов"""
+        correlation_stats.apply_delta(self.db, self.df)
+        self.db.mark_clean_stats(correlation_stats.COLLECTION)
+        
+        window = correlation_stats.load_correlation(self.db, start="2024-02-01", end="2024-03-01")
+        by_city = correlation_stats.city_correlations(self.db)
+        
+        subset = self.df[(self.df["date"] >= "2024-02-01") & (self.df["date"] < "2024-04-01")]
+        np.testing.assert_allclose(window.to_numpy(), subset[["pm25", "pm10", "o3"]].corr().to_numpy(), atol=1e-10)
+        tula = self.df[self.df["city"] == "Тула"][["pm25", "pm10", "o3"]].corr()
+        np.testing.assert_allclose(by_city["Тула"].to_numpy(), tula.to_numpy(), atol=1e-10)
+    
+    def test_stale_stats_ignored(self):
+        """Статистики, не отмеченные для текущей версии clean_data, не используются"""
+        correlation_stats.apply_delta(self.db, self.df)
+        
+        self.assertIsNone(correlation_stats.load_correlation(self.db))
+        self.assertEqual(correlation_stats.city_correlations(self.db), {})
+    
+    def test_stage_stats_hook(self):
+        """Этап корреляций берёт актуальную матрицу из MongoDB и не берёт устаревшую"""
+        correlation_stats.apply_delta(self.db, self.df)
+        self.assertIsNone(analysis_correlations.load_stats(self.db))
+        
+        self.db.mark_clean_stats(correlation_stats.COLLECTION)
+        
+        pd.testing.assert_frame_equal(analysis_correlations.load_stats(self.db)["corr"],
+                                      correlation_stats.load_correlation(self.db))
+    
+    def test_delta_equals_rebuild(self):
+        """Замена дней через вычитание и прибавление даёт те же суммы, что полный пересчёт"""
+        fetch_data.rebuild_clean_stats(self.db, self.df)
+        
+        changed = (self.df["city"] == "Москва") & (self.df["date"] >= "2024-03-15")
+        before = self.df[changed]
+        after = before.assign(pm25=before["pm25"] * 2, o3=np.nan).iloc[:-5]
+        updated = pd.concat([self.df[~changed], after], ignore_index=True)
+        
+        fetch_data.update_clean_stats(self.db, before, after)
+        
+        expected = FakeStatsDB()
+        fetch_data.rebuild_clean_stats(expected, updated)
+        for field in correlation_stats.FIELDS:
+            np.testing.assert_allclose(
+                correlation_stats.sum_documents(self.db.load_stats(correlation_stats.COLLECTION))[field],
+                correlation_stats.sum_documents(expected.load_stats(correlation_stats.COLLECTION))[field],
+                atol=1e-6
+            )
+        np.testing.assert_allclose(
+            correlation_stats.load_correlation(self.db).to_numpy(),
+            updated[["pm25", "pm10", "o3"]].corr().to_numpy(), atol=1e-10
+        )
+
+
+    
+    def test_missing_stats_rebuilt_not_patched(self):
+        """
+        Статистика без отметки (например, новая сводная таблица) при инкрементальной
+        очистке пересчитывается целиком, остальные обновляются разницей
+        """
+        changed = (self.df["city"] == "Москва") & (self.df["date"] >= "2024-03-15")
+        updated = pd.concat([self.df[~changed], self.df[changed].assign(pm25=1.0)], ignore_index=True)
+        
+        db = FakeStatsDB(self.df)
+        correlation_stats.apply_delta(db, self.df)
+        db.mark_clean_stats(correlation_stats.COLLECTION)
+        
+        def aggregate(*args, **kwargs):
+            db.clean = updated
+        db.aggregate_clean_data = aggregate
+        
+        partitions = {"Москва": pd.Timestamp("2024-03-15")}
+        with patch.object(fetch_data, "clean_partitions", return_value=partitions), \
+                patch.object(fetch_data, "mongo_clean_columns", return_value={}):
+            fetch_data.process_clean_increment(db, since=None, engine="mongo")
+        
+        loaded = rollups.load_rollup(db).sort_values(["city", "period"]).reset_index(drop=True)
+        expected = rollups.rollup_frame(updated)
+        np.testing.assert_allclose(loaded["pm25_sum"], expected["pm25_sum"])
+        np.testing.assert_allclose(loaded["pm25_count"], expected["pm25_count"])
+        np.testing.assert_allclose(
+            correlation_stats.load_correlation(db).to_numpy(),
+            updated[["pm25", "pm10", "o3"]].corr().to_numpy(), atol=1e-10
+        )
+
+class TestRollups(unittest.TestCase):
+    """Тесты сводных таблиц по (город, месяц)"""
+    
+    def setUp(self):
+        self.df = make_frame(days=400)
+        self.db = FakeStatsDB()
+    
+    def test_means_match_groupby(self):
+        """Средние из сводной таблицы совпадают со средними по дневным данным"""
+        rollup = rollups.rollup_frame(self.df)
+        df = self.df.assign(month=self.df["date"].dt.month)
+        params = ["pm25", "pm10", "o3"]
+        
+        for by in ("city", "month", ["city", "month"]):
+            pd.testing.assert_frame_equal(rollups.means(rollup, by)[params], df.groupby(by)[params].mean(),
+                                          check_names=False)
+        self.assertTrue(rollups.means(rollup, "city")["co"].isna().all())
+    
+    def test_delta_equals_rebuild(self):
+        """Сводная таблица в MongoDB после замены дней совпадает с построенной заново"""
+        fetch_data.rebuild_clean_stats(self.db, self.df)
+        
+        changed = (self.df["city"] == "Тула") & (self.df["date"] >= "2024-12-20")
+        before = self.df[changed]
+        after = before.assign(pm10=before["pm10"] + 100).iloc[::2]
+        updated = pd.concat([self.df[~changed], after], ignore_index=True)
+        fetch_data.update_clean_stats(self.db, before, after)
+        
+        loaded = rollups.load_rollup(self.db).sort_values(["city", "period"]).reset_index(drop=True)
+        expected = rollups.rollup_frame(updated)
+        columns = [col for col in expected.columns if col.endswith(("_sum", "_count"))]
+        self.assertEqual(len(loaded), len(expected))
+        np.testing.assert_allclose(loaded[columns].to_numpy(), expected[columns].to_numpy(), atol=1e-8)
+        self.assertEqual(list(loaded["month"]), list(expected["month"]))
+    
+    def test_stale_rollup_ignored(self):
+        """Сводная таблица, отставшая от clean_data, не используется"""
+        rollups.apply_delta(self.db, self.df)
+        
+        self.assertIsNone(rollups.load_rollup(self.db))
+    
+    def test_stage_stats_hooks(self):
+        """Этапы берут актуальную сводную таблицу из MongoDB, дата им при этом не нужна"""
+        stages = [analysis_city_rankings, analysis_overview, analysis_seasonality]
+        self.assertEqual([stage.load_stats(self.db) for stage in stages], [None] * 3)
+        
+        fetch_data.rebuild_clean_stats(self.db, self.df)
+        
+        for stage in stages:
+            self.assertEqual(len(stage.load_stats(self.db)["rollup"]), len(rollups.rollup_frame(self.df)))
+            self.assertNotIn("date", stage.STATS_COLUMNS)
+    
+    def test_rankings_from_rollup_only(self):
+        """Рейтинг городов строится по сводной таблице без дневных данных"""
+        rollup = rollups.rollup_frame(self.df.assign(no2=1.0, so2=2.0))
+        
+        with patch.object(analysis_city_rankings, "render_charts", return_value={}) as render:
+            analysis_city_rankings.run(None, rollup)
+        
+        bars = {spec["filename"]: spec["data"] for spec in render.call_args[0][0]}
+        expected = self.df.groupby("city")["pm25"].mean().sort_values(ascending=False)
+        pd.testing.assert_series_equal(bars["pm25_by_city.png"], expected, check_names=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -9,7 +9,8 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
 
-from air_src.data_validator import DataValidator
+from air_src.data_validator import DataValidator, StreamingValidator
+from quantile_sketch import QuantileSketch
 
 
 class TestDataValidator(unittest.TestCase):
@@ -100,6 +101,177 @@ class TestDataValidator(unittest.TestCase):
         self.assertIsInstance(report, str, "Отчет должен быть строкой")
         self.assertIn("ОТЧЕТ О КАЧЕСТВЕ ДАННЫХ", report, "Отчет должен содержать заголовок")
         self.assertGreater(len(report), 50, "Отчет должен быть содержательным")
+    
+    def test_gap_ranges(self):
+        """Промежутки >7 дней: число, границы и длина по каждому городу"""
+        df = pd.DataFrame({
+            'city': ['Тула', 'Москва', 'Тула', 'Москва', 'Тула', 'Москва', 'Тула'],
+            'date': pd.to_datetime(['2023-01-20', '2023-01-01', '2023-01-01', '2023-01-05',
+                                    '2023-01-02', '2023-01-06', '2023-02-01']),
+            'pm25': 10.0
+        })
+        
+        results = self.validator.validate_dataframe(df)
+        
+        self.assertEqual(results['statistics']['temporal_gaps'], {'Тула': 2})
+        self.assertIn("Обнаружены временные промежутки >7 дней: {'Тула': 2}", results['warnings'])
+        self.assertEqual(results['statistics']['temporal_gap_ranges']['Тула'], [
+            {'start': pd.Timestamp('2023-01-02'), 'end': pd.Timestamp('2023-01-20'), 'days': 18.0},
+            {'start': pd.Timestamp('2023-01-20'), 'end': pd.Timestamp('2023-02-01'), 'days': 12.0},
+        ])
+    
+    def test_column_stats_match_per_column_checks(self):
+        """Общее ядро даёт те же счётчики и границы, что и проверки по колонкам"""
+        rng = np.random.default_rng(4)
+        df = pd.DataFrame({
+            'city': 'Москва',
+            'pm25': rng.lognormal(2, 1, 500),
+            'pm10': rng.integers(-5, 1200, 500),
+            'uv': rng.uniform(0, 20, 500)
+        })
+        df.loc[::7, 'pm25'] = np.nan
+        
+        stats = self.validator._column_stats(df)
+        
+        self.assertEqual(stats['violations'], {'pm25': 0, 'pm10': int(((df['pm10'] < 0) | (df['pm10'] > 1000)).sum()),
+                                               'uv': int((df['uv'] > 15).sum())})
+        self.assertEqual(stats['missing'], df.isna().sum().to_dict())
+        self.assertNotIn('uv', stats['anomalies'])
+        
+        data = df['pm25'].dropna()
+        Q1, Q3 = data.quantile(0.25), data.quantile(0.75)
+        bounds = (Q1 - 3 * (Q3 - Q1), Q3 + 3 * (Q3 - Q1))
+        count = int(((data < bounds[0]) | (data > bounds[1])).sum())
+        self.assertEqual(stats['anomalies']['pm25'], {
+            'count': count, 'percentage': count / len(data) * 100, 'bounds': bounds
+        })
+    
+    def test_column_stats_nullable_dtypes(self):
+        """Колонки Int64/Float64 с pd.NA считаются как обычные с NaN"""
+        df = pd.DataFrame({
+            'city': 'Москва',
+            'pm25': pd.array([10.0, None, 20.0, 600.0], dtype='Float64'),
+            'pm10': pd.array([5, None, -1, 30], dtype='Int64')
+        })
+        
+        stats = self.validator._column_stats(df)
+        expected = self.validator._column_stats(df.astype({'pm25': float, 'pm10': float}))
+        
+        self.assertEqual(stats, expected)
+        self.assertEqual(stats['missing']['pm10'], 1)
+        self.assertEqual(stats['violations'], {'pm25': 1, 'pm10': 1})
+
+
+class TestStreamingValidator(unittest.TestCase):
+    """Тесты потоковой валидации по частям"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        dates = pd.date_range('2023-01-01', periods=200)
+        # У Тулы пропущены две недели — промежуток больше 7 дней
+        dates_tula = dates.delete(range(50, 64))
+        self.df = pd.concat([
+            pd.DataFrame({'city': 'Москва', 'date': dates}),
+            pd.DataFrame({'city': 'Тула', 'date': dates_tula}),
+        ], ignore_index=True)
+        
+        n = len(self.df)
+        for col, scale in [('pm25', 15), ('pm10', 25), ('no2', 30), ('so2', 6), ('o3', 45)]:
+            self.df[col] = rng.gamma(4, scale / 4, size=n)
+        self.df.loc[::17, 'pm25'] = np.nan
+        self.df.loc[::3, 'so2'] = np.nan
+        self.df.loc[5, 'pm10'] = 1500
+        self.df.loc[7, 'o3'] = -1
+        
+        # Дубликаты ключа (city, date) в разных частях
+        self.df = pd.concat([self.df, self.df.iloc[[0, 1, 1, 250]]], ignore_index=True)
+    
+    def _chunks(self, df, size):
+        return (df.iloc[i:i + size] for i in range(0, len(df), size))
+    
+    def test_matches_in_memory_validation(self):
+        """Ошибки, предупреждения и счётчики совпадают с validate_dataframe"""
+        expected = DataValidator().validate_dataframe(self.df)
+        streaming = StreamingValidator()
+        results = streaming.validate_chunks(self._chunks(self.df.sample(frac=1, random_state=1), 37))
+        
+        self.assertEqual(results['total_rows'], expected['total_rows'])
+        self.assertEqual(results['passed'], expected['passed'])
+        self.assertEqual(results['errors'], expected['errors'])
+        self.assertEqual(results['warnings'], expected['warnings'])
+        for key in ('missing_values', 'duplicates', 'temporal_gaps', 'temporal_gap_ranges'):
+            self.assertEqual(results['statistics'][key], expected['statistics'][key])
+        self.assertEqual(expected['statistics']['temporal_gaps'], {'Тула': 1})
+        
+        validator = DataValidator()
+        validator.validate_dataframe(self.df)
+        self.assertEqual(streaming.generate_report(), validator.generate_report())
+    
+    def test_outliers_from_sketch(self):
+        """Выбросы по квантильному скетчу близки к точному IQR"""
+        expected = DataValidator().validate_dataframe(self.df)['statistics']['outliers']
+        results = StreamingValidator().validate_chunks(self._chunks(self.df, 50))['statistics']['outliers']
+        
+        self.assertEqual(set(results), set(expected))
+        for col, info in expected.items():
+            self.assertAlmostEqual(results[col]['percentage'], info['percentage'], delta=0.5)
+            np.testing.assert_allclose(results[col]['bounds'], info['bounds'], rtol=0.05)
+    
+    def test_column_missing_in_chunk(self):
+        """Колонка, отсутствующая в части данных, считается там пропущенной"""
+        chunks = [self.df.iloc[:100], self.df.iloc[100:].drop(columns=['o3'])]
+        results = StreamingValidator().validate_chunks(chunks)
+        expected = DataValidator().validate_dataframe(pd.concat(chunks, ignore_index=True))
+        
+        self.assertEqual(results['statistics']['missing_values']['o3'], len(self.df) - 100)
+        self.assertEqual(results['errors'], expected['errors'])
+    
+    def test_hourly_gaps_exact(self):
+        """Промежутки в почасовых данных считаются точно, а не по дням"""
+        times = pd.to_datetime(['2023-01-01 00:00', '2023-01-08 01:00', '2023-01-08 02:00', '2023-01-20 00:00'])
+        df = pd.DataFrame({'city': 'Москва', 'date': times, 'pm25': 10.0})
+        
+        results = StreamingValidator().validate_chunks([df.iloc[:2], df.iloc[2:]])
+        
+        self.assertEqual(results['statistics']['temporal_gaps'], {'Москва': 2})
+        self.assertEqual([gap['days'] for gap in results['statistics']['temporal_gap_ranges']['Москва']],
+                         [7 + 1 / 24, 11 + 22 / 24])
+    
+    def test_empty_input(self):
+        """Пустой поток — ошибка, как и пустой датафрейм"""
+        results = StreamingValidator().validate_chunks([])
+        
+        self.assertFalse(results['passed'])
+        self.assertIn("Датафрейм пустой", results['errors'])
+
+
+class TestQuantileSketch(unittest.TestCase):
+    """Тесты квантильного скетча"""
+    
+    def test_relative_accuracy(self):
+        """Квантили в пределах заданной относительной точности"""
+        values = np.random.default_rng(1).lognormal(2, 1, size=50000)
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for part in np.array_split(values, 7):
+            sketch.add(part)
+        
+        for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+            exact = np.quantile(values, q, method='lower')
+            self.assertLessEqual(abs(sketch.quantile(q) - exact) / exact, 0.0101)
+        self.assertLess(len(sketch.positive), 1000)
+    
+    def test_negative_zero_and_merge(self):
+        """Отрицательные значения, нули и объединение скетчей"""
+        first, second = QuantileSketch(), QuantileSketch()
+        first.add([-5.0, 0.0, np.nan])
+        second.add([1.0, 2.0, 3.0])
+        first.merge(second)
+        
+        self.assertEqual(first.count, 5)
+        self.assertAlmostEqual(first.quantile(0), -5.0, delta=0.05)
+        self.assertEqual(first.quantile(0.25), 0.0)
+        self.assertAlmostEqual(first.quantile(1), 3.0, delta=0.03)
+        self.assertEqual(first.count_outside(0, 2.5), 2)
 
 
 if __name__ == '__main__':
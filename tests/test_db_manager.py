@@ -1,6 +1,8 @@
 """
 Unit-тесты для DBManager
 """
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 import pandas as pd
@@ -10,13 +12,13 @@ from pathlib import Path
 # Добавляем src в путь
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
 
-from air_src.db_manager import DBManager
+from air_src.db_manager import DBManager, frame_from_cursor, chunked_records, iter_frames
 
 
 class TestDBManager(unittest.TestCase):
     """Тесты для класса DBManager"""
     
-    @patch('db_manager.MongoClient')
+    @patch('air_src.db_manager.MongoClient')
     def setUp(self, mock_client):
         """Настройка перед каждым тестом"""
         self.mock_client = mock_client
@@ -65,6 +67,395 @@ class TestDBManager(unittest.TestCase):
         self.assertTrue(success, "save_clean_data должен работать корректно")
 
 
+class TestIncrementalRawData(unittest.TestCase):
+    """Тесты инкрементального сохранения сырых данных"""
+    
+    @patch('air_src.db_manager.MongoClient')
+    def setUp(self, mock_client):
+        self.db = DBManager()
+    
+    def test_upsert_raw_data_by_city_and_time(self):
+        """Upsert выполняется по ключу (city, time)"""
+        df = pd.DataFrame({
+            'time': pd.date_range('2023-01-01', periods=3, freq='H'),
+            'pm2_5': [10, 15, 12]
+        })
+        
+        self.db._schema_ready = True
+        self.db.upsert_raw_data("Москва", df)
+        
+        ops = self.db.raw_collection.bulk_write.call_args[0][0]
+        self.assertEqual(len(ops), 3)
+        self.assertEqual(ops[0]._filter, {"city": "Москва", "time": pd.Timestamp('2023-01-01')})
+        self.assertTrue(ops[0]._upsert)
+    
+    def test_upsert_clean_data_replaces_documents(self):
+        """Очищенные записи заменяются целиком: исчезнувшие поля не остаются"""
+        df = pd.DataFrame({
+            'city': ['Москва', 'Москва'],
+            'date': pd.date_range('2023-01-01', periods=2),
+            'pm25': [10.0, 12.0]
+        })
+        
+        self.db._schema_ready = True
+        self.db.set_meta = MagicMock()
+        self.db.upsert_clean_data(df)
+        
+        ops = self.db.clean_collection.bulk_write.call_args[0][0]
+        self.assertEqual(len(ops), 2)
+        self.assertEqual(ops[0]._filter, {"city": "Москва", "date": pd.Timestamp('2023-01-01')})
+        self.assertEqual(ops[0]._doc, {"city": "Москва", "date": pd.Timestamp('2023-01-01'), "pm25": 10.0})
+        self.assertTrue(ops[0]._upsert)
+    
+    def test_get_latest_times(self):
+        """Последнее время по городам из агрегации"""
+        self.db.raw_collection.aggregate = MagicMock(return_value=[
+            {"_id": "Москва", "max_time": pd.Timestamp('2025-11-30 23:00')}
+        ])
+        
+        self.assertEqual(self.db.get_latest_times(), {"Москва": pd.Timestamp('2025-11-30 23:00')})
+
+
+class TestFilteredLoaders(unittest.TestCase):
+    """Тесты загрузки с проекцией и фильтрами"""
+    
+    @patch('air_src.db_manager.MongoClient')
+    def setUp(self, mock_client):
+        self.db = DBManager()
+    
+    def test_projection_and_filters(self):
+        """Колонки, города и даты превращаются в проекцию и фильтр MongoDB"""
+        self.db.clean_collection.find = MagicMock(return_value=[
+            {"date": pd.Timestamp("2025-01-01"), "pm25": 10.0}
+        ])
+        
+        df = self.db.load_clean_data(columns=["date", "pm25"], cities=["Москва"],
+                                     start="2025-01-01", end="2025-01-31")
+        
+        query, projection = self.db.clean_collection.find.call_args[0]
+        self.assertEqual(query, {
+            "city": {"$in": ["Москва"]},
+            "date": {"$gte": pd.Timestamp("2025-01-01"), "$lte": pd.Timestamp("2025-01-31")}
+        })
+        self.assertEqual(projection, {"_id": 0, "date": 1, "pm25": 1})
+        self.assertEqual(list(df.columns), ["date", "pm25"])
+    
+    def test_no_filters_loads_everything(self):
+        """Без аргументов загружаются все документы без _id"""
+        self.db.raw_collection.find = MagicMock(return_value=[])
+        
+        self.db.load_raw_data()
+        
+        self.assertEqual(self.db.raw_collection.find.call_args[0], ({}, {"_id": 0}))
+
+
+class TestChunkedWrites(unittest.TestCase):
+    """Тесты пакетной записи"""
+    
+    @patch('air_src.db_manager.MongoClient')
+    def setUp(self, mock_client):
+        self.db = DBManager()
+        self.inserted = []
+        
+        def insert_many(records, ordered=True):
+            self.assertFalse(ordered)
+            self.inserted.append(records)
+            return MagicMock(inserted_ids=[None] * len(records))
+        
+        self.db.raw_collection.insert_many = insert_many
+        self.df = pd.DataFrame({
+            'time': [str(t) for t in pd.date_range('2023-01-01', periods=25, freq='H')],
+            'pm2_5': range(25)
+        })
+    
+    def test_chunked_records(self):
+        """Пачки нужного размера, даты приведены, константы добавлены"""
+        chunks = list(chunked_records(self.df, ["time"], {"city": "Москва"}, chunk_size=10))
+        
+        self.assertEqual([len(c) for c in chunks], [10, 10, 5])
+        self.assertEqual(chunks[0][0]["time"], pd.Timestamp('2023-01-01'))
+        self.assertEqual(chunks[2][-1]["city"], "Москва")
+        # Исходный датафрейм не меняется
+        self.assertEqual(self.df['time'].dtype, object)
+    
+    def test_save_raw_data_in_parallel_chunks(self):
+        """Параллельная запись пачками сохраняет все документы"""
+        self.db.write_workers = 3
+        self.db.write_chunk_size = 4
+        
+        stats = self.db.save_raw_data("Москва", self.df)
+        
+        self.assertEqual(len(self.inserted), 7)
+        self.assertEqual(stats["documents"], 25)
+        self.assertEqual(sum(len(c) for c in self.inserted), 25)
+        self.assertGreaterEqual(stats["docs_per_sec"], 0)
+
+
+class TestFrameFromCursor(unittest.TestCase):
+    """Тесты пакетной сборки датафрейма из курсора"""
+    
+    def setUp(self):
+        self.docs = [
+            {'time': pd.Timestamp('2023-01-01') + pd.Timedelta(hours=i),
+             'city': 'Москва' if i % 2 else 'Тула',
+             'pm2_5': float(i) if i % 3 else float('nan'),
+             'count': i}
+            for i in range(10)
+        ]
+        # Поле, отсутствующее в части пачек, и пустое поле в целой пачке
+        self.docs[7]['dust'] = 1.5
+        for doc in self.docs[:4]:
+            doc['uv_index'] = None
+        for doc in self.docs[4:]:
+            doc['uv_index'] = 2.0
+    
+    def test_same_frame_as_list_of_dicts(self):
+        """Результат совпадает с pd.DataFrame(list(cursor))"""
+        expected = pd.DataFrame(self.docs)
+        expected['uv_index'] = expected['uv_index'].astype(float)
+        
+        for batch_size in (1, 3, 4, 100):
+            df = frame_from_cursor(iter(self.docs), batch_size=batch_size)
+            pd.testing.assert_frame_equal(df[expected.columns], expected)
+    
+    def test_int_column_with_gaps_becomes_float(self):
+        """Целая колонка с пропусками в части пачек становится float, как в pandas"""
+        docs = [{'a': 1}, {'a': 2}, {'b': 1}]
+        
+        df = frame_from_cursor(iter(docs), batch_size=2)
+        
+        self.assertEqual(df['a'].dtype, float)
+        self.assertTrue(pd.isna(df['a'].iloc[2]))
+    
+    def test_empty_cursor(self):
+        """Пустой курсор даёт пустой датафрейм"""
+        self.assertTrue(frame_from_cursor(iter([])).empty)
+    
+    def test_iter_frames(self):
+        """Курсор читается пачками датафреймов заданного размера"""
+        frames = list(iter_frames(iter(self.docs), batch_size=4))
+        
+        self.assertEqual([len(frame) for frame in frames], [4, 4, 2])
+        self.assertEqual(list(pd.concat(frames)['count']), list(range(10)))
+
+
+class TestCleanPipeline(unittest.TestCase):
+    """Тесты дневной агрегации на стороне MongoDB"""
+    
+    @patch('air_src.db_manager.MongoClient')
+    def setUp(self, mock_client):
+        self.db = DBManager()
+        self.columns = {"pm2_5": "pm25", "ozone": "o3"}
+    
+    def test_pipeline_stages(self):
+        """Конвейер: фильтр городов, дневные бакеты, средние, выбросы"""
+        pipeline = DBManager._clean_pipeline(self.columns, ["Москва"], outlier_columns=["pm25", "no2"])
+        stages = [next(iter(stage)) for stage in pipeline]
+        
+        self.assertEqual(stages, ["$match", "$project", "$group", "$match", "$project"])
+        self.assertEqual(pipeline[0]["$match"], {"city": {"$in": ["Москва"]}})
+        self.assertEqual(pipeline[1]["$project"]["date"], {"$dateTrunc": {"date": "$time", "unit": "day"}})
+        self.assertEqual(pipeline[2]["$group"]["pm25"], {"$avg": "$pm25"})
+        # Фильтр выбросов только по присутствующим колонкам
+        self.assertEqual(pipeline[3]["$match"], {"pm25": {"$gte": 0, "$lt": 5000}})
+    
+    def test_pipeline_partitions(self):
+        """Инкрементальный конвейер берёт только затронутые дни"""
+        day = pd.Timestamp("2025-11-30").to_pydatetime()
+        pipeline = DBManager._clean_pipeline(self.columns, ["Москва", "Тула"],
+                                             partitions={"Москва": day, "Тула": None})
+        
+        self.assertEqual(pipeline[0]["$match"], {"$or": [
+            {"city": "Москва", "time": {"$gte": day}},
+            {"city": "Тула"},
+        ]})
+    
+    def test_merge_into_clean_collection(self):
+        """Результат записывается в clean_data через $merge по (city, date)"""
+        self.db.clean_collection.name = "clean_data"
+        self.db._schema_ready = True
+        
+        self.db.aggregate_clean_data(self.columns, ["Москва"])
+        
+        pipeline = self.db.raw_collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[-1]["$merge"]["into"], "clean_data")
+        self.assertEqual(pipeline[-1]["$merge"]["on"], ["city", "date"])
+        self.db.clean_collection.delete_many.assert_called_once_with({})
+
+    
+    def test_stats_increments(self):
+        """Месячные статистики обновляются upsert-ами с $inc, индекс (city, month) создаётся один раз"""
+        increments = {
+            ("Москва", pd.Timestamp("2024-01-01")): {"stats.pm25.pm10.n": 3.0},
+            ("Тула", pd.Timestamp("2024-01-01")): {},
+        }
+        
+        self.db.inc_stats("correlation_stats", increments)
+        self.db.inc_stats("correlation_stats", increments)
+        
+        collection = self.db.db["correlation_stats"]
+        collection.create_index.assert_called_once()
+        ops = collection.bulk_write.call_args[0][0]
+        self.assertEqual(len(ops), 1)
+        self.assertEqual(ops[0]._filter, {"city": "Москва", "month": pd.Timestamp("2024-01-01").to_pydatetime()})
+        self.assertEqual(ops[0]._doc, {"$inc": {"stats.pm25.pm10.n": 3.0}})
+        self.assertTrue(ops[0]._upsert)
+
+class TestSchemaBootstrap(unittest.TestCase):
+    """Тесты создания и проверки индексов"""
+    
+    @patch('air_src.db_manager.MongoClient')
+    def setUp(self, mock_client):
+        self.db = DBManager()
+        self.db.db.list_collection_names.return_value = []
+        self.db.raw_collection = MagicMock()
+        self.db.raw_collection.name = "raw_data"
+        self.db.clean_collection = MagicMock()
+        self.db.clean_collection.name = "clean_data"
+        self.indexes = {self.db.raw_collection: {}, self.db.clean_collection: {}}
+        
+        for collection in self.indexes:
+            collection.create_indexes.side_effect = self._creator(collection)
+            collection.index_information.side_effect = lambda c=collection: self.indexes[c]
+    
+    def _creator(self, collection):
+        def create_indexes(models):
+            for model in models:
+                doc = model.document
+                self.indexes[collection][doc["name"]] = {
+                    "key": list(doc["key"].items()), "unique": doc.get("unique", False)
+                }
+        return create_indexes
+    
+    def test_bootstrap_creates_compound_indexes(self):
+        """Создаются уникальные составные индексы (city, time) и (city, date)"""
+        self.db.bootstrap()
+        
+        raw = self.indexes[self.db.raw_collection]
+        clean = self.indexes[self.db.clean_collection]
+        self.assertEqual(raw["city_time"], {"key": [("city", 1), ("time", 1)], "unique": True})
+        self.assertEqual(clean["city_date"], {"key": [("city", 1), ("date", 1)], "unique": True})
+        self.assertEqual(self.db.verify_indexes(), [])
+    
+    def test_verify_reports_missing(self):
+        """Проверка сообщает об отсутствующих индексах"""
+        self.assertIn("raw_data.city_time", self.db.verify_indexes())
+        self.assertIn("clean_data.city_date", self.db.verify_indexes())
+    
+    def test_timeseries_raw_collection(self):
+        """При RAW_TIMESERIES raw_data создаётся как time-series с metaField city"""
+        self.db.raw_timeseries = True
+        
+        self.db.bootstrap()
+        
+        args, kwargs = self.db.db.create_collection.call_args
+        self.assertEqual(args[0], "raw_data")
+        self.assertEqual(kwargs["timeseries"]["metaField"], "city")
+        self.assertFalse(self.indexes[self.db.raw_collection]["city_time"]["unique"])
+    
+    def test_existing_regular_collection_rejected(self):
+        """Обычную raw_data нельзя молча использовать как time-series"""
+        self.db.raw_timeseries = True
+        self.db.db.list_collection_names.return_value = ["raw_data"]
+        self.db.db.list_collections.return_value = [{"name": "raw_data", "type": "collection"}]
+        
+        with self.assertRaises(RuntimeError):
+            self.db.bootstrap()
+
+
+class TestCleanSnapshot(unittest.TestCase):
+    """Тесты локального снимка clean_data"""
+    
+    @patch('air_src.db_manager.MongoClient')
+    def setUp(self, mock_client):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DBManager()
+        self.db.snapshot_dir = Path(self.tmp.name)
+        self.db.get_clean_version = MagicMock(return_value="v1")
+        self.docs = [
+            {'city': city, 'date': date, 'pm25': float(i), 'o3': 1.0}
+            for i, (city, date) in enumerate(
+                (c, d) for c in ['Москва', 'Тула'] for d in pd.date_range('2023-01-01', periods=5)
+            )
+        ]
+        self.db.clean_collection.find = MagicMock(side_effect=lambda *a, **kw: iter(self.docs))
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_second_load_served_from_snapshot(self):
+        """Повторная загрузка той же версии не обращается к MongoDB"""
+        first = self.db.load_clean_data()
+        second = self.db.load_clean_data()
+        
+        self.assertEqual(self.db.clean_collection.find.call_count, 1)
+        pd.testing.assert_frame_equal(first, second)
+    
+    def test_snapshot_filters_match_mongo(self):
+        """Фильтры и колонки из снимка дают тот же результат, что и запрос"""
+        self.db.load_clean_data()
+        
+        df = self.db.load_clean_data(columns=["pm25"], cities=["Тула"], start="2023-01-04")
+        
+        self.assertEqual(list(df.columns), ["pm25"])
+        self.assertEqual(df["pm25"].tolist(), [8.0, 9.0])
+    
+    def test_new_version_invalidates_snapshot(self):
+        """После смены версии данные снова читаются из MongoDB"""
+        self.db.load_clean_data()
+        self.db.get_clean_version.return_value = "v2"
+        
+        self.db.load_clean_data()
+        
+        self.assertEqual(self.db.clean_collection.find.call_count, 2)
+        self.assertEqual(len(list(Path(self.tmp.name).glob("*.feather"))), 1)
+    
+    def test_corrupt_snapshot_falls_back_to_mongo(self):
+        """Повреждённый снимок не ломает загрузку и перезаписывается из MongoDB"""
+        first = self.db.load_clean_data()
+        snapshot = next(Path(self.tmp.name).glob("*.feather"))
+        snapshot.write_bytes(b"not a feather file")
+        
+        second = self.db.load_clean_data()
+        third = self.db.load_clean_data()
+        
+        pd.testing.assert_frame_equal(first, second)
+        pd.testing.assert_frame_equal(first, third)
+        self.assertEqual(self.db.clean_collection.find.call_count, 2)
+    
+    def test_snapshot_temp_file_per_process(self):
+        """Временный файл снимка уникален для процесса и не остаётся после записи"""
+        with patch('clean_snapshot.os.replace', wraps=os.replace) as replace:
+            self.db.load_clean_data()
+        
+        tmp = Path(replace.call_args[0][0])
+        self.assertIn(str(os.getpid()), tmp.name)
+        self.assertFalse(tmp.exists())
+    
+    def test_stale_tmp_removed_on_write(self):
+        """Старые временные файлы прерванных записей удаляются, свежие — нет"""
+        directory = Path(self.tmp.name)
+        stale = directory / "clean_data_v0.feather.999.tmp"
+        fresh = directory / "clean_data_v0.feather.998.tmp"
+        for tmp in (stale, fresh):
+            tmp.write_bytes(b"")
+        os.utime(stale, (0, 0))
+        
+        self.db.load_clean_data()
+        
+        self.assertFalse(stale.exists())
+        self.assertTrue(fresh.exists())
+    
+    def test_writes_bump_version(self):
+        """Сохранение очищенных данных меняет версию"""
+        self.db.set_meta = MagicMock()
+        
+        self.db.save_clean_data(pd.DataFrame(self.docs))
+        
+        self.db.set_meta.assert_called_once()
+        self.assertEqual(self.db.set_meta.call_args[0][0], "clean_version")
+
+
 class TestDataValidation(unittest.TestCase):
     """Тесты валидации данных"""
     
@@ -0,0 +1,369 @@
+"""
+Тесты параллельной загрузки данных на локальном stub-сервере
+"""
+import json
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
+
+import fetch_data
+from rate_limiter import HostRateLimiter, TokenBucket
+from geocache import GeocodeCache
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Имитация API геокодинга и качества воздуха"""
+    delay = 0.2
+    geo_requests = 0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        time.sleep(self.delay)
+
+        if url.path == "/geo":
+            StubHandler.geo_requests += 1
+            if query["name"][0] == "Атлантида":
+                body = {}
+            else:
+                body = {"results": [{"latitude": 55.75, "longitude": 37.62}]}
+        else:
+            body = {"hourly": {
+                "time": ["2024-01-01T00:00", "2024-01-01T01:00"],
+                "pm2_5": [10.0, 12.0],
+            }}
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServerTestCase(unittest.TestCase):
+    """Базовый класс: fetch_data направлен на stub HTTP-сервер"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        StubHandler.geo_requests = 0
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = GeocodeCache(Path(self.tmp.name) / "geocode.json", pinned={})
+
+        self.patches = [
+            patch.object(fetch_data, "GEOCODING_URL", f"{base}/geo"),
+            patch.object(fetch_data, "AIR_QUALITY_URL", f"{base}/air"),
+            patch.object(fetch_data, "limiter", HostRateLimiter({}, 1000)),
+            patch.object(fetch_data, "geocache", self.cache),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+
+class TestConcurrentFetch(StubServerTestCase):
+    """Тесты fetch_cities против stub HTTP-сервера"""
+
+    def test_all_cities_fetched_with_latency(self):
+        """Все города загружаются, для каждого есть время загрузки"""
+        cities = ["Москва", "Тула", "Уфа"]
+        results = {r["city"]: r for r in fetch_data.fetch_cities(cities, workers=3)}
+
+        self.assertEqual(set(results), set(cities))
+        for res in results.values():
+            self.assertIsNone(res["error"])
+            self.assertEqual(len(res["df"]), 2)
+            self.assertGreater(res["latency"], 0)
+
+    def test_parallel_faster_than_serial(self):
+        """Параллельная загрузка быстрее последовательной"""
+        cities = [f"Город {i}" for i in range(6)]
+
+        started = time.perf_counter()
+        list(fetch_data.fetch_cities(cities, workers=6))
+        elapsed = time.perf_counter() - started
+
+        # Последовательно: 6 городов * 2 запроса * 0.2 с = 2.4 с
+        self.assertLess(elapsed, 1.5)
+
+    def test_unknown_city_isolated(self):
+        """Ошибка одного города не мешает остальным"""
+        results = {r["city"]: r for r in fetch_data.fetch_cities(["Атлантида", "Тула"], workers=2)}
+
+        self.assertIsNotNone(results["Атлантида"]["error"])
+        self.assertIsNone(results["Тула"]["error"])
+
+
+class TestGeocodeCache(StubServerTestCase):
+    """Тесты кэша координат"""
+
+    def test_second_lookup_served_from_cache(self):
+        """Повторный геокодинг не обращается к API"""
+        first = fetch_data.geocode_city("Москва")
+        second = fetch_data.geocode_city("Москва")
+
+        self.assertEqual(first, second)
+        self.assertEqual(StubHandler.geo_requests, 1)
+
+    def test_cache_persists_on_disk(self):
+        """Кэш переживает перезапуск"""
+        fetch_data.geocode_city("Москва")
+        reloaded = GeocodeCache(self.cache.path, pinned={})
+
+        self.assertEqual(reloaded.get("Москва", "ru"), (55.75, 37.62))
+        self.assertIsNone(reloaded.get("Москва", "en"))
+
+    def test_pinned_coordinates_win(self):
+        """Закреплённые координаты используются без запроса к API"""
+        self.cache.pinned = {"Тула": (54.2, 37.6)}
+
+        self.assertEqual(fetch_data.geocode_city("Тула"), (54.2, 37.6))
+        self.assertEqual(StubHandler.geo_requests, 0)
+
+    def test_invalidate(self):
+        """Инвалидация удаляет запись и вызывает повторный запрос"""
+        fetch_data.geocode_city("Москва")
+        fetch_data.geocode_city("Тула")
+
+        self.assertEqual(self.cache.invalidate("Москва"), 1)
+        fetch_data.geocode_city("Москва")
+
+        self.assertEqual(StubHandler.geo_requests, 3)
+        self.assertIsNotNone(self.cache.get("Тула", "ru"))
+
+
+class TestIncrementalWindows(unittest.TestCase):
+    """Тесты расчёта периодов дозагрузки"""
+
+    def test_windows_start_from_latest_day(self):
+        """Дозагрузка начинается с дня последнего сохранённого часа"""
+        latest = {
+            "Москва": pd.Timestamp("2025-11-30 12:00"),
+            "Тула": pd.Timestamp("2025-11-30 23:00"),
+        }
+        windows = fetch_data.incremental_windows(latest, ["Москва", "Тула", "Уфа"], "2025-12-01")
+
+        self.assertEqual(windows["Москва"], ("2025-11-30", "2025-12-01"))
+        self.assertEqual(windows["Тула"], ("2025-11-30", "2025-12-01"))
+        self.assertEqual(windows["Уфа"], (fetch_data.START_DATE, "2025-12-01"))
+
+    def test_current_day_refetched(self):
+        """Часы текущего дня до 23:00 (прогноз) не мешают загрузить его снова"""
+        today = date.today().isoformat()
+        latest = {"Москва": pd.Timestamp(f"{today} 23:00")}
+
+        self.assertEqual(fetch_data.incremental_windows(latest, ["Москва"], today), {"Москва": (today, today)})
+
+    def test_city_past_end_date_skipped(self):
+        """Город, у которого уже есть часы после end_date, не загружается"""
+        latest = {"Москва": pd.Timestamp("2025-12-02 05:00")}
+
+        self.assertEqual(fetch_data.incremental_windows(latest, ["Москва"], "2025-12-01"), {})
+
+
+class TestIncrementalClean(unittest.TestCase):
+    """Тесты инкрементального пересчёта дневных агрегатов"""
+
+    def setUp(self):
+        self.db = MagicMock()
+        self.db.get_valid_cities.return_value = ["Москва", "Тула", "Уфа"]
+        self.db.clean_collection.distinct.return_value = ["Москва", "Тула"]
+        self.db.get_touched_cities.return_value = {
+            "Москва": pd.Timestamp("2025-11-30 05:00"),
+            "Казань": pd.Timestamp("2025-11-30 05:00"),
+        }
+        self.db.has_values.side_effect = lambda field: field == "pm2_5"
+
+    def test_partitions(self):
+        """Пересчитываются только затронутые и впервые валидные города"""
+        partitions = fetch_data.clean_partitions(self.db, since=pd.Timestamp("2025-11-30"))
+
+        self.assertEqual(partitions, {"Москва": pd.Timestamp("2025-11-30"), "Уфа": None})
+
+    def test_only_touched_days_upserted(self):
+        """В clean_data записываются только пересчитанные дни"""
+        hours = pd.date_range("2025-11-30", periods=48, freq="H")
+        self.db.load_raw_data.side_effect = lambda cities, start: pd.DataFrame({
+            "city": cities[0],
+            "time": hours,
+            "pm2_5": [-1.0] * 24 + [10.0] * 24,
+        })
+
+        fetch_data.process_clean_increment(self.db, since=pd.Timestamp("2025-11-30"))
+
+        loads = [c.kwargs for c in self.db.load_raw_data.call_args_list]
+        self.assertIn({"cities": ["Москва"], "start": pd.Timestamp("2025-11-30")}, loads)
+        self.assertIn({"cities": ["Уфа"], "start": None}, loads)
+
+        upserted = self.db.upsert_clean_data.call_args[0][0]
+        self.assertEqual(len(upserted), 2)
+        self.assertTrue((upserted["pm25"] == 10).all())
+
+        # День с отрицательным средним отсеян и удаляется из clean_data
+        removed = self.db.delete_clean_data.call_args[0][0]
+        self.assertEqual(len(removed), 2)
+        self.assertTrue((removed["date"] == pd.Timestamp("2025-11-30")).all())
+
+    def test_columns_from_whole_collection(self):
+        """Колонка, пустая только в пересчитываемых днях, остаётся в записях"""
+        hours = pd.date_range("2025-11-30", periods=24, freq="H")
+        self.db.load_raw_data.side_effect = lambda cities, start: pd.DataFrame({
+            "city": cities[0],
+            "time": hours,
+            "pm2_5": 10.0,
+            "ozone": float("nan"),
+            "dust": float("nan"),
+        })
+        self.db.has_values.side_effect = lambda field: field in ("pm2_5", "ozone")
+
+        fetch_data.process_clean_increment(self.db, since=pd.Timestamp("2025-11-30"))
+
+        upserted = self.db.upsert_clean_data.call_args[0][0]
+        self.assertIn("o3", upserted.columns)
+        self.assertTrue(upserted["o3"].isna().all())
+        self.assertNotIn("dust", upserted.columns)
+
+
+def mongo_clean(raw, columns, cities, outlier_columns=(), merge=True):
+    """Заглушка aggregate_clean_data(merge=False): дневные средние по переданным полям, как $group/$avg"""
+    df = raw[raw["city"].isin(cities)].rename(columns=columns)
+    df["date"] = pd.to_datetime(df["time"]).dt.normalize()
+    agg = df.groupby(["city", "date"])[list(columns.values())].mean().reset_index()
+    for col in outlier_columns:
+        if col in agg.columns:
+            agg = agg[(agg[col] >= 0) & (agg[col] < 5000)]
+    return agg
+
+
+class TestCleanParity(unittest.TestCase):
+    """Тесты сверки движков очистки (pandas / mongo)"""
+
+    def setUp(self):
+        hours = pd.date_range("2025-11-01", periods=72, freq="H")
+        self.raw = pd.concat([
+            pd.DataFrame({"city": "Москва", "time": hours, "pm2_5": 10.0 + np.arange(72) % 5,
+                          "ozone": 40.0, "dust": np.nan}),
+            pd.DataFrame({"city": "Тула", "time": hours[:10], "pm2_5": 5.0, "ozone": 30.0, "dust": np.nan}),
+        ], ignore_index=True)
+        # День с отрицательным PM2.5 (выброс) и день без измерений озона
+        self.raw.loc[self.raw["time"].dt.day == 2, "pm2_5"] = -3.0
+        self.raw.loc[(self.raw["city"] == "Москва") & (self.raw["time"].dt.day == 3), "ozone"] = np.nan
+
+        self.db = MagicMock()
+        self.db.load_raw_data.return_value = self.raw
+        self.db.get_valid_cities.return_value = ["Москва"]
+        self.db.has_values.side_effect = lambda field: field in self.raw and self.raw[field].notna().any()
+        self.db.aggregate_clean_data.side_effect = lambda *args, **kwargs: mongo_clean(self.raw, *args, **kwargs)
+
+    def _check(self):
+        with patch.object(fetch_data, "MIN_VALID_HOURS", 30), patch("sys.stdout"):
+            return fetch_data.check_clean_parity(self.db)
+
+    def test_engines_match(self):
+        """Совпадающие результаты проходят сверку: пустые колонки и выбросы отброшены в обоих"""
+        self.assertTrue(self._check())
+
+        args, kwargs = self.db.aggregate_clean_data.call_args
+        self.assertNotIn("dust", args[0])
+        self.assertEqual(kwargs["outlier_columns"], fetch_data.OUTLIER_COLUMNS)
+        self.assertFalse(kwargs["merge"])
+        self.assertEqual(len(mongo_clean(self.raw, *args, **kwargs)), 1)
+
+    def test_mismatch_detected(self):
+        """Расхождение значений или набора строк проваливает сверку"""
+        def shifted(*args, **kwargs):
+            agg = mongo_clean(self.raw, *args, **kwargs)
+            return agg.assign(pm25=agg["pm25"] + 0.5)
+
+        self.db.aggregate_clean_data.side_effect = shifted
+        self.assertFalse(self._check())
+
+        self.db.aggregate_clean_data.side_effect = lambda columns, cities, **kwargs: mongo_clean(
+            self.raw, columns, cities, merge=False)
+        self.assertFalse(self._check())
+
+
+class TestFullLoad(unittest.TestCase):
+    """Тесты полной загрузки (main в режиме full)"""
+
+    def _run(self, clear):
+        db = MagicMock()
+        db.get_date_range.return_value = (None, None)
+        db.save_raw_data.return_value = db.upsert_raw_data.return_value = {"docs_per_sec": 0.0}
+        result = {"city": "Москва", "lat": 55.7, "lon": 37.6, "latency": 0.1, "error": None,
+                  "df": pd.DataFrame({"time": pd.date_range("2025-11-30", periods=2, freq="H")})}
+
+        with patch.object(fetch_data, "DBManager", return_value=db), \
+                patch.object(fetch_data, "FETCH_MODE", "full"), \
+                patch.object(fetch_data, "fetch_cities", return_value=[result]), \
+                patch.object(fetch_data, "process_and_clean_data"):
+            fetch_data.main(clear=clear)
+        return db
+
+    def test_indexes_created_after_clear(self):
+        """Индексы создаются после очистки, в пустую коллекцию данные вставляются"""
+        db = self._run(clear=True)
+
+        calls = [name for name, *_ in db.mock_calls if name in ("clear_collection", "bootstrap")]
+        self.assertEqual(calls, ["clear_collection", "clear_collection", "bootstrap"])
+        db.save_raw_data.assert_called_once()
+        db.upsert_raw_data.assert_not_called()
+
+    def test_reload_without_clear_upserts(self):
+        """Без очистки уже сохранённые часы заменяются, а не вставляются повторно"""
+        db = self._run(clear=False)
+
+        db.clear_collection.assert_not_called()
+        db.bootstrap.assert_called_once()
+        db.upsert_raw_data.assert_called_once()
+        db.save_raw_data.assert_not_called()
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Тесты ограничителя частоты"""
+
+    def test_rate_is_respected(self):
+        """После исчерпания запаса запросы идут не чаще rate в секунду"""
+        bucket = TokenBucket(rate=20, capacity=1)
+
+        started = time.perf_counter()
+        for _ in range(5):
+            bucket.acquire()
+        elapsed = time.perf_counter() - started
+
+        self.assertGreaterEqual(elapsed, 4 / 20 * 0.9)
+
+    def test_separate_buckets_per_host(self):
+        """У каждого хоста свой bucket"""
+        limiter = HostRateLimiter({"a.example": 1}, 5)
+
+        self.assertIsNot(limiter.bucket("http://a.example/x"), limiter.bucket("http://b.example/x"))
+        self.assertEqual(limiter.bucket("http://a.example/y").rate, 1)
+        self.assertEqual(limiter.bucket("http://b.example/y").rate, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
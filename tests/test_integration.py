@@ -16,7 +16,7 @@ from air_src.data_validator import DataValidator
 class TestDataPipeline(unittest.TestCase):
     """Тесты полного цикла обработки данных"""
     
-    @patch('db_manager.MongoClient')
+    @patch('air_src.db_manager.MongoClient')
     def setUp(self, mock_client):
         """Настройка"""
         self.db = DBManager()
@@ -0,0 +1,199 @@
+"""
+Тесты конвейера с пропуском неизменившихся этапов
+"""
+import tempfile
+import textwrap
+import unittest
+from types import SimpleNamespace
+import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
+
+import pipeline
+
+
+STAGE_SOURCE = '''
+COLUMNS = ["city", "pm25"]
+
+def run(df):
+    print("строк:", len(df))
+'''
+
+HELPER_STAGE_SOURCE = '''
+from stage_helper import describe
+
+COLUMNS = ["pm25"]
+
+def run(df):
+    print(describe(df))
+'''
+
+STATS_STAGE_SOURCE = '''
+COLUMNS = ["city", "date", "pm25"]
+STATS_COLUMNS = ["pm25"]
+
+def run(df, total=None):
+    if total is None or list(df.columns) != ["pm25"]:
+        raise ValueError("этап без статистик")
+'''
+
+CHARTS_STAGE_SOURCE = '''
+import charts
+
+COLUMNS = ["pm25"]
+
+def run(df):
+    if charts.worker_limit != 1:
+        raise ValueError("вложенный пул графиков")
+'''
+
+FAILING_SOURCE = '''
+COLUMNS = ["pm25"]
+
+def run(df):
+    raise ValueError("сбой")
+'''
+
+
+class TestPipeline(unittest.TestCase):
+    """Тесты run_pipeline на модулях-заглушках"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        (root / "stage_ok.py").write_text(textwrap.dedent(STAGE_SOURCE), encoding="utf-8")
+        (root / "stage_fail.py").write_text(textwrap.dedent(FAILING_SOURCE), encoding="utf-8")
+        (root / "stage_charts.py").write_text(textwrap.dedent(CHARTS_STAGE_SOURCE), encoding="utf-8")
+        (root / "stage_stats.py").write_text(textwrap.dedent(STATS_STAGE_SOURCE), encoding="utf-8")
+        (root / "stage_helper_user.py").write_text(textwrap.dedent(HELPER_STAGE_SOURCE), encoding="utf-8")
+        self.helper = root / "stage_helper.py"
+        self.helper.write_text("def describe(df):\n    return len(df)\n", encoding="utf-8")
+        sys.path.insert(0, self.tmp.name)
+        
+        self.state = root / "state.json"
+        self.df = pd.DataFrame({
+            'city': ['Москва', 'Тула'],
+            'date': pd.date_range('2023-01-01', periods=2),
+            'pm25': [10.0, 20.0]
+        })
+        self.fetches = 0
+    
+    def tearDown(self):
+        sys.path.remove(self.tmp.name)
+        for module in ("stage_ok", "stage_fail", "stage_helper_user", "stage_helper", "stage_stats", "stage_charts"):
+            sys.modules.pop(module, None)
+        self.tmp.cleanup()
+    
+    def _fetch(self):
+        self.fetches += 1
+    
+    def _run(self, stages, **kwargs):
+        dag = pipeline.build_dag([
+            (name, SimpleNamespace(__name__=module, COLUMNS=columns))
+            for name, module, columns in stages
+        ])
+        return pipeline.run_pipeline(dag, self._fetch, lambda columns: self.df, workers=2,
+                                     state_path=self.state, **kwargs)
+    
+    def test_unchanged_stage_skipped(self):
+        """Повторный запуск без изменений данных пропускает этап"""
+        stages = [("a", "stage_ok", ["city", "pm25"])]
+        
+        first = self._run(stages)
+        second = self._run(stages)
+        self.df.loc[0, 'pm25'] = 11.0
+        third = self._run(stages)
+        
+        self.assertEqual(first["a"][0], "ok")
+        self.assertEqual(second["a"][0], "пропущен")
+        self.assertEqual(third["a"][0], "ok")
+        self.assertEqual(self.fetches, 3)
+    
+    def test_unused_column_change_ignored(self):
+        """Изменение колонки, не нужной этапу, не вызывает пересчёт"""
+        stages = [("a", "stage_ok", ["city", "pm25"])]
+        
+        self._run(stages)
+        self.df['date'] = pd.date_range('2024-01-01', periods=2)
+        
+        self.assertEqual(self._run(stages)["a"][0], "пропущен")
+        self.assertEqual(self._run(stages, force=True)["a"][0], "ok")
+    
+    def test_helper_change_reruns_stage(self):
+        """Изменение импортируемого локального модуля вызывает пересчёт этапа"""
+        stages = [("a", "stage_helper_user", ["pm25"])]
+        
+        self._run(stages)
+        self.assertEqual(self._run(stages)["a"][0], "пропущен")
+        self.helper.write_text("def describe(df):\n    return df.shape\n", encoding="utf-8")
+        
+        self.assertEqual(self._run(stages)["a"][0], "ok")
+    
+    def test_stats_replace_daily_columns(self):
+        """Этап с готовыми статистиками получает их и только колонки STATS_COLUMNS"""
+        dag = pipeline.build_dag([("a", SimpleNamespace(__name__="stage_stats", COLUMNS=["city", "date", "pm25"],
+                                                        STATS_COLUMNS=["pm25"]))])
+        loaded = []
+        total = pd.DataFrame({"pm25": [30.0]})
+        
+        def run():
+            return pipeline.run_pipeline(dag, self._fetch, lambda columns: loaded.append(columns) or self.df,
+                                         state_path=self.state, stats=lambda module: {"total": total})
+        
+        self.assertEqual(run()["a"][0], "ok")
+        self.assertEqual(loaded, [["pm25"]])
+        self.assertEqual(run()["a"][0], "пропущен")
+        total.loc[0, "pm25"] = 31.0
+        self.assertEqual(run()["a"][0], "ok")
+    
+    def test_stale_stats_load_daily_columns(self):
+        """Без статистик этап получает все свои колонки"""
+        dag = pipeline.build_dag([("a", SimpleNamespace(__name__="stage_stats", COLUMNS=["city", "date", "pm25"],
+                                                        STATS_COLUMNS=["pm25"]))])
+        loaded = []
+        
+        results = pipeline.run_pipeline(dag, self._fetch, lambda columns: loaded.append(columns) or self.df,
+                                        state_path=self.state, stats=lambda module: {})
+        
+        self.assertEqual(loaded, [["city", "date", "pm25"]])
+        self.assertEqual(results["a"][0], "ошибка")
+    
+    def test_stage_charts_serial(self):
+        """Этап в рабочем процессе конвейера строит графики без вложенного пула"""
+        stages = [("a", "stage_charts", ["pm25"])]
+        
+        self.assertEqual(self._run(stages)["a"][0], "ok")
+    
+    def test_failed_stage_isolated(self):
+        """Ошибка этапа не мешает остальным и не сохраняется в состоянии"""
+        stages = [("a", "stage_fail", ["pm25"]), ("b", "stage_ok", ["city", "pm25"])]
+        
+        results = self._run(stages)
+        
+        self.assertEqual(results["a"][0], "ошибка")
+        self.assertEqual(results["b"][0], "ok")
+        self.assertNotIn("a", pipeline.load_state(self.state))
+    
+    def test_failed_fetch_blocks_dependents(self):
+        """При ошибке загрузки этапы анализа не выполняются"""
+        def fetch():
+            raise RuntimeError("нет сети")
+        
+        dag = pipeline.build_dag([("a", SimpleNamespace(__name__="stage_ok", COLUMNS=["pm25"]))])
+        results = pipeline.run_pipeline(dag, fetch, lambda columns: self.df, state_path=self.state)
+        
+        self.assertEqual(results[pipeline.FETCH_STAGE][0], "ошибка")
+        self.assertEqual(results["a"][0], "не выполнен")
+    
+    def test_unknown_dependency(self):
+        """Ссылка на несуществующий этап — ошибка, а не зависание"""
+        dag = {"a": {"deps": ["missing"], "module": None}}
+        
+        with self.assertRaises(ValueError):
+            pipeline.run_pipeline(dag, self._fetch, lambda columns: self.df, state_path=self.state)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
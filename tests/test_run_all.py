@@ -0,0 +1,84 @@
+"""
+Тесты общего запуска аналитических этапов
+"""
+import unittest
+from types import SimpleNamespace
+import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
+
+import run_all
+
+
+class TestRunStages(unittest.TestCase):
+    """Тесты run_stages"""
+    
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'city': ['Москва', 'Тула'],
+            'date': pd.date_range('2023-01-01', periods=2),
+            'pm25': [10.0, 20.0],
+            'o3': [40.0, 45.0]
+        })
+        self.received = {}
+    
+    def _stage(self, name, columns, fail=False, **attrs):
+        def run(df, **stats):
+            self.received[name] = df
+            self.received[f"{name}_stats"] = stats
+            df['mutated'] = 1
+            if fail:
+                raise ValueError("сбой")
+        return name, SimpleNamespace(COLUMNS=columns, run=run, **attrs)
+    
+    def test_stages_share_one_frame(self):
+        """Каждый этап получает только свои колонки, изменения не видны другим"""
+        stages = [self._stage("a", ["city", "pm25"]), self._stage("b", ["date", "o3", "no2"])]
+        
+        timings = run_all.run_stages(self.df, stages)
+        
+        self.assertEqual(list(self.received["a"].columns[:2]), ["city", "pm25"])
+        self.assertEqual(list(self.received["b"].columns[:2]), ["date", "o3"])
+        self.assertNotIn('mutated', self.df.columns)
+        self.assertEqual({name: status for name, (_, status) in timings.items()}, {"a": "ok", "b": "ok"})
+    
+    def test_failed_stage_isolated(self):
+        """Ошибка этапа не останавливает следующие"""
+        stages = [self._stage("a", ["pm25"], fail=True), self._stage("b", ["pm25"])]
+        
+        timings = run_all.run_stages(self.df, stages)
+        
+        self.assertEqual(timings["a"][1], "ошибка")
+        self.assertEqual(timings["b"][1], "ok")
+        self.assertGreaterEqual(timings["b"][0], 0)
+    
+    def test_stage_columns_union(self):
+        """Колонки для загрузки — объединение колонок этапов без повторов"""
+        stages = [self._stage("a", ["city", "pm25"]), self._stage("b", ["pm25", "date"])]
+        
+        self.assertEqual(run_all.stage_columns(stages), ["city", "pm25", "date"])
+    
+    def test_stats_replace_daily_columns(self):
+        """Этап с актуальными статистиками получает их и только STATS_COLUMNS, без них — все колонки"""
+        rollup = pd.DataFrame({'city': ['Москва'], 'pm25_sum': [10.0]})
+        stages = [
+            self._stage("a", ["city", "date", "pm25"], STATS_COLUMNS=[],
+                        load_stats=lambda db: {"rollup": rollup}),
+            self._stage("b", ["date", "o3"], STATS_COLUMNS=["o3"], load_stats=lambda db: None),
+        ]
+        stats = {name: run_all.stage_stats(module, db=None) for name, module in stages}
+        
+        self.assertEqual(run_all.stage_columns(stages, stats), ["date", "o3"])
+        
+        run_all.run_stages(self.df, stages, stats)
+        
+        self.assertEqual(list(self.received["a"].columns), ['mutated'])
+        self.assertIs(self.received["a_stats"]["rollup"], rollup)
+        self.assertEqual(list(self.received["b"].columns[:2]), ["date", "o3"])
+        self.assertEqual(self.received["b_stats"], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
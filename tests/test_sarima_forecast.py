@@ -0,0 +1,381 @@
+"""
+Тесты пакетного прогноза SARIMA
+"""
+import os
+import signal
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "air_src"))
+
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+import sarima_forecast
+import backtest
+from model_registry import ModelRegistry
+
+
+def fake_task(city, param, series, steps, timeout, reselect, engine):
+    """Лёгкая замена forecast_task: прогноз последним значением, Тула падает"""
+    if city == "Тула":
+        raise ValueError("сбой модели")
+    return {
+        "city": city, "param": param, "error": None, "seconds": 0.0,
+        "forecast": pd.DataFrame({
+            "city": city, "param": param,
+            "date": pd.date_range(series.index.max() + pd.Timedelta(days=1), periods=steps),
+            "forecast": series.iloc[-1], "lower": 0.0, "upper": 1.0,
+            "engine": engine, "order": "(1, 0, 0)", "seasonal_order": "(0, 0, 0, 0)",
+        }),
+    }
+
+
+def crashing_task(city, param, series, steps, timeout, reselect, engine):
+    """Как fake_task, но рабочий процесс Уфы по pm25 аварийно завершается (как при OOM)"""
+    if city == "Уфа" and param == "pm25":
+        os.kill(os.getpid(), signal.SIGKILL)
+    return fake_task(city, param, series, steps, timeout, reselect, engine)
+
+
+def mean_engine(series):
+    """Простейший движок для тестов: константа"""
+    return SARIMAX(series, trend="c").fit(disp=False)
+
+
+def failing_engine(series):
+    if len(series) > 150:
+        raise ValueError("сбой фолда")
+    return mean_engine(series)
+
+
+def crashing_engine(series):
+    if len(series) > 150:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return mean_engine(series)
+
+
+class TestBatchForecast(unittest.TestCase):
+    """Тесты run_batch и forecast_task"""
+    
+    def setUp(self):
+        dates = pd.date_range('2024-01-01', periods=90)
+        self.df = pd.concat([
+            pd.DataFrame({
+                'city': city,
+                'date': dates,
+                'pm25': np.arange(90, dtype=float) + shift,
+                'no2': 20.0 + shift
+            })
+            for shift, city in enumerate(['Москва', 'Тула', 'Уфа'])
+        ], ignore_index=True)
+        self.df.loc[5, 'pm25'] = np.nan
+    
+    def test_series_per_city(self):
+        """Ряд строится по одному городу с интерполяцией пропусков"""
+        series = sarima_forecast.series_from_frame(self.df, 'pm25', city='Москва')
+        
+        self.assertEqual(len(series), 90)
+        self.assertEqual(series.iloc[5], 5.0)
+        self.assertEqual(series.index.freqstr, 'D')
+    
+    def test_consolidated_table_with_isolated_failures(self):
+        """Одна таблица по всем парам, ошибка одной модели не мешает остальным"""
+        table, errors = sarima_forecast.run_batch(
+            self.df, cities=['Москва', 'Тула', 'Уфа', 'Казань'], pollutants=['pm25', 'no2', 'o3'],
+            workers=2, steps=7, task=fake_task
+        )
+        
+        pairs = set(map(tuple, table[['city', 'param']].drop_duplicates().values))
+        self.assertEqual(pairs, {('Москва', 'pm25'), ('Москва', 'no2'), ('Уфа', 'pm25'), ('Уфа', 'no2')})
+        self.assertEqual(len(table), 4 * 7)
+        self.assertEqual(sorted(errors), [('Тула', 'no2', 'сбой модели'), ('Тула', 'pm25', 'сбой модели')])
+    
+    def test_crashed_worker_isolated(self):
+        """Аварийное завершение рабочего процесса не проваливает остальные задачи пула"""
+        table, errors = sarima_forecast.run_batch(
+            self.df, cities=['Москва', 'Тула', 'Уфа'], pollutants=['pm25', 'no2'],
+            workers=2, steps=7, task=crashing_task
+        )
+        
+        pairs = set(map(tuple, table[['city', 'param']].drop_duplicates().values))
+        self.assertEqual(pairs, {('Москва', 'pm25'), ('Москва', 'no2'), ('Уфа', 'no2')})
+        self.assertEqual(sorted(errors), [
+            ('Тула', 'no2', 'сбой модели'), ('Тула', 'pm25', 'сбой модели'),
+            ('Уфа', 'pm25', 'рабочий процесс аварийно завершился'),
+        ])
+    
+    def test_task_timeout(self):
+        """Зависший подбор прерывается по таймауту"""
+        series = sarima_forecast.series_from_frame(self.df, 'pm25', city='Уфа')
+        
+        with patch.object(sarima_forecast, 'fit_auto_arima', side_effect=lambda s: time.sleep(5)), \
+                patch.object(sarima_forecast, 'ModelRegistry', lambda: ModelRegistry(tempfile.gettempdir())):
+            started = time.perf_counter()
+            res = sarima_forecast.forecast_task('Уфа', 'pm25', series, steps=7, timeout=1)
+        
+        self.assertLess(time.perf_counter() - started, 3)
+        self.assertIn('превышено время', res['error'])
+        self.assertIsNone(res['forecast'])
+    
+    def test_short_series_rejected(self):
+        """Слишком короткий ряд — ошибка задачи, а не исключение"""
+        res = sarima_forecast.forecast_task('Уфа', 'pm25', pd.Series([1.0, 2.0]), timeout=0)
+        
+        self.assertEqual(res['error'], 'недостаточно данных')
+    
+    def test_engine_reported_separately(self):
+        """Движок прогноза — отдельная колонка, seasonal_order — порядок самой модели"""
+        series = sarima_forecast.series_from_frame(self.df, 'no2', city='Уфа')
+        
+        with patch.dict(sarima_forecast.ENGINES, {'mean': mean_engine}):
+            res = sarima_forecast.forecast_task('Уфа', 'no2', series, steps=7, timeout=0, engine='mean')
+        
+        self.assertIsNone(res['error'])
+        self.assertEqual(set(res['forecast']['engine']), {'mean'})
+        self.assertEqual(set(res['forecast']['order']), {'(1, 0, 0)'})
+        self.assertEqual(set(res['forecast']['seasonal_order']), {'(0, 0, 0, 0)'})
+
+
+
+class TestModelRegistry(unittest.TestCase):
+    """Тесты переиспользования порядков и параметров через реестр"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry(self.tmp.name)
+        rng = np.random.default_rng(0)
+        self.series = pd.Series(
+            10 + rng.normal(size=120).cumsum() * 0.1,
+            index=pd.date_range('2024-01-01', periods=120, freq='D')
+        )
+        self.search = patch.object(
+            sarima_forecast, 'fit_auto_arima',
+            return_value=SimpleNamespace(order=(1, 0, 0), seasonal_order=(0, 0, 0, 0))
+        )
+        self.auto = self.search.start()
+    
+    def tearDown(self):
+        self.search.stop()
+        self.tmp.cleanup()
+    
+    def _fit(self, series=None, **kwargs):
+        with patch('sys.stdout'):
+            return sarima_forecast.fit_model(self.series if series is None else series, 'pm25_all',
+                                             self.registry, **kwargs)
+    
+    def test_order_stored_and_reused(self):
+        """Порядок подбирается один раз, при новых данных — тёплый старт"""
+        self._fit()
+        entry = self.registry.get('pm25_all')
+        self.assertEqual(entry['order'], [1, 0, 0])
+        self.assertEqual(len(entry['params']), len(entry['param_names']))
+        
+        extended = pd.concat([self.series, pd.Series(
+            [self.series.iloc[-1]] * 5, index=pd.date_range('2024-04-30', periods=5, freq='D')
+        )])
+        with patch.object(sarima_forecast, 'fit_sarimax', wraps=sarima_forecast.fit_sarimax) as fit:
+            self._fit(extended)
+        
+        self.assertEqual(self.auto.call_count, 1)
+        self.assertEqual(fit.call_args.kwargs['start_params'], entry['params'])
+    
+    def test_unchanged_data_not_refitted(self):
+        """Для тех же данных оптимизатор не запускается"""
+        first, _, _ = self._fit()
+        with patch.object(sarima_forecast, 'fit_sarimax') as fit:
+            second, order, _ = self._fit()
+        
+        fit.assert_not_called()
+        self.assertEqual(order, (1, 0, 0))
+        np.testing.assert_allclose(second.params, first.params)
+    
+    def test_reselect_on_schedule(self):
+        """Устаревший порядок подбирается заново"""
+        self._fit()
+        entry = self.registry.get('pm25_all')
+        entry['selected_at'] = (date.today() - timedelta(days=365)).isoformat()
+        self.registry.put('pm25_all', entry)
+        
+        self._fit()
+        
+        self.assertEqual(self.auto.call_count, 2)
+        self.assertEqual(self.registry.get('pm25_all')['selected_at'], date.today().isoformat())
+    
+    def test_reselect_on_degradation(self):
+        """Рост ошибки подгонки вызывает повторный подбор порядка"""
+        self._fit()
+        entry = self.registry.get('pm25_all')
+        entry['mse'] /= 10
+        entry['fingerprint'] = 'другие данные'
+        self.registry.put('pm25_all', entry)
+        
+        self._fit()
+        
+        self.assertEqual(self.auto.call_count, 2)
+    
+    def test_forced_reselect(self):
+        """reselect игнорирует реестр"""
+        self._fit()
+        self._fit(reselect=True)
+        
+        self.assertEqual(self.auto.call_count, 2)
+
+    
+    def test_update_appends_new_days(self):
+        """Режим update дополняет сохранённую модель без переоценки параметров"""
+        res, _, _ = self._fit(self.series[:100])
+        self.registry.save_results('pm25_all', res)
+        
+        with patch.object(sarima_forecast, 'fit_sarimax') as fit, patch('sys.stdout'):
+            updated = sarima_forecast.update_model(self.series, 'pm25_all', self.registry)
+        
+        fit.assert_not_called()
+        self.assertEqual(updated.nobs, 120)
+        np.testing.assert_allclose(updated.params, res.params)
+        self.assertEqual(updated.get_forecast(3).predicted_mean.index[0], pd.Timestamp('2024-04-30'))
+        
+        # Обновлённая модель сохранена и отпечаток соответствует полному ряду
+        self.assertEqual(self.registry.load_results('pm25_all').nobs, 120)
+        with patch.object(sarima_forecast, 'fit_sarimax') as fit:
+            self._fit()
+        fit.assert_not_called()
+    
+    def test_update_requires_unchanged_history(self):
+        """Исправленная история или отсутствие модели — полное обучение"""
+        with patch('sys.stdout'):
+            self.assertIsNone(sarima_forecast.update_model(self.series, 'pm25_all', self.registry))
+        
+        res, _, _ = self._fit(self.series[:100])
+        self.registry.save_results('pm25_all', res)
+        revised = self.series.copy()
+        revised.iloc[10] += 1
+        
+        with patch('sys.stdout'):
+            self.assertIsNone(sarima_forecast.update_model(revised, 'pm25_all', self.registry))
+
+
+
+class TestFourierEngine(unittest.TestCase):
+    """Тесты движка ARIMA с гармониками Фурье и сравнения движков"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        t = np.arange(400)
+        self.series = pd.Series(
+            15 + 3 * np.sin(2 * np.pi * t / 365.25) + np.sin(2 * np.pi * t / 30) + rng.normal(size=400) * 0.3,
+            index=pd.date_range('2024-01-01', periods=400, freq='D')
+        )
+    
+    def test_terms_continue_phase(self):
+        """Гармоники будущих дат продолжают гармоники истории"""
+        full = sarima_forecast.fourier_terms(pd.date_range('2024-01-01', periods=60), {30: 2})
+        tail = sarima_forecast.fourier_terms(pd.date_range('2024-01-31', periods=30), {30: 2})
+        
+        self.assertEqual(list(full.columns), ['sin_30_1', 'cos_30_1', 'sin_30_2', 'cos_30_2'])
+        np.testing.assert_allclose(full.iloc[30:].values, tail.values, atol=1e-9)
+    
+    def test_forecast_without_exog(self):
+        """Прогноз строится без явной передачи регрессоров и ловит сезонность"""
+        with patch('sys.stdout'):
+            res = sarima_forecast.fit_fourier(self.series.iloc[:-30])
+        forecast = res.get_forecast(30)
+        
+        self.assertEqual(forecast.predicted_mean.index[0], self.series.index[-30])
+        errors = backtest.forecast_errors(forecast, self.series.iloc[-30:])
+        self.assertLess(errors['mae'], 1.0)
+        self.assertGreater(errors['coverage'], 0.8)
+        self.assertTrue(hasattr(res, 'plot_diagnostics'))
+    
+    def test_compare_engines(self):
+        """Сравнение движков: метрики и время обучения для каждого"""
+        engines = {'fourier': sarima_forecast.fit_fourier, 'naive': sarima_forecast.fit_fourier}
+        with patch.dict(sarima_forecast.ENGINES, engines), patch('sys.stdout'):
+            report = backtest.compare_engines(self.series, engines=['fourier', 'naive'], horizon=30)
+        
+        self.assertEqual(list(report['engine']), ['fourier', 'naive'])
+        self.assertEqual(list(report.columns), ['engine', 'mae', 'rmse', 'coverage', 'fit_seconds'])
+        self.assertTrue((report['fit_seconds'] > 0).all())
+        
+        with self.assertRaises(ValueError):
+            backtest.compare_engines(self.series, horizon=400)
+
+
+
+class TestRollingBacktest(unittest.TestCase):
+    """Тесты скользящей кросс-валидации"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.series = pd.Series(10 + rng.normal(size=200), index=pd.date_range('2024-01-01', periods=200, freq='D'))
+        self.engines = patch.dict(sarima_forecast.ENGINES, {'mean': mean_engine, 'failing': failing_engine,
+                                                                 'crashing': crashing_engine})
+        self.engines.start()
+    
+    def tearDown(self):
+        self.engines.stop()
+    
+    def test_origins(self):
+        """Каждая точка отсечения оставляет полный горизонт для проверки"""
+        self.assertEqual(backtest.rolling_origins(200, horizon=30, step=40, initial=100), [100, 140])
+        self.assertEqual(backtest.rolling_origins(200, horizon=30, step=10, initial=170), [170])
+        self.assertEqual(backtest.rolling_origins(100, horizon=30, step=10, initial=90), [])
+    
+    def test_folds_metrics_and_timing(self):
+        """Метрики и время обучения по каждому фолду, ошибки фолдов изолированы"""
+        with patch('sys.stdout'):
+            folds = backtest.rolling_backtest(self.series, ['mean', 'failing'], horizon=20, step=30,
+                                              initial=100, workers=2)
+        
+        self.assertEqual(len(folds), 6)
+        mean = folds[folds['engine'] == 'mean']
+        self.assertEqual(list(mean['train_days']), [100, 130, 160])
+        self.assertEqual(mean['origin'].iloc[0], pd.Timestamp('2024-04-09'))
+        self.assertTrue(mean['error'].isna().all())
+        self.assertTrue((mean['fit_seconds'] > 0).all())
+        self.assertTrue(((mean['coverage'] >= 0) & (mean['coverage'] <= 1)).all())
+        
+        summary = backtest.summarize_folds(folds).set_index('engine')
+        self.assertEqual(summary.loc['mean', 'folds'], 3)
+        self.assertEqual(summary.loc['failing', 'failed'], 1)
+        self.assertEqual(summary.loc['failing', 'folds'], 2)
+        self.assertAlmostEqual(summary.loc['mean', 'mae'], mean['mae'].mean())
+    
+    def test_crashed_fold_isolated(self):
+        """Аварийное завершение рабочего процесса на одном фолде не прерывает бэктест"""
+        with patch('sys.stdout'):
+            folds = backtest.rolling_backtest(self.series, ['mean', 'crashing'], horizon=20, step=30,
+                                              initial=100, workers=2)
+        
+        self.assertEqual(len(folds), 6)
+        failed = folds[folds['error'].notna()]
+        self.assertEqual(list(failed['engine']), ['crashing'])
+        self.assertEqual(list(failed['train_days']), [160])
+        self.assertEqual(failed['error'].iloc[0], 'рабочий процесс аварийно завершился')
+    
+    def test_summary_when_all_folds_fail(self):
+        """Движок без единого удачного фолда остаётся в сводке с NaN и числом ошибок"""
+        with patch('sys.stdout'):
+            folds = backtest.rolling_backtest(self.series, ['failing'], horizon=20, step=10,
+                                              initial=160, workers=1)
+        
+        summary = backtest.summarize_folds(folds)
+        
+        self.assertEqual(list(summary['engine']), ['failing'])
+        self.assertEqual((summary['folds'].iloc[0], summary['failed'].iloc[0]), (0, 3))
+        self.assertTrue(summary[['mae', 'rmse', 'coverage']].isna().all(axis=None))
+    
+    def test_too_short_series(self):
+        """Ряд короче начальной выборки — ошибка"""
+        with self.assertRaises(ValueError):
+            backtest.rolling_backtest(self.series, ['mean'], horizon=30, initial=190)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file